@@ -2,7 +2,11 @@
 # Compatible con Termux en Android
 
 import time
+import atexit
+import json
 import os
+import select
+import shlex
 import subprocess
 import tempfile
 import logging
@@ -19,6 +23,27 @@ MODO_STREAMING = 0
 MODO_OFFLINE = 1
 modo = MODO_STREAMING
 
+# Intervalo de sondeo del portapapeles: empieza en el mínimo tras cada
+# cambio y crece exponencialmente mientras no pasa nada, hasta el máximo
+POLL_MIN = float(os.getenv("ALTERCLIP_POLL_MIN", "0.2"))
+POLL_MAX = float(os.getenv("ALTERCLIP_POLL_MAX", "2.0"))
+POLL_BACKOFF = 1.5
+# Con poca batería y sin cargar se sondea aún menos
+POLL_MAX_LOW_BATTERY = float(os.getenv("ALTERCLIP_POLL_MAX_LOW_BATTERY", "5.0"))
+LOW_BATTERY_PERCENT = 30
+BATTERY_CHECK_INTERVAL = 300
+# Cada cuánto se registran las estadísticas de sondeo
+STATS_INTERVAL = 3600
+# Tiempo máximo de espera para un comando de Termux:API
+HELPER_TIMEOUT = 10
+
+# Diario local de URLs capturadas, para fusionarlo luego en el escritorio
+# con `alterclip-cli journal merge`. Se escribe por lotes para no gastar la
+# memoria flash ni añadir latencia al bucle del portapapeles.
+JOURNAL_FILE = Path(user_log_dir("alterclip")) / "journal.jsonl"
+JOURNAL_BATCH = 20
+JOURNAL_FLUSH_SECONDS = 300
+
 # Lista de dominios para streaming
 streaming_sources = [
     "instagram.com", "youtube.com", "youtu.be",
@@ -79,12 +104,156 @@ def reproducir_streaming(url):
         logging.info("mpv no está instalado o no se encuentra en el PATH.")
 
 
-# Clipboard usando termux-api
+# Estadísticas de sondeo para ver el coste real del demonio
+class EstadisticasSondeo:
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.sondeos = 0
+        # Cada comando de Termux:API es un proceso nuevo, aunque lo lance el
+        # shell persistente; los arranques del propio shell se cuentan aparte
+        self.lanzamientos = 0
+        self.shells = 0
+        self.escrituras = 0
+
+    def registrar_si_toca(self):
+        """Escribe en el log los sondeos y procesos lanzados por hora y reinicia"""
+        transcurrido = time.monotonic() - self.inicio
+        if transcurrido < STATS_INTERVAL:
+            return
+        horas = transcurrido / 3600
+        logging.info(
+            "Sondeos/hora: %.0f, procesos lanzados/hora: %.1f (shells: %.1f), escrituras/hora: %.1f",
+            self.sondeos / horas, (self.lanzamientos + self.shells) / horas,
+            self.shells / horas, self.escrituras / horas
+        )
+        self.__init__()
+
+estadisticas = EstadisticasSondeo()
+
+# Diario de URLs de streaming capturadas
+class Diario:
+    """Guarda en memoria las URLs capturadas y las escribe por lotes
+
+    Cada línea del fichero es un JSON mínimo {"t": segundos, "u": url}. No se
+    consulta ningún título en el móvil: eso lo hace el escritorio al
+    fusionar el diario.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pendientes = []
+        self.primera = None
+        self.lock = threading.Lock()
+
+    def anotar(self, url):
+        with self.lock:
+            if not self.pendientes:
+                self.primera = time.monotonic()
+            self.pendientes.append({"t": int(time.time()), "u": url})
+
+    def volcar_si_toca(self):
+        """Escribe el lote si está lleno o lleva demasiado tiempo esperando"""
+        if self.pendientes and (len(self.pendientes) >= JOURNAL_BATCH
+                                or time.monotonic() - self.primera >= JOURNAL_FLUSH_SECONDS):
+            self.volcar()
+
+    def volcar(self):
+        with self.lock:
+            if not self.pendientes:
+                return
+            lineas = "".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n"
+                             for e in self.pendientes)
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lineas)
+            except OSError as e:
+                logging.error(f"Error al escribir el diario: {e}")
+                return
+            self.pendientes = []
+
+diario = Diario(JOURNAL_FILE)
+
+# Clipboard usando termux-api a través de un shell persistente
+class AyudanteTermux:
+    """Proceso sh que se mantiene vivo y ejecuta los comandos de Termux:API
+
+    Se escribe el comando en la entrada del shell y se lee la salida hasta
+    una marca de fin. Si el shell muere o no responde, se vuelve a lanzar.
+
+    Termux:API no tiene ningún servicio que se quede residente: cada
+    termux-clipboard-get, termux-clipboard-set o termux-battery-status es
+    un proceso nuevo que lanza el shell. Lo único que se ahorra es arrancar
+    sh desde Python (fork + exec del intérprete) en cada sondeo, así que las
+    estadísticas cuentan cada comando como un proceso lanzado.
+    """
+
+    MARCA = b"__ALTERCLIP_FIN__"
+
+    def __init__(self):
+        self.proceso = None
+        self.lock = threading.Lock()
+
+    def _lanzar(self):
+        self.cerrar()
+        self.proceso = subprocess.Popen(
+            ['sh'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        estadisticas.shells += 1
+
+    def cerrar(self):
+        if self.proceso is not None:
+            self.proceso.kill()
+            self.proceso.wait()
+            self.proceso = None
+
+    def ejecutar(self, comando):
+        """Ejecuta un comando de shell y devuelve su salida como texto"""
+        with self.lock:
+            if self.proceso is None or self.proceso.poll() is not None:
+                self._lanzar()
+            estadisticas.lanzamientos += 1
+            try:
+                self.proceso.stdin.write(
+                    f"{comando}; printf '\\n%s\\n' {self.MARCA.decode()}\n".encode()
+                )
+                self.proceso.stdin.flush()
+                return self._leer_hasta_marca().decode()
+            except (OSError, TimeoutError):
+                self.cerrar()
+                raise
+
+    def _leer_hasta_marca(self):
+        fin = b"\n" + self.MARCA + b"\n"
+        fd = self.proceso.stdout.fileno()
+        salida = b""
+        limite = time.monotonic() + HELPER_TIMEOUT
+        while not salida.endswith(fin):
+            restante = limite - time.monotonic()
+            if restante <= 0 or not select.select([fd], [], [], restante)[0]:
+                raise TimeoutError("Termux:API no responde")
+            datos = os.read(fd, 65536)
+            if not datos:
+                raise OSError("El shell de Termux:API ha terminado")
+            salida += datos
+        return salida[:-len(fin)]
+
+ayudante = AyudanteTermux()
+
 def get_clipboard():
-    return subprocess.check_output(['termux-clipboard-get']).decode().strip()
+    return ayudante.ejecutar('termux-clipboard-get').strip()
 
 def set_clipboard(text):
-    subprocess.run(['termux-clipboard-set'], input=text.encode())
+    ayudante.ejecutar(f"printf '%s' {shlex.quote(text)} | termux-clipboard-set")
+    estadisticas.escrituras += 1
+
+def bateria_baja():
+    """True si el móvil no está cargando y le queda poca batería"""
+    try:
+        estado = json.loads(ayudante.ejecutar('termux-battery-status'))
+    except (OSError, TimeoutError, ValueError):
+        return False
+    return (estado.get("plugged") == "UNPLUGGED"
+            and estado.get("percentage", 100) < LOW_BATTERY_PERCENT)
 
 # Es multilínea?
 def es_multilinea(cadena):
@@ -102,8 +271,9 @@ def interceptar_cambiar_url(cadena):
     if es_multilinea(cadena) or not es_url(cadena):
         return resultado
 
-    if modo == MODO_STREAMING:
-        if any(source in cadena for source in streaming_sources):
+    if any(source in cadena for source in streaming_sources):
+        diario.anotar(cadena)
+        if modo == MODO_STREAMING:
             reproducir_streaming(cadena)
             return cadena
 
@@ -150,25 +320,43 @@ if __name__ == "__main__":
 
     signal.signal(signal.SIGUSR1, handler_streaming)
     signal.signal(signal.SIGUSR2, handler_offline)
+    # Al terminar se escribe lo que quede pendiente en el diario
+    atexit.register(diario.volcar)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     logging.info("Alterclip iniciado en Termux. PID: %d", os.getpid())
     logging.info("Envia USR1 o USR2 o usa UDP para cambiar de modo.")
 
-    hilo_udp = threading.Thread(target=handler_udp_server)
+    hilo_udp = threading.Thread(target=handler_udp_server, daemon=True)
     hilo_udp.start()
 
     prev = ""
+    intervalo = POLL_MIN
+    maximo = POLL_MAX
+    siguiente_bateria = 0
     while True:
         try:
+            # Con poca batería se permite esperar más entre sondeos
+            if time.monotonic() >= siguiente_bateria:
+                maximo = POLL_MAX_LOW_BATTERY if bateria_baja() else POLL_MAX
+                siguiente_bateria = time.monotonic() + BATTERY_CHECK_INTERVAL
+
             text = get_clipboard()
+            estadisticas.sondeos += 1
             if text != prev:
                 modified = interceptar_cambiar_url(text)
-                set_clipboard(modified)
+                # Solo se escribe si de verdad ha cambiado algo
+                if modified != text:
+                    set_clipboard(modified)
                 prev = modified
-            time.sleep(0.2)
+                intervalo = POLL_MIN
+            else:
+                intervalo = min(intervalo * POLL_BACKOFF, maximo)
+            estadisticas.registrar_si_toca()
+            diario.volcar_si_toca()
+            time.sleep(intervalo)
         except Exception as e:
             logging.error(f"Error en bucle principal: {e}")
             time.sleep(1)
 
     hilo_udp.join()
-
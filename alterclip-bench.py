@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+#
+# Banco de pruebas de rendimiento de alterclip con datos sintéticos.
+#
+# Genera una base de datos realista (historial, etiquetas con jerarquía y
+# asociaciones) del tamaño que se indique y mide con ella las consultas del
+# CLI, las rutas de la interfaz web, los cargadores de la GUI y el
+# interceptor del portapapeles del demonio. Los resultados se guardan en
+# JSON para poder comparar dos commits:
+#
+#   python3 alterclip-bench.py --urls 1000000 --output antes.json
+#   git checkout otra-rama
+#   python3 alterclip-bench.py --urls 1000000 --output despues.json --compare antes.json
+#
+# La base de datos generada se guarda en el directorio temporal y se
+# reutiliza mientras no cambien los parámetros (o hasta usar --regenerate).
+# Nunca se toca el historial real: todo se ejecuta con ALTERCLIP_DB
+# apuntando a la base de datos sintética.
+#
+import argparse
+import importlib.util
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT))
+from alterclip_urls import canonical_key
+
+RESULTS_VERSION = 1
+GROUPS = ('cli', 'web', 'gui', 'daemon')
+
+# Filas por cada executemany al generar la base de datos
+INSERT_BATCH = 10000
+
+# Días que abarca el historial generado
+HISTORY_DAYS = 3 * 365
+
+WORDS = [
+    'música', 'directo', 'tutorial', 'programación', 'python', 'linux', 'documental',
+    'historia', 'ciencia', 'física', 'cocina', 'receta', 'viaje', 'japón', 'españa',
+    'entrevista', 'podcast', 'análisis', 'reseña', 'juego', 'partida', 'concierto',
+    'guitarra', 'piano', 'jazz', 'rock', 'clásica', 'película', 'tráiler', 'serie',
+    'capítulo', 'noticias', 'economía', 'política', 'filosofía', 'matemáticas',
+    'astronomía', 'espacio', 'naturaleza', 'animales', 'montaña', 'bicicleta',
+    'electrónica', 'arduino', 'raspberry', 'impresión', 'diseño', 'arte', 'dibujo',
+    'fotografía', 'cine', 'humor', 'deporte', 'fútbol', 'ajedrez', 'idiomas',
+]
+
+# Plataforma, peso relativo y forma de la URL de cada entrada generada
+PLATFORMS = [
+    ('YouTube', 70, lambda r, i: f"https://www.youtube.com/watch?v={_video_id(r)}"),
+    ('Instagram', 10, lambda r, i: f"https://www.instagram.com/reel/C{_video_id(r)[:10]}/"),
+    ('Facebook', 8, lambda r, i: f"https://www.facebook.com/watch?v={r.randrange(10**14, 10**15)}"),
+    ('Archive.org', 5, lambda r, i: f"https://archive.org/details/item-{i}"),
+    ('Odysee', 7, lambda r, i: f"https://odysee.com/@canal{r.randrange(500)}:0/video-{i}:{r.randrange(16)}"),
+]
+
+ID_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+
+
+def _video_id(r: random.Random) -> str:
+    return ''.join(r.choice(ID_CHARS) for _ in range(11))
+
+
+def _title(r: random.Random) -> str:
+    return ' '.join(r.choice(WORDS) for _ in range(r.randint(3, 9))).capitalize()
+
+
+def default_db_path(args) -> Path:
+    """Ruta de la base de datos sintética para unos parámetros dados"""
+    name = (f"alterclip-bench-{args.urls}u-{args.tags}t-{args.depth}d-"
+            f"{args.fanout}f-{args.tags_per_url}a-{args.seed}s.db")
+    return Path(tempfile.gettempdir()) / name
+
+
+def generate_db(db_path: Path, urls: int, tags: int, depth: int, fanout: int,
+                tags_per_url: int, seed: int) -> None:
+    """Genera una base de datos sintética con el esquema de alterclip
+
+    Las etiquetas forman árboles de hasta `depth` niveles en los que cada
+    nodo tiene como mucho `fanout` hijos. Un 20 % de las URLs queda sin
+    etiquetar y el resto recibe entre 1 y `tags_per_url` etiquetas.
+    """
+    from alterclip import Alterclip
+
+    for suffix in ('', '-wal', '-shm'):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    os.environ['ALTERCLIP_DB'] = str(db_path)
+    # El esquema lo crea el propio demonio, para que no se desincronice
+    Alterclip()
+
+    r = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("ALTER TABLE streaming_history ADD COLUMN visto INTEGER DEFAULT 0")
+
+    with conn:
+        # Árboles de etiquetas rellenados por niveles
+        names = [f"{WORDS[i % len(WORDS)]}-{i}" for i in range(tags)]
+        conn.executemany("INSERT INTO tags (id, name, description) VALUES (?, ?, NULL)",
+                         [(i + 1, name) for i, name in enumerate(names)])
+        open_nodes = deque()
+        child_count = {}
+        edges = []
+        for tag_id in range(1, tags + 1):
+            while open_nodes and child_count[open_nodes[0][0]] >= fanout:
+                open_nodes.popleft()
+            level = 0
+            if open_nodes:
+                parent_id, parent_level = open_nodes[0]
+                child_count[parent_id] += 1
+                edges.append((parent_id, tag_id))
+                level = parent_level + 1
+            child_count[tag_id] = 0
+            if level < depth - 1:
+                open_nodes.append((tag_id, level))
+        conn.executemany("INSERT INTO tag_hierarchy (parent_id, child_id) VALUES (?, ?)", edges)
+
+    weights = [weight for _, weight, _ in PLATFORMS]
+    start = datetime.now() - timedelta(days=HISTORY_DAYS)
+    step = HISTORY_DAYS * 86400 / max(urls, 1)
+    for first in range(0, urls, INSERT_BATCH):
+        rows = []
+        url_tags = []
+        for i in range(first, min(first + INSERT_BATCH, urls)):
+            name, _, make_url = r.choices(PLATFORMS, weights)[0]
+            url = make_url(r, i)
+            timestamp = (start + timedelta(seconds=i * step + r.random() * step)).strftime('%Y-%m-%d %H:%M:%S')
+            visto = r.choices((0, 1, 2, 3), (50, 35, 10, 5))[0]
+            rows.append((i + 1, url, _title(r), name, timestamp, visto, canonical_key(url)))
+            if tags and r.random() >= 0.2:
+                for tag_id in r.sample(range(1, tags + 1), min(r.randint(1, tags_per_url), tags)):
+                    url_tags.append((i + 1, tag_id))
+        with conn:
+            conn.executemany("INSERT INTO streaming_history (id, url, title, platform, timestamp, visto, canonical_key) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT OR IGNORE INTO url_tags (url_id, tag_id) VALUES (?, ?)", url_tags)
+        print(f"\rGenerando historial: {min(first + INSERT_BATCH, urls)}/{urls}", end='', file=sys.stderr)
+    print(file=sys.stderr)
+
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def load_script(name: str, path: Path):
+    """Importa un script con guiones en el nombre (alterclip-cli.py...)"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Flask localiza las plantillas a partir del módulo registrado
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(group: str, name: str, func, repeat: int) -> dict:
+    """Ejecuta `func` una vez en frío y `repeat` veces más, y resume los tiempos"""
+    start = time.perf_counter()
+    func()
+    cold = time.perf_counter() - start
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        'group': group,
+        'name': name,
+        'runs': repeat,
+        'cold_ms': cold * 1000,
+        'min_ms': times[0] * 1000,
+        'median_ms': statistics.median(times) * 1000,
+        'p95_ms': times[max(int(len(times) * 0.95) - 1, 0)] * 1000,
+        'max_ms': times[-1] * 1000,
+    }
+
+
+def sample_values(db_path: Path) -> dict:
+    """Valores reales de la base de datos con los que construir las consultas"""
+    conn = sqlite3.connect(db_path)
+    root_tag = conn.execute("""
+        SELECT name FROM tags WHERE id NOT IN (SELECT child_id FROM tag_hierarchy)
+        ORDER BY id LIMIT 1
+    """).fetchone()
+    leaf_tag = conn.execute("""
+        SELECT name FROM tags WHERE id NOT IN (SELECT parent_id FROM tag_hierarchy)
+        ORDER BY id DESC LIMIT 1
+    """).fetchone()
+    total = conn.execute("SELECT COUNT(*) FROM streaming_history").fetchone()[0]
+    middle = conn.execute("SELECT timestamp, id FROM streaming_history ORDER BY timestamp DESC, id DESC "
+                          "LIMIT 1 OFFSET ?", (total // 2,)).fetchone()
+    youtube = conn.execute("SELECT url FROM streaming_history WHERE platform = 'YouTube' "
+                           "ORDER BY id DESC LIMIT 1").fetchone()
+    ids = [row[0] for row in conn.execute("SELECT id FROM streaming_history ORDER BY id DESC LIMIT 500")]
+    conn.close()
+    return {
+        'root_tag': root_tag[0] if root_tag else None,
+        'leaf_tag': leaf_tag[0] if leaf_tag else None,
+        'middle_cursor': tuple(middle) if middle else None,
+        'youtube_url': youtube[0] if youtube else None,
+        'recent_ids': ids,
+        'since': (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'),
+    }
+
+
+def bench_cli(samples: dict, repeat: int) -> list:
+    """get_streaming_history con cada combinación de filtros y show_tag_hierarchy"""
+    cli = load_script('alterclip_cli', ROOT / 'alterclip-cli.py')
+    cli.conn = cli.create_connection()
+
+    filters = {
+        'search': {'search': 'musica'},
+        'tags': {'tags': [samples['root_tag']]},
+        'no_tags': {'no_tags': True},
+        'platform': {'platform': 'YouTube'},
+        'since': {'since': samples['since']},
+        'visto': {'visto': 0},
+    }
+    results = []
+    for n in range(len(filters) + 1):
+        for combo in itertools.combinations(filters, n):
+            if 'tags' in combo and 'no_tags' in combo:
+                continue
+            kwargs = {}
+            for key in combo:
+                kwargs.update(filters[key])
+            label = '+'.join(combo) or 'sin filtros'
+
+            def history(kwargs=kwargs):
+                error, _ = cli.get_streaming_history(**kwargs)
+                if error and error.startswith('Error'):
+                    raise RuntimeError(error)
+            results.append(measure('cli', f"get_streaming_history[{label}]", history, repeat))
+
+    def hierarchy():
+        with redirect_stdout(io.StringIO()):
+            cli.show_tag_hierarchy()
+    results.append(measure('cli', 'show_tag_hierarchy', hierarchy, repeat))
+    cli.conn.close()
+    return results
+
+
+def bench_web(samples: dict, repeat: int) -> list:
+    """Rutas GET de la interfaz web a través del cliente de pruebas de Flask
+
+    Antes de cada petición se vacían la caché de respuestas y la de facetas
+    y se invalida el índice de etiquetas, de modo que se mide el trabajo de
+    la vista y no lo que ya estaba en memoria.
+    """
+    web = load_script('alterclip_web', ROOT / 'web' / 'app.py')
+    client = web.app.test_client()
+    paths = [
+        '/',
+        f"/tag/{samples['leaf_tag']}",
+        '/api/history',
+        '/api/history?search=musica',
+        f"/api/history?tag={samples['root_tag']}",
+        '/api/history?platform=YouTube',
+        '/api/tags',
+        '/api/tags/suggest?q=mus',
+        '/api/facets',
+        f"/api/facets?tag={samples['root_tag']}",
+        '/api/tag_hierarchy',
+    ]
+
+    results = []
+    for path in paths:
+        def get():
+            web._response_cache.clear()
+            with web.facet_service.lock:
+                web.facet_service.cache.clear()
+            web.tag_index.invalidate()
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path}: HTTP {response.status_code}")
+        results.append(measure('web', f"GET {path}", get, repeat))
+    return results
+
+
+def bench_gui(samples: dict, repeat: int) -> list:
+    """Consultas que la GUI ejecuta en su hilo de base de datos"""
+    gui_module = load_script('alterclip_gui', ROOT / 'alterclip-gui.py')
+    # Los cargadores solo usan la conexión que reciben, así que no hace
+    # falta crear la ventana
+    gui = gui_module.AlterclipGUI.__new__(gui_module.AlterclipGUI)
+    conn = sqlite3.connect(os.environ['ALTERCLIP_DB'])
+    conn.create_function("remove_accents", 1, gui_module.remove_accents)
+
+    cases = [
+        ('count_urls', lambda: gui.count_urls(conn)),
+        ('fetch_urls_page[primera]', lambda: gui.fetch_urls_page(conn, None)),
+        ('fetch_urls_page[mitad]', lambda: gui.fetch_urls_page(conn, samples['middle_cursor'])),
+        ('search_urls[1 término]', lambda: gui.search_urls(conn, ['musica'])),
+        ('search_urls[2 términos]', lambda: gui.search_urls(conn, ['musica', 'directo'])),
+        ('get_tag_hierarchy', lambda: gui.get_tag_hierarchy(conn)),
+        ('get_urls_tags[500]', lambda: gui.get_urls_tags(conn, samples['recent_ids'])),
+    ]
+    results = [measure('gui', name, func, repeat) for name, func in cases]
+    conn.close()
+    return results
+
+
+def bench_daemon(samples: dict, repeat: int) -> list:
+    """Alterclip.interceptar_cambiar_url con los tipos de texto más comunes
+
+    Las URLs de streaming que se usan ya están en el historial, así que no
+    se consulta ningún título por la red.
+    """
+    from alterclip import Alterclip, MODO_OFFLINE
+    app = Alterclip()
+    app.modo = MODO_OFFLINE
+
+    video_id = canonical_key(samples['youtube_url']).split(':', 1)[1]
+    cases = [
+        ('texto', 'Esto no es una URL'),
+        ('texto multilínea', 'https://example.com\nsegunda línea'),
+        ('reemplazo x.com', 'https://x.com/usuario/status/1234567890'),
+        ('url sin cambios', 'https://example.com/articulo?utm_source=rss'),
+        ('streaming conocido', samples['youtube_url']),
+        ('streaming variante', f"https://youtu.be/{video_id}?si=seguimiento"),
+        ('bloque de texto', ("Mira https://x.com/usuario/status/1234567890 y "
+                             f"[esto]({samples['youtube_url']}).\n") * 200),
+    ]
+    return [measure('daemon', f"interceptar_cambiar_url[{name}]",
+                    lambda text=text: app.interceptar_cambiar_url(text), repeat)
+            for name, text in cases]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: dict, current: dict, threshold: float, min_ms: float) -> int:
+    """Muestra la mediana de cada prueba en los dos ficheros
+
+    Una prueba cuenta como regresión si su mediana crece más que `threshold`
+    veces y al menos `min_ms` milisegundos (por debajo de eso es ruido).
+
+    Returns:
+        int: Número de pruebas más lentas que el umbral
+    """
+    before = {(r['group'], r['name']): r for r in previous['results']}
+    print(f"\nComparación con {previous.get('commit') or 'resultados anteriores'}:")
+    print(f"{'Prueba':<68} {'Antes ms':>10} {'Ahora ms':>10} {'Ratio':>7}")
+    print('─' * 98)
+    regressions = 0
+    for result in current['results']:
+        old = before.get((result['group'], result['name']))
+        if old is None:
+            continue
+        ratio = result['median_ms'] / old['median_ms'] if old['median_ms'] else float('inf')
+        mark = ''
+        if ratio > threshold and result['median_ms'] - old['median_ms'] >= min_ms:
+            mark = ' ⚠'
+            regressions += 1
+        print(f"{result['group'] + ' ' + result['name']:<68.68} {old['median_ms']:>10.2f} "
+              f"{result['median_ms']:>10.2f} {ratio:>7.2f}{mark}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Banco de pruebas de rendimiento de alterclip con datos sintéticos')
+    parser.add_argument('--urls', type=int, default=100000, help='Entradas del historial')
+    parser.add_argument('--tags', type=int, default=200, help='Número de etiquetas')
+    parser.add_argument('--depth', type=int, default=4, help='Niveles de la jerarquía de etiquetas')
+    parser.add_argument('--fanout', type=int, default=5, help='Máximo de hijos por etiqueta')
+    parser.add_argument('--tags-per-url', type=int, default=3, help='Máximo de etiquetas por URL')
+    parser.add_argument('--seed', type=int, default=42, help='Semilla del generador')
+    parser.add_argument('--db', type=Path, help='Base de datos sintética (por defecto, en el directorio temporal)')
+    parser.add_argument('--regenerate', action='store_true', help='Genera la base de datos aunque ya exista')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeticiones de cada prueba tras la ejecución en frío')
+    parser.add_argument('--only', default=','.join(GROUPS),
+                        help=f"Grupos a medir, separados por comas ({', '.join(GROUPS)})")
+    parser.add_argument('--output', type=Path, help='Fichero JSON donde guardar los resultados')
+    parser.add_argument('--compare', type=Path, help='Resultados JSON anteriores con los que comparar')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Ratio de la mediana a partir del cual se considera una regresión')
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help='Diferencia mínima de la mediana, en ms, para considerar una regresión')
+    args = parser.parse_args()
+
+    groups = [group.strip() for group in args.only.split(',') if group.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"grupos desconocidos: {', '.join(sorted(unknown))}")
+
+    db_path = args.db or default_db_path(args)
+    if args.regenerate or not db_path.exists():
+        start = time.perf_counter()
+        generate_db(db_path, args.urls, args.tags, args.depth, args.fanout, args.tags_per_url, args.seed)
+        print(f"Base de datos generada en {time.perf_counter() - start:.1f} s: {db_path}", file=sys.stderr)
+    os.environ['ALTERCLIP_DB'] = str(db_path)
+
+    samples = sample_values(db_path)
+    benches = {'cli': bench_cli, 'web': bench_web, 'gui': bench_gui, 'daemon': bench_daemon}
+    results = []
+    print(f"{'Prueba':<68} {'Frío ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    print('─' * 98)
+    for group in groups:
+        for result in benches[group](samples, args.repeat):
+            results.append(result)
+            print(f"{group + ' ' + result['name']:<68.68} {result['cold_ms']:>9.2f} "
+                  f"{result['median_ms']:>9.2f} {result['p95_ms']:>9.2f}")
+
+    report = {
+        'version': RESULTS_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'params': {'urls': args.urls, 'tags': args.tags, 'depth': args.depth, 'fanout': args.fanout,
+                   'tags_per_url': args.tags_per_url, 'seed': args.seed, 'repeat': args.repeat},
+        'results': results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\nResultados guardados en {args.output}")
+
+    if args.compare:
+        previous = json.loads(args.compare.read_text(encoding='utf-8'))
+        if previous.get('params') != report['params']:
+            print("Aviso: los resultados anteriores se midieron con otros parámetros", file=sys.stderr)
+        sys.exit(1 if compare(previous, report, args.threshold, args.min_ms) else 0)
+
+
+if __name__ == '__main__':
+    main()
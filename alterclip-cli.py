@@ -15,6 +15,14 @@ import unicodedata
 from datetime import datetime
 import openai
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from alterclip_facets import compute_facets
+from alterclip_sync import export_delta, read_delta, apply_delta
+from alterclip_suggest import TagSuggester
+from alterclip_urls import (UNKNOWN_TITLE, canonical_key, ensure_canonical_key, get_content_title,
+                            url_platform)
+import alterclip_profile as profiling
 
 REPRODUCTOR_VIDEO = "mpv"
 
@@ -38,13 +46,13 @@ def print_separator(char='─', length=80, style='thin') -> None:
     print(colored(separator, 'white', attrs=['dark']))
 
 def get_db_path() -> Path:
-    """Obtiene la ruta de la base de datos"""
-    return Path(user_log_dir("alterclip")) / "streaming_history.db"
+    """Obtiene la ruta de la base de datos (ALTERCLIP_DB permite usar otra)"""
+    return Path(os.getenv("ALTERCLIP_DB", Path(user_log_dir("alterclip")) / "streaming_history.db"))
 
 # Crear la conexión a la base de datos
 def create_connection() -> sqlite3.Connection:
     """Crea una conexión a la base de datos"""
-    conn = sqlite3.connect(get_db_path())
+    conn = profiling.connect(get_db_path())
 
     #Añadimos la función remove_accents para que pueda ser usada en las consultas
     conn.create_function("remove_accents", 1, remove_accents)
@@ -564,6 +572,102 @@ def remove_streaming_url(url_id: int) -> None:
     except Exception as e:
         print(f"Error al eliminar URL: {e}", file=sys.stderr)
 
+def merge_journal(journal_path: str, fetch_titles: bool = True) -> None:
+    """Fusiona en el historial el diario de URLs capturadas en Android
+
+    El diario tiene una línea JSON {"t": segundos, "u": url} por URL. Las URLs
+    que ya están en el historial, aunque sea con otra variante del enlace
+    (misma clave canónica), no se duplican; a las nuevas, y a las
+    existentes que no tenían título, se les busca el título aquí, ya que el
+    móvil no consulta ninguno.
+    """
+    try:
+        entries = {}
+        with open(journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    url, t = entry["u"], int(entry["t"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+                # De cada vídeo se conserva la primera vez que se capturó
+                key = canonical_key(url)
+                if key not in entries or t < entries[key][1]:
+                    entries[key] = (url, t)
+
+        if not entries:
+            print("El diario no contiene URLs")
+            return
+
+        ensure_canonical_key(conn)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, canonical_key, url, title FROM streaming_history
+            WHERE canonical_key IN (SELECT value FROM json_each(?))
+            ORDER BY id DESC
+        ''', (json.dumps(list(entries)),))
+        existing = {key: (url_id, url, title) for url_id, key, url, title in cursor.fetchall()}
+
+        new_keys = [key for key in entries if key not in existing]
+        new_urls = [entries[key][0] for key in new_keys]
+        untitled = [url for _, url, title in existing.values()
+                    if not title or title == UNKNOWN_TITLE]
+
+        titles = {}
+        if fetch_titles and (new_urls or untitled):
+            pending = new_urls + untitled
+            print(f"Obteniendo el título de {len(pending)} URLs...")
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                titles = dict(zip(pending, pool.map(get_content_title, pending)))
+
+        with conn:
+            # Sin título, la plataforma se deduce del dominio para que los
+            # filtros por plataforma y la exportación a FreeTube las encuentren
+            cursor.executemany(
+                "INSERT INTO streaming_history (url, title, platform, timestamp, canonical_key) "
+                "VALUES (?, ?, ?, datetime(?, 'unixepoch'), ?)",
+                [(url, *titles.get(url, (None, url_platform(url))), t, key)
+                 for key, (url, t) in ((key, entries[key]) for key in new_keys)]
+            )
+            backfilled = []
+            for url_id, url, _ in existing.values():
+                title, platform = titles.get(url, (None, None))
+                if title and title != UNKNOWN_TITLE:
+                    backfilled.append((title, platform, url_id))
+            cursor.executemany(
+                "UPDATE streaming_history SET title = ?, platform = COALESCE(platform, ?) WHERE id = ?",
+                backfilled
+            )
+
+        print(f"Diario fusionado: {len(new_urls)} URLs nuevas, "
+              f"{len(existing)} ya estaban en el historial, {len(backfilled)} títulos completados")
+    except Exception as e:
+        print(f"Error al fusionar el diario: {e}", file=sys.stderr)
+
+def sync_export_delta(peer: str, output: str = None, since: int = None) -> None:
+    """Exporta los cambios que el equipo `peer` aún no ha recibido"""
+    try:
+        if output is None:
+            output = f"alterclip-delta-{peer}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json.gz"
+        delta = export_delta(conn, peer, output, since)
+        total = sum(len(delta[key]) for key in ('history', 'tags', 'url_tags', 'tag_edges'))
+        print(f"Delta para '{peer}' guardado en {output}: {total} cambios "
+              f"({len(delta['history'])} URLs, {len(delta['tags'])} tags, "
+              f"{len(delta['url_tags'])} asociaciones, {len(delta['tag_edges'])} relaciones), "
+              f"{os.path.getsize(output)} bytes")
+    except Exception as e:
+        print(f"Error al exportar el delta: {e}", file=sys.stderr)
+
+def sync_apply_delta(path: str) -> None:
+    """Fusiona en el historial un delta exportado en otro equipo"""
+    try:
+        stats = apply_delta(conn, read_delta(path))
+        print(f"Delta aplicado: {stats['applied']} cambios fusionados, "
+              f"{stats['skipped']} descartados por ser más antiguos que los locales, "
+              f"{stats['unchanged']} ya estaban al día")
+    except Exception as e:
+        print(f"Error al aplicar el delta: {e}", file=sys.stderr)
+
 def udp_client(mensaje: str):
     dest_ip = "127.0.0.1"
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -672,6 +776,32 @@ alterclip-cli - Interfaz de línea de comandos para alterclip
             auto [ID]
                 Asigna automáticamente etiquetas a una URL usando IA
                 ID: Identificador numérico de la URL a etiquetar
+            suggest [título] [--local [--limit N]]
+                Sugiere tags para un título con IA o, con --local, con el clasificador
+                entrenado con las URLs ya etiquetadas (sin conexión, requiere numpy)
+            auto --untagged [--limit N] [--batch-size N] [--workers N]
+                Etiqueta con IA todas las URLs sin tags, enviando varios títulos por
+                petición. Las sugerencias se guardan en caché hasta que cambie la
+                taxonomía. ALTERCLIP_AI_MODEL elige el modelo y OPENAI_BASE_URL
+                permite usar otro servidor compatible con la API de OpenAI
+""", 'white'))
+    
+    print(colored("""
+    journal merge [FICHERO] [--no-titles]
+        Fusiona en el historial el diario de URLs capturadas por alterclip-android.py
+        (journal.jsonl en su directorio de logs). Las URLs repetidas no se duplican
+        y se buscan los títulos que falten
+        --no-titles: No consulta los títulos (no necesita conexión)
+""", 'white'))
+    
+    print(colored("""
+    sync export-delta --peer [EQUIPO] [--output [FICHERO]] [--since [N]]
+        Exporta a un fichero .json.gz los cambios del historial, tags y asociaciones
+        que EQUIPO todavía no ha recibido
+        --since: Reenvía los cambios desde el punto N del registro
+    sync apply-delta [FICHERO]
+        Fusiona los cambios exportados en otro equipo. En título, plataforma y tags
+        gana el cambio más reciente; las reproducciones (visto) se suman por equipo
 """, 'white'))
     
     print(colored("""
@@ -768,10 +898,7 @@ def list_tags() -> None:
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT t.name, t.description, 
-                   (SELECT COUNT(*) 
-                    FROM url_tags ut 
-                    WHERE ut.tag_id = t.id) as url_count
+            SELECT t.id, t.name, t.description
             FROM tags t
             ORDER BY t.name
         ''')
@@ -781,12 +908,17 @@ def list_tags() -> None:
         if not tags:
             print_error("No hay tags disponibles")
             return
-            
+        
+        # Recuentos de todas las etiquetas en una sola consulta
+        counts = compute_facets(conn)['tags']
+        
         print(colored("\nTags disponibles:", 'yellow', attrs=['bold']))
-        print(colored(f"{'Nombre':<30} {'Descripción':<40} {'URLs':>8}", 'white', attrs=['bold']))
+        print(colored(f"{'Nombre':<30} {'Descripción':<40} {'URLs':>8} {'Con hijas':>10}", 'white', attrs=['bold']))
         print_separator(style='double')
-        for name, description, url_count in tags:
-            print(f"{colored(name, 'cyan'):<30} {description[:40]:<40} {colored(str(url_count), 'yellow'):<8}")
+        for tag_id, name, description in tags:
+            count = counts.get(tag_id, {'direct': 0, 'total': 0})
+            print(f"{colored(name, 'cyan'):<30} {(description or '')[:40]:<40} "
+                  f"{colored(str(count['direct']), 'yellow'):>8} {colored(str(count['total']), 'yellow'):>10}")
         print_separator(style='thick')
     except Exception as e:
         print_error(f"Error al listar tags: {e}")
@@ -796,50 +928,41 @@ def show_tag_hierarchy() -> None:
     try:
         cursor = conn.cursor()
         
-        def get_children(tag_id):
-            cursor.execute('''
-                SELECT t.name, t.id
-                FROM tags t
-                JOIN tag_hierarchy th ON t.id = th.child_id
-                WHERE th.parent_id = ?
-                ORDER BY t.name
-            ''', (tag_id,))
-            return cursor.fetchall()
-        
-        cursor.execute('''
-            SELECT t.name, t.id,
-                   (SELECT COUNT(*) 
-                    FROM url_tags ut 
-                    WHERE ut.tag_id = t.id) as url_count
-            FROM tags t
-            LEFT JOIN tag_hierarchy th ON t.id = th.child_id
-            WHERE th.parent_id IS NULL
-            ORDER BY t.name
-        ''')
-        root_tags = cursor.fetchall()
+        # Se cargan todas las etiquetas y relaciones de una vez y el árbol se
+        # recorre en memoria
+        cursor.execute('SELECT id, name FROM tags ORDER BY name')
+        tags = cursor.fetchall()
+        cursor.execute('SELECT parent_id, child_id FROM tag_hierarchy')
+        children = {}
+        has_parent = set()
+        for parent_id, child_id in cursor.fetchall():
+            children.setdefault(parent_id, []).append(child_id)
+            has_parent.add(child_id)
+        names = dict(tags)
+        counts = compute_facets(conn)['tags']
         
-        def print_hierarchy(tag_name, tag_id, level=0):
-            cursor.execute('''
-                SELECT COUNT(*) 
-                FROM url_tags ut 
-                WHERE ut.tag_id = ?
-            ''', (tag_id,))
-            url_count = cursor.fetchone()[0]
+        def print_hierarchy(tag_id, level=0, visited=frozenset()):
+            count = counts.get(tag_id, {'direct': 0, 'total': 0})
             
             # Usar colores diferentes para diferentes niveles
             colors = ['cyan', 'yellow', 'green', 'magenta']
             color = colors[level % len(colors)]
             indent = '  ' * level
-            print(f"{indent}{colored(f'- {tag_name}', color)} ({colored(str(url_count), 'yellow')})")
+            url_count = colored(str(count['direct']), 'yellow')
+            if count['total'] != count['direct']:
+                url_count += f", {colored(str(count['total']), 'yellow')} con subetiquetas"
+            print(f"{indent}{colored(f'- {names[tag_id]}', color)} ({url_count})")
             
-            children = get_children(tag_id)
-            for child_name, child_id in children:
-                print_hierarchy(child_name, child_id, level + 1)
+            visited = visited | {tag_id}
+            for child_id in sorted(children.get(tag_id, []), key=lambda i: names.get(i, '')):
+                if child_id in names and child_id not in visited:
+                    print_hierarchy(child_id, level + 1, visited)
         
         print(colored("\nJerarquía de tags:", 'yellow', attrs=['bold']))
         print_separator(style='double')
-        for tag_name, tag_id, _ in root_tags:
-            print_hierarchy(tag_name, tag_id)
+        for tag_id, _ in tags:
+            if tag_id not in has_parent:
+                print_hierarchy(tag_id)
         print_separator(style='double')
     except Exception as e:
         print_error(f"Error al mostrar jerarquía de tags: {e}")
@@ -998,62 +1121,222 @@ def show_hierarchy_json() -> None:
     except Exception as e:
         print(f"Error al mostrar la jerarquía: {e}", file=sys.stderr)
 
-def get_suggest_IA_tags(title: str):
-    """Obtiene sugerencias de etiquetas IA para un título dado.
-    
-    Args:
-        title: Título para el que se desean sugerencias de etiquetas
-        
+# Modelo de IA y reparto de las peticiones de `tag auto --untagged`. La URL
+# del servidor se toma de OPENAI_BASE_URL, así que sirve cualquier servidor
+# compatible con la API de OpenAI (también uno local para pruebas)
+AI_MODEL = os.getenv('ALTERCLIP_AI_MODEL', 'gpt-4o-mini')
+AI_BATCH_SIZE = 20
+AI_MAX_WORKERS = 4
+# Similitud mínima para aceptar la sugerencia local sin preguntar a la IA
+# (un valor mayor que 1 desactiva el filtro previo)
+LOCAL_SUGGEST_THRESHOLD = float(os.getenv('ALTERCLIP_LOCAL_THRESHOLD', '0.5'))
+
+def get_local_suggester() -> TagSuggester:
+    """Devuelve el clasificador local actualizado con las últimas asociaciones
+
+    Raises:
+        ImportError: Si NumPy no está instalado
+    """
+    suggester = TagSuggester(get_db_path().with_name("tag_model.npz"))
+    suggester.update(conn)
+    return suggester
+
+def get_local_suggestions(titles: List[str], threshold: float = LOCAL_SUGGEST_THRESHOLD) -> dict:
+    """Sugerencias del clasificador local para los títulos en los que está seguro
+
     Returns:
-        dict: Objeto JSON con la sugerencia de etiqueta o None en caso de error
+        dict: {título: sugerencia con el mismo formato que la IA}
     """
-    hierarchy = get_hierarchy_json()
-    
+    if threshold > 1:
+        return {}
+    try:
+        suggester = get_local_suggester()
+    except ImportError:
+        return {}
+
+    names = dict(conn.execute('SELECT id, name FROM tags').fetchall())
+    suggestions = {}
+    for title in titles:
+        for tag_id, score in suggester.suggest(title, limit=1):
+            if score >= threshold and tag_id in names:
+                suggestions[title] = {
+                    "acción": "asignar",
+                    "etiqueta": names[tag_id],
+                    "motivo": f"Sugerencia local (similitud {score:.2f})"
+                }
+    return suggestions
+
+def show_local_suggestions(title: str, limit: int = 5) -> None:
+    """Muestra las etiquetas que sugiere el clasificador local para un título"""
+    try:
+        suggester = get_local_suggester()
+    except ImportError as e:
+        print_error(str(e))
+        return
+
+    names = dict(conn.execute('SELECT id, name FROM tags').fetchall())
+    suggestions = [(names[tag_id], score) for tag_id, score in suggester.suggest(title, limit * 2)
+                   if tag_id in names][:limit]
+    if not suggestions:
+        print("No hay sugerencias locales (¿hay URLs etiquetadas?)")
+        return
+    for name, score in suggestions:
+        print(f"{score:.2f}  {name}  ({get_tag_hierarchy(name)})")
+
+def get_taxonomy_text() -> str:
+    """Taxonomía compacta para el prompt: una ruta completa por línea
+
+    Solo se incluyen las rutas hasta las etiquetas sin hijas; las etiquetas
+    intermedias ya aparecen como prefijo.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        WITH RECURSIVE paths(id, path, depth) AS (
+            SELECT id, name, 0 FROM tags
+            WHERE id NOT IN (SELECT child_id FROM tag_hierarchy)
+            UNION
+            SELECT t.id, p.path || '/' || t.name, p.depth + 1
+            FROM paths p
+            JOIN tag_hierarchy th ON th.parent_id = p.id
+            JOIN tags t ON t.id = th.child_id
+            WHERE p.depth < 20
+        )
+        SELECT path FROM paths
+        WHERE id NOT IN (SELECT parent_id FROM tag_hierarchy)
+        ORDER BY path
+    ''')
+    return "\n".join(row[0] for row in cursor.fetchall())
+
+def ensure_ai_cache() -> None:
+    """Crea la caché de sugerencias de IA si no existe"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ai_tag_suggestions (
+            title_hash TEXT NOT NULL,
+            taxonomy_version TEXT NOT NULL,
+            suggestion TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (title_hash, taxonomy_version)
+        )
+    ''')
+
+def title_hash(title: str) -> str:
+    """Clave de caché de un título, sin distinguir mayúsculas ni espacios sobrantes"""
+    return hashlib.sha1(" ".join(title.split()).lower().encode('utf-8')).hexdigest()
+
+def request_IA_batch(client, taxonomy: str, titles: List[str]) -> List[dict]:
+    """Pide a la IA sugerencias para varios títulos en una sola petición
+
+    Returns:
+        list: Una sugerencia (o None) por título, en el mismo orden
+    """
+    numbered = "\n".join(f"{n}. {title}" for n, title in enumerate(titles, 1))
     prompt = f"""
-Taxonomía actual (jerarquía de etiquetas):
-{json.dumps(hierarchy, indent=2, ensure_ascii=False)}
-
-Nuevo título:
-"{title}"
-
-Devuelve un objeto JSON con una de estas dos opciones:
-
-1. Si el título encaja en una etiqueta existente, responde con:
-{{
-  "acción": "asignar",
-  "etiqueta": "Ruta/De/Etiquetas",
-  "motivo": "Breve explicación"
-}}
-
-2. Si el título necesita una nueva etiqueta, responde con:
-{{
-  "acción": "añadir",
-  "etiqueta": "Ruta/Nueva/Etiqueta",
-  "motivo": "Breve explicación"
-}}
-No expliques nada fuera del objeto JSON y asegúrate de que el campo "etiqueta" incluya toda la jerarquía (separada por "/").
+Taxonomía actual (una ruta de etiquetas por línea):
+{taxonomy}
+
+Nuevos títulos:
+{numbered}
+
+Para cada título decide si encaja en una etiqueta existente ("asignar") o
+necesita una nueva ("añadir"). Devuelve solo un objeto JSON con esta forma:
+{{"resultados": [{{"n": 1, "acción": "asignar", "etiqueta": "Ruta/De/Etiquetas", "motivo": "Breve explicación"}}]}}
+con un elemento por título, donde "n" es su número y "etiqueta" incluye toda
+la jerarquía separada por "/".
 """
+    response = client.chat.completions.create(
+        model=AI_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.3
+    )
+    content = response.choices[0].message.content
+    try:
+        results = json.loads(content).get("resultados", [])
+    except (json.JSONDecodeError, AttributeError):
+        print("⚠️ La respuesta no fue JSON válido:", file=sys.stderr)
+        print(content, file=sys.stderr)
+        return [None] * len(titles)
+
+    suggestions = [None] * len(titles)
+    for result in results:
+        n = result.get("n") if isinstance(result, dict) else None
+        if isinstance(n, int) and 1 <= n <= len(titles):
+            suggestions[n - 1] = {key: value for key, value in result.items() if key != "n"}
+    return suggestions
+
+def get_suggest_IA_tags_batch(titles: List[str], batch_size: int = AI_BATCH_SIZE,
+                              workers: int = AI_MAX_WORKERS) -> dict:
+    """Obtiene sugerencias de etiquetas IA para muchos títulos
+
+    Las sugerencias se guardan por hash del título y versión de la taxonomía,
+    así que solo se consultan los títulos nuevos o los que se sugirieron con
+    otra taxonomía. Los pendientes se envían en lotes de `batch_size` con
+    como mucho `workers` peticiones a la vez.
+
+    Returns:
+        dict: {título: sugerencia}; faltan los títulos sin sugerencia
+    """
+    taxonomy = get_taxonomy_text()
+    version = hashlib.sha1(f"{AI_MODEL}\n{taxonomy}".encode('utf-8')).hexdigest()
+    ensure_ai_cache()
+
+    hashes = {title: title_hash(title) for title in titles}
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT title_hash, suggestion FROM ai_tag_suggestions
+        WHERE taxonomy_version = ? AND title_hash IN (SELECT value FROM json_each(?))
+    ''', (version, json.dumps(list(set(hashes.values())))))
+    cached = {row[0]: json.loads(row[1]) for row in cursor.fetchall()}
+
+    suggestions = {title: cached[h] for title, h in hashes.items() if h in cached}
+    pending = list(dict.fromkeys(title for title in titles if title not in suggestions))
+    # Lo que el clasificador local reconoce con seguridad no llega a la IA
+    suggestions.update(get_local_suggestions(pending))
+    pending = [title for title in pending if title not in suggestions]
+    if not pending:
+        return suggestions
+
     # Cargar la API key de OpenAI desde variable de entorno
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     if not OPENAI_API_KEY:
         print("Advertencia: No se encontró la variable de entorno OPENAI_API_KEY. "
             "La funcionalidad de sugerencias de IA no estará disponible.", file=sys.stderr)
-        return None
+        return suggestions
+
+    client = openai.OpenAI(api_key=OPENAI_API_KEY)
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(request_IA_batch, client, taxonomy, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"Error al contactar con la API: {e}", file=sys.stderr)
+                continue
+            # La conexión no se comparte entre hilos: se guarda desde aquí
+            rows = []
+            for title, suggestion in zip(batch, results):
+                if suggestion:
+                    suggestions[title] = suggestion
+                    rows.append((hashes[title], version, json.dumps(suggestion, ensure_ascii=False)))
+            conn.executemany('''
+                INSERT OR REPLACE INTO ai_tag_suggestions (title_hash, taxonomy_version, suggestion)
+                VALUES (?, ?, ?)
+            ''', rows)
+            conn.commit()
+    return suggestions
+
+def get_suggest_IA_tags(title: str):
+    """Obtiene sugerencias de etiquetas IA para un título dado.
+    
+    Args:
+        title: Título para el que se desean sugerencias de etiquetas
         
+    Returns:
+        dict: Objeto JSON con la sugerencia de etiqueta o None en caso de error
+    """
     try:
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
-        )
-        content = response.choices[0].message.content
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            print("⚠️ La respuesta no fue JSON válido:")
-            print(content)
-            return None
+        return get_suggest_IA_tags_batch([title]).get(title)
     except Exception as e:
         print(f"Error al contactar con la API: {e}")
         return None
@@ -1097,7 +1380,23 @@ def assign_IA_suggestion(url_id: int) -> bool:
             return False
             
         print(f"Sugerencia de IA: {suggestion}")
+        return apply_IA_suggestion(url_id, suggestion)
+        
+    except Exception as e:
+        print(f"Error al asignar etiquetas con IA: {e}", file=sys.stderr)
+        return False
+
+def apply_IA_suggestion(url_id: int, suggestion: dict) -> bool:
+    """Crea las etiquetas que falten de la sugerencia y asigna la última a la URL
+    
+    Args:
+        url_id: ID de la URL a la que asignar etiquetas
+        suggestion: Sugerencia de la IA con las claves "acción" y "etiqueta"
         
+    Returns:
+        bool: True si se asignó la etiqueta correctamente, False en caso contrario
+    """
+    try:
         # Verificar que la acción sea 'añadir' o 'asignar'
         if suggestion.get("acción") not in ["añadir", "asignar"]:
             print(f"AcciÃ³n no vÃ¡lida en la sugerencia de IA: {suggestion.get('acciÃ³n')}", file=sys.stderr)
@@ -1149,6 +1448,41 @@ def assign_IA_suggestion(url_id: int) -> bool:
         return False
 
 
+def assign_IA_untagged(limit: int = None, batch_size: int = AI_BATCH_SIZE,
+                       workers: int = AI_MAX_WORKERS) -> None:
+    """Asigna etiquetas con IA a todas las URLs que aún no tienen ninguna
+    
+    Args:
+        limit: Número máximo de URLs a etiquetar (las más recientes primero)
+        batch_size: Títulos por petición a la IA
+        workers: Peticiones simultáneas como máximo
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT sh.id, sh.title FROM streaming_history sh
+        WHERE NOT EXISTS (SELECT 1 FROM url_tags ut WHERE ut.url_id = sh.id)
+          AND sh.title IS NOT NULL AND sh.title <> '' AND sh.title <> ?
+        ORDER BY sh.id DESC
+        LIMIT ?
+    ''', (UNKNOWN_TITLE, limit if limit else -1))
+    rows = cursor.fetchall()
+    if not rows:
+        print("No hay URLs sin etiquetas")
+        return
+
+    print(f"Pidiendo sugerencias para {len(rows)} URLs sin etiquetas...")
+    suggestions = get_suggest_IA_tags_batch([title for _, title in rows], batch_size, workers)
+
+    assigned = 0
+    for url_id, title in rows:
+        suggestion = suggestions.get(title)
+        if not suggestion:
+            print(f"Sin sugerencia para la URL ID {url_id}: {title}", file=sys.stderr)
+            continue
+        if apply_IA_suggestion(url_id, suggestion):
+            assigned += 1
+    print(f"Etiquetas asignadas a {assigned} de {len(rows)} URLs")
+
 def get_available_tags() -> List[str]:
     """Obtiene la lista de tags disponibles en la base de datos"""
     try:
@@ -1201,6 +1535,9 @@ def main() -> None:
       hist --no-tags     Muestra solo URLs sin tags
       playall            Reproduce múltiples URLs en secuencia
       tag                Gestiona tags para organizar el historial
+      journal merge [FICHERO]  Fusiona el diario de URLs capturadas en Android
+      sync export-delta --peer [EQUIPO]  Exporta los cambios para otro equipo
+      sync apply-delta [FICHERO]         Fusiona los cambios de otro equipo
     '''
 
     # Detalles adicionales sobre el comando tag
@@ -1212,6 +1549,7 @@ def main() -> None:
       tag hierarchy        Muestra la jerarquía completa de tags
       tag update [NOMBRE]  Actualiza un tag
       tag auto [ID]        Asigna automáticamente etiquetas a una URL usando IA
+      tag auto --untagged  Asigna etiquetas con IA a todas las URLs sin tags
       tag url add [ID] [TAG]   Asocia un tag con una URL
       tag url rm [ID] [TAG]   Elimina la asociación entre una URL y un tag
     '''
@@ -1221,6 +1559,8 @@ def main() -> None:
         formatter_class=argparse.RawDescriptionHelpFormatter,
         add_help=True
     )
+    parser.add_argument('--profile', action='store_true',
+                        help='Registra las consultas SQL y guarda un perfil de cProfile al salir (ver ALTERCLIP_PROFILE)')
     
     # Configurar autocompletado
     if '_ARGCOMPLETE' in os.environ:
@@ -1300,6 +1640,9 @@ def main() -> None:
     # Comando tag suggest
     suggest_parser = tag_subparsers.add_parser('suggest', help='Sugiere tags para un título usando IA')
     suggest_parser.add_argument('title', help='Título para el que se desean sugerencias de tags')
+    suggest_parser.add_argument('--local', action='store_true',
+                                help='Usa el clasificador local entrenado con las URLs ya etiquetadas (sin conexión)')
+    suggest_parser.add_argument('--limit', type=int, default=5, help='Con --local, número de sugerencias (por defecto: 5)')
 
     # Comando tag update
     update_parser = tag_subparsers.add_parser('update', help='Actualiza un tag')
@@ -1309,7 +1652,13 @@ def main() -> None:
 
     # Comando tag auto (asignación automática con IA)
     auto_parser = tag_subparsers.add_parser('auto', help='Asigna automáticamente etiquetas a una URL usando IA')
-    auto_parser.add_argument('url_id', type=int, help='ID de la URL a etiquetar')
+    auto_parser.add_argument('url_id', type=int, nargs='?', help='ID de la URL a etiquetar')
+    auto_parser.add_argument('--untagged', action='store_true', help='Etiqueta todas las URLs que no tienen ningún tag')
+    auto_parser.add_argument('--limit', type=int, help='Con --untagged, número máximo de URLs a etiquetar')
+    auto_parser.add_argument('--batch-size', type=int, default=AI_BATCH_SIZE,
+                             help=f'Con --untagged, títulos por petición (por defecto: {AI_BATCH_SIZE})')
+    auto_parser.add_argument('--workers', type=int, default=AI_MAX_WORKERS,
+                             help=f'Con --untagged, peticiones simultáneas (por defecto: {AI_MAX_WORKERS})')
     
     # Comandos para gestionar tags de URLs
     url_parser = tag_subparsers.add_parser('url', help='Gestiona tags de URLs')
@@ -1325,6 +1674,23 @@ def main() -> None:
     url_rm_parser.add_argument('url_id', type=int, help='ID de la URL')
     url_rm_parser.add_argument('tag_name', help='Nombre del tag a eliminar').completer = autocomplete_tags
     
+    # Comando journal
+    parser_journal = subparsers.add_parser('journal', help='Gestiona el diario de URLs capturadas en Android')
+    journal_subparsers = parser_journal.add_subparsers(dest='journal_command', help='Acciones de journal')
+    journal_merge_parser = journal_subparsers.add_parser('merge', help='Fusiona un diario en el historial')
+    journal_merge_parser.add_argument('file', help='Ruta del fichero journal.jsonl copiado del móvil')
+    journal_merge_parser.add_argument('--no-titles', action='store_true', help='No consulta los títulos de las URLs nuevas')
+    
+    # Comando sync
+    parser_sync = subparsers.add_parser('sync', help='Sincroniza el historial con otros equipos')
+    sync_subparsers = parser_sync.add_subparsers(dest='sync_command', help='Acciones de sync')
+    export_parser = sync_subparsers.add_parser('export-delta', help='Exporta los cambios para otro equipo')
+    export_parser.add_argument('--peer', required=True, help='Nombre del equipo de destino')
+    export_parser.add_argument('--output', help='Fichero de salida (por defecto alterclip-delta-EQUIPO-FECHA.json.gz)')
+    export_parser.add_argument('--since', type=int, help='Exporta desde este punto del registro en lugar del último enviado')
+    apply_parser = sync_subparsers.add_parser('apply-delta', help='Fusiona los cambios de otro equipo')
+    apply_parser.add_argument('file', help='Fichero .json.gz exportado en el otro equipo')
+    
     # Manejar el caso de no argumentos
     if len(sys.argv) == 1:
         parser.print_help()
@@ -1373,11 +1739,19 @@ def main() -> None:
             elif args.tag_command == 'json':
                 show_hierarchy_json()
             elif args.tag_command == 'suggest':
-                show_suggest_IA_tags(args.title)
+                if args.local:
+                    show_local_suggestions(args.title, args.limit)
+                else:
+                    show_suggest_IA_tags(args.title)
             elif args.tag_command == 'update':
                 update_tag(args.name, args.new_name, args.description)
             elif args.tag_command == 'auto':
-                if assign_IA_suggestion(args.url_id):
+                if args.untagged:
+                    assign_IA_untagged(args.limit, args.batch_size, args.workers)
+                elif args.url_id is None:
+                    print("Indica el ID de la URL o usa --untagged", file=sys.stderr)
+                    sys.exit(1)
+                elif assign_IA_suggestion(args.url_id):
                     print("Etiquetas asignadas correctamente")
                 else:
                     print("No se pudieron asignar las etiquetas", file=sys.stderr)
@@ -1386,12 +1760,22 @@ def main() -> None:
                     add_tag_to_url(args.url_id, args.tag_name)
                 elif args.url_command == 'rm':
                     remove_tag_from_url(args.url_id, args.tag_name)
+        elif args.command == 'sync':
+            if args.sync_command == 'export-delta':
+                sync_export_delta(args.peer, args.output, args.since)
+            elif args.sync_command == 'apply-delta':
+                sync_apply_delta(args.file)
+        elif args.command == 'journal':
+            if args.journal_command == 'merge':
+                merge_journal(args.file, fetch_titles=not args.no_titles)
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
 if __name__ == "__main__":
     try:
+        # Se activa antes de leer los argumentos para medir también la conexión
+        profiling.enable("cli", "--profile" in sys.argv[1:])
         conn = create_connection()
         main()
     except Exception as e:
@@ -1,22 +1,31 @@
 #!/usr/bin/env python
+import argparse
 import json
+import os
+import shutil
 import uuid
 import time
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import subprocess
 import re
+from platformdirs import user_log_dir
 
-# Rutas
-ALTERCLIP_DB = Path.home() / ".local/state/alterclip/log/streaming_history.db"
+# Rutas (ALTERCLIP_DB permite usar otra base de datos, como en el resto de programas)
+ALTERCLIP_DB = Path(os.getenv("ALTERCLIP_DB", Path(user_log_dir("alterclip")) / "streaming_history.db"))
 FREETUBE_PLAYLIST = Path.home() / ".config/FreeTube/playlists.db"
 BACKUP_FILE = FREETUBE_PLAYLIST.with_suffix(".db.bak")
 
+# Número máximo de procesos yt-dlp lanzados a la vez
+MAX_WORKERS = int(os.environ.get("ALTERCLIP_FREETUBE_WORKERS", "4"))
+
 def extract_video_id(url):
     match = re.search(r"(?:v=|youtu\.be/)([\w-]{11})", url)
     return match.group(1) if match else None
 
 def fetch_metadata(video_id):
+    """Obtiene con yt-dlp los metadatos de un vídeo (se ejecuta en el pool)"""
     try:
         result = subprocess.run(
             ["yt-dlp", f"https://www.youtube.com/watch?v={video_id}", "--dump-json"],
@@ -27,69 +36,338 @@ def fetch_metadata(video_id):
         )
         data = json.loads(result.stdout)
         return {
-            "videoId": video_id,
             "title": data.get("title", ""),
             "author": data.get("channel", data.get("uploader", "")),
             "authorId": data.get("channel_id", ""),
             "lengthSeconds": data.get("duration", 0),
             "published": int(data.get("timestamp", time.time()) * 1000),
-            "timeAdded": int(time.time() * 1000),
-            "playlistItemId": str(uuid.uuid4()),
-            "type": "video"
         }
     except Exception as e:
         print(f"Error obteniendo metadatos de {video_id}: {e}")
         return None
 
-def cargar_urls_alterclip():
-    conn = sqlite3.connect(ALTERCLIP_DB)
+def abrir_db_alterclip():
+    """Abre la base de datos de Alterclip y crea las tablas de la sincronización si faltan"""
+    conn = sqlite3.connect(ALTERCLIP_DB, timeout=30)
+    # Última entrada del historial revisada y vídeos ya enviados a FreeTube
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS freetube_sync_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS freetube_synced (
+            video_id TEXT PRIMARY KEY,
+            history_id INTEGER,
+            synced_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS video_metadata (
+            video_id TEXT PRIMARY KEY,
+            title TEXT,
+            author TEXT,
+            author_id TEXT,
+            length_seconds INTEGER,
+            published INTEGER,
+            fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return conn
+
+def metadatos_en_cache(conn, video_ids):
+    """Devuelve {video_id: metadatos} para los vídeos que ya están en la caché"""
+    cur = conn.execute(
+        """SELECT video_id, title, author, author_id, length_seconds, published
+           FROM video_metadata
+           WHERE video_id IN (SELECT value FROM json_each(?))""",
+        (json.dumps(list(video_ids)),)
+    )
+    return {
+        row[0]: {
+            "title": row[1],
+            "author": row[2],
+            "authorId": row[3],
+            "lengthSeconds": row[4],
+            "published": row[5],
+        }
+        for row in cur
+    }
+
+def obtener_metadatos(conn, video_ids):
+    """Metadatos de todos los vídeos, usando la caché y yt-dlp en paralelo
+
+    Los vídeos que no están en la caché se piden a yt-dlp con como mucho
+    MAX_WORKERS procesos a la vez y el resultado se guarda en la caché para
+    las siguientes sincronizaciones.
+    """
+    metadatos = metadatos_en_cache(conn, video_ids)
+    pendientes = [vid for vid in video_ids if vid not in metadatos]
+    if pendientes:
+        print(f"{len(metadatos)} vídeos en caché, consultando {len(pendientes)} con yt-dlp...")
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            obtenidos = dict(zip(pendientes, pool.map(fetch_metadata, pendientes)))
+        obtenidos = {vid: info for vid, info in obtenidos.items() if info}
+        with conn:
+            conn.executemany(
+                """INSERT OR REPLACE INTO video_metadata
+                   (video_id, title, author, author_id, length_seconds, published)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [(vid, info["title"], info["author"], info["authorId"],
+                  info["lengthSeconds"], info["published"])
+                 for vid, info in obtenidos.items()]
+            )
+        metadatos.update(obtenidos)
+    return metadatos
+
+def entrada_playlist(video_id, info):
+    """Construye la entrada de vídeo para la playlist de FreeTube"""
+    return {
+        "videoId": video_id,
+        **info,
+        "timeAdded": int(time.time() * 1000),
+        "playlistItemId": str(uuid.uuid4()),
+        "type": "video"
+    }
+
+def leer_estado(conn, key, default=None):
+    """Valor guardado en freetube_sync_state"""
+    row = conn.execute("SELECT value FROM freetube_sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def leer_marca(conn):
+    """Id de la última entrada del historial ya revisada (0 si nunca se ha sincronizado)"""
+    return leer_estado(conn, 'last_history_id', 0)
+
+def sello_playlist(path):
+    """Tamaño y fecha de modificación del fichero, para saber si alguien lo ha tocado"""
+    st = path.stat()
+    return st.st_size, st.st_mtime_ns
+
+def guardar_sincronizacion(conn, marca, sincronizados, sello=None):
+    """Guarda la nueva marca, los vídeos enviados y el sello de playlists.db en una sola transacción"""
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO freetube_sync_state (key, value) VALUES ('last_history_id', ?)",
+                     (marca,))
+        if sello:
+            conn.executemany("INSERT OR REPLACE INTO freetube_sync_state (key, value) VALUES (?, ?)",
+                             [('playlist_size', sello[0]), ('playlist_mtime_ns', sello[1])])
+        conn.executemany("INSERT OR IGNORE INTO freetube_synced (video_id, history_id) VALUES (?, ?)",
+                         sincronizados)
+
+def copia_si_ha_cambiado(conn, path):
+    """Hace la copia de seguridad antes de añadir líneas, si hace falta
+
+    Si el fichero sigue como lo dejó la última sincronización, desde la
+    última copia solo se le han añadido líneas de 'Watch Later' al final y
+    no se vuelve a copiar. Solo se copia si no hay copia o si FreeTube (o
+    una compactación) lo ha modificado desde entonces.
+
+    Returns:
+        bool: True si se ha hecho la copia
+    """
+    sello = (leer_estado(conn, 'playlist_size'), leer_estado(conn, 'playlist_mtime_ns'))
+    if BACKUP_FILE.exists() and sello == sello_playlist(path):
+        return False
+    # Se copia el contenido: un enlace duro recibiría también las líneas añadidas
+    hacer_copia_seguridad(path, enlazar=False)
+    return True
+
+def cargar_urls_alterclip(conn, desde_id=0):
+    """Entradas de YouTube pendientes de ver añadidas después de desde_id
+
+    Se recorre el historial por su clave primaria, así que solo se leen las
+    filas nuevas desde la última sincronización.
+    """
     cur = conn.cursor()
-    cur.execute("SELECT url FROM streaming_history WHERE platform = 'YouTube' AND visto = 0")
-    urls = [row[0] for row in cur.fetchall()]
-    conn.close()
-    return urls
+    cur.execute("""SELECT id, url FROM streaming_history
+                   WHERE id > ? AND platform = 'YouTube' AND visto = 0
+                   ORDER BY id""", (desde_id,))
+    return cur.fetchall()
+
+def leer_entradas(path):
+    """Lee todos los registros del fichero NeDB, uno por línea"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compactar_entradas(entries):
+    """Deja solo la última versión de cada documento
+
+    NeDB nunca reescribe el fichero: añade una línea nueva por cada cambio y
+    marca los borrados con "$$deleted". Al cargarlo se queda con la última
+    línea de cada _id, así que el resto se puede descartar sin cambiar nada.
+    Las definiciones de índices se conservan.
+    """
+    documentos = {}
+    indices = {}
+    for entry in entries:
+        if "$$indexCreated" in entry:
+            indices[entry["$$indexCreated"]["fieldName"]] = entry
+        elif "$$indexRemoved" in entry:
+            indices.pop(entry["$$indexRemoved"], None)
+        elif entry.get("$$deleted"):
+            documentos.pop(entry["_id"], None)
+        else:
+            # Se mantiene el orden de la primera aparición de cada _id
+            documentos[entry["_id"]] = entry
+    return list(documentos.values()) + list(indices.values())
+
+def hacer_copia_seguridad(path, enlazar=True):
+    """Guarda el fichero actual en BACKUP_FILE
+
+    Con enlazar se usa un enlace duro cuando el sistema de ficheros lo
+    permite, así que no hace falta copiar el contenido: sirve cuando el
+    fichero nuevo se escribe aparte y el antiguo queda intacto como copia.
+    """
+    tmp = BACKUP_FILE.with_suffix(".bak.tmp")
+    tmp.unlink(missing_ok=True)
+    if enlazar:
+        try:
+            os.link(path, tmp)
+        except OSError:
+            enlazar = False
+    if not enlazar:
+        shutil.copy2(path, tmp)
+    os.replace(tmp, BACKUP_FILE)
+
+def escribir_atomico(path, entries):
+    """Reescribe el fichero NeDB de forma atómica"""
+    tmp = path.with_suffix(".db.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def compactar_playlists(path, dry_run=False):
+    """Compacta playlists.db si tiene versiones antiguas de algún documento
+
+    Returns:
+        tuple: (bytes antes, bytes después); iguales si no había nada que hacer.
+        Con dry_run se calcula el tamaño resultante sin escribir nada.
+    """
+    antes = path.stat().st_size
+    entries = leer_entradas(path)
+    compactadas = compactar_entradas(entries)
+    if len(compactadas) == len(entries):
+        return antes, antes
+    if dry_run:
+        return antes, sum(len((json.dumps(e, ensure_ascii=False) + "\n").encode("utf-8"))
+                          for e in compactadas)
 
-# Paso 1: cargar todas las entradas del archivo playlists.json
-lines = FREETUBE_PLAYLIST.read_text(encoding="utf-8").splitlines()
-entries = [json.loads(line) for line in lines]
+    hacer_copia_seguridad(path)
+    escribir_atomico(path, compactadas)
+    return antes, path.stat().st_size
 
-# Paso 2: localizar la última versión de la playlist 'Watch Later'
-watch_later_entries = [e for e in entries if e.get("playlistName") == "Watch Later"]
-if not watch_later_entries:
-    print("No se encontró la playlist 'Watch Later'")
-    exit(1)
+def sincronizar(completa=False, dry_run=False):
+    """Añade a 'Watch Later' los vídeos de YouTube pendientes en Alterclip
 
-last_entry = watch_later_entries[-1]
-video_ids_existentes = {v["videoId"] for v in last_entry.get("videos", [])}
-nuevos_videos = []
+    Args:
+        completa: Revisa todo el historial en lugar de solo lo nuevo
+        dry_run: Solo informa de lo que se haría, sin escribir nada
+    """
+    # Paso 1: cargar todas las entradas del archivo playlists.db
+    entries = leer_entradas(FREETUBE_PLAYLIST)
 
-# Paso 3: cargar URLs desde la base de datos de Alterclip
-urls = cargar_urls_alterclip()
-print(f"Obtenidas {len(urls)} URLs desde Alterclip.")
+    # Paso 2: localizar la última versión de la playlist 'Watch Later'
+    watch_later_entries = [e for e in entries if e.get("playlistName") == "Watch Later"]
+    if not watch_later_entries:
+        print("No se encontró la playlist 'Watch Later'")
+        return False
 
-for url in urls:
-    vid = extract_video_id(url)
-    if not vid or vid in video_ids_existentes:
-        continue
-    info = fetch_metadata(vid)
-    if info:
-        nuevos_videos.append(info)
+    last_entry = watch_later_entries[-1]
+    video_ids_existentes = {v["videoId"] for v in last_entry.get("videos", [])}
 
-if not nuevos_videos:
-    print("No hay vídeos nuevos para añadir.")
-    exit(0)
+    # Paso 3: cargar las URLs nuevas desde la base de datos de Alterclip
+    conn = abrir_db_alterclip()
+    marca = leer_marca(conn)
+    filas = cargar_urls_alterclip(conn, 0 if completa else marca)
+    if completa:
+        print(f"Obtenidas {len(filas)} URLs desde Alterclip (historial completo).")
+    else:
+        print(f"Obtenidas {len(filas)} URLs nuevas desde Alterclip (historial posterior al id {marca}).")
+
+    # Vídeos nuevos, sin repetidos y en el orden del historial
+    sincronizados = {row[0] for row in conn.execute("SELECT video_id FROM freetube_synced")}
+    video_ids = {}
+    for history_id, url in filas:
+        vid = extract_video_id(url)
+        if vid and vid not in video_ids_existentes and (completa or vid not in sincronizados):
+            video_ids_existentes.add(vid)
+            video_ids[vid] = history_id
+    nueva_marca = max(filas[-1][0], marca) if filas else marca
+
+    if dry_run:
+        en_cache = metadatos_en_cache(conn, video_ids) if video_ids else {}
+        conn.close()
+        print(f"[dry-run] Se añadirían {len(video_ids)} vídeos a 'Watch Later' "
+              f"({len(en_cache)} con metadatos en caché, {len(video_ids) - len(en_cache)} con yt-dlp).")
+        print(f"[dry-run] La marca de sincronización pasaría de {marca} a {nueva_marca}.")
+        return True
+
+    metadatos = obtener_metadatos(conn, list(video_ids)) if video_ids else {}
+    nuevos_videos = [entrada_playlist(vid, metadatos[vid]) for vid in video_ids if vid in metadatos]
+
+    # Si algún vídeo no se ha podido consultar, la marca no pasa de él para
+    # reintentarlo la próxima vez
+    fallidos = [history_id for vid, history_id in video_ids.items() if vid not in metadatos]
+    if fallidos:
+        nueva_marca = min(fallidos) - 1
+
+    if nuevos_videos:
+        # Paso 4: generar nueva entrada
+        updated_entry = dict(last_entry)
+        updated_entry["videos"] = last_entry.get("videos", []) + nuevos_videos
+        updated_entry["lastUpdatedAt"] = int(time.time() * 1000)
+
+        # Copia de seguridad, solo si el fichero ha cambiado desde la última
+        if copia_si_ha_cambiado(conn, FREETUBE_PLAYLIST):
+            print(f"Copia de seguridad en {BACKUP_FILE}")
+
+        # Escribir nueva línea
+        with open(FREETUBE_PLAYLIST, "a", encoding="utf-8") as f:
+            f.write(json.dumps(updated_entry, ensure_ascii=False) + "\n")
+
+    guardar_sincronizacion(conn, max(nueva_marca, 0),
+                           [(vid, video_ids[vid]) for vid in video_ids if vid in metadatos],
+                           sello_playlist(FREETUBE_PLAYLIST) if nuevos_videos else None)
+    conn.close()
 
-# Paso 4: generar nueva entrada
-updated_entry = dict(last_entry)
-updated_entry["videos"] = last_entry.get("videos", []) + nuevos_videos
-updated_entry["lastUpdatedAt"] = int(time.time() * 1000)
+    if nuevos_videos:
+        print(f"{len(nuevos_videos)} vídeos añadidos a la playlist 'Watch Later'.")
+    else:
+        print("No hay vídeos nuevos para añadir.")
+    return True
 
-# Copia de seguridad
-BACKUP_FILE.write_text(FREETUBE_PLAYLIST.read_text(encoding="utf-8"), encoding="utf-8")
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sincroniza los vídeos de YouTube pendientes de Alterclip con la playlist 'Watch Later' de FreeTube")
+    parser.add_argument('--compact', action='store_true',
+                        help='Compacta playlists.db dejando solo la última versión de cada documento '
+                             '(con FreeTube cerrado)')
+    parser.add_argument('--no-sync', action='store_true',
+                        help='No sincroniza; útil junto con --compact')
+    parser.add_argument('--full', action='store_true',
+                        help='Revisa todo el historial en lugar de solo lo añadido desde la última sincronización')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Muestra lo que se haría sin modificar nada')
+    args = parser.parse_args()
 
-# Escribir nueva línea
-with open(FREETUBE_PLAYLIST, "a", encoding="utf-8") as f:
-    f.write(json.dumps(updated_entry, ensure_ascii=False) + "\n")
+    if not args.no_sync and not sincronizar(completa=args.full, dry_run=args.dry_run):
+        exit(1)
 
-print(f"{len(nuevos_videos)} vídeos añadidos a la playlist 'Watch Later'.")
+    if args.compact:
+        antes, despues = compactar_playlists(FREETUBE_PLAYLIST, dry_run=args.dry_run)
+        if antes == despues:
+            print("playlists.db ya estaba compactado.")
+        elif args.dry_run:
+            print(f"[dry-run] playlists.db se compactaría: {antes} -> {despues} bytes "
+                  f"({antes - despues} bytes ahorrados).")
+        else:
+            print(f"playlists.db compactado: {antes} -> {despues} bytes "
+                  f"({antes - despues} bytes ahorrados). Copia en {BACKUP_FILE}")
 
+if __name__ == "__main__":
+    main()
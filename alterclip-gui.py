@@ -3,7 +3,85 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from pathlib import Path
 from platformdirs import user_log_dir
+import json
+import os
+import queue
 import sqlite3
+import threading
+import unicodedata
+import argparse
+import alterclip_profile as profiling
+
+# Número de URLs que se leen de la base de datos en cada página
+URLS_PAGE_SIZE = 500
+
+# Fracción de la lista que tiene que haberse recorrido para pedir otra página
+URLS_LOAD_AHEAD = 0.8
+
+# Filas que se añaden al Treeview de una vez (la lista completa queda en memoria)
+URLS_RENDER_CHUNK = 200
+
+# Cada cuántos milisegundos se recogen los resultados de los hilos de fondo
+UI_POLL_MS = 30
+
+# Espera tras la última tecla antes de filtrar y máximo de resultados al
+# buscar directamente en la base de datos
+SEARCH_DEBOUNCE_MS = 120
+SEARCH_DB_LIMIT = 2000
+
+def remove_accents(text):
+    """Elimina los acentos de una cadena de texto"""
+    if not isinstance(text, str):
+        return ""
+    return ''.join(
+        c for c in unicodedata.normalize('NFD', text)
+        if unicodedata.category(c) != 'Mn'
+    ).lower()
+
+class DatabaseWorker:
+    """Hilo que posee la única conexión de la GUI con la base de datos
+
+    Las consultas se encolan con submit(job, callback): el hilo ejecuta
+    job(conn) y deja (callback, resultado) en la cola de resultados, que la
+    interfaz recoge con after(). Así el hilo de Tk nunca espera a SQLite,
+    aunque el demonio esté escribiendo en ese momento.
+    """
+
+    def __init__(self, db_path, results):
+        self.db_path = db_path
+        self.results = results
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='db-worker', daemon=True)
+        self.thread.start()
+
+    def submit(self, job, callback=None):
+        """Encola job(conn); callback recibirá su resultado o la excepción"""
+        self.requests.put((job, callback))
+
+    def stop(self):
+        """Termina el hilo después de los trabajos ya encolados"""
+        self.requests.put(None)
+
+    def _run(self):
+        conn = profiling.connect(str(self.db_path), timeout=30)
+        # Para poder buscar sin distinguir acentos desde SQL
+        conn.create_function("remove_accents", 1, remove_accents)
+        try:
+            while True:
+                request = self.requests.get()
+                if request is None:
+                    break
+                job, callback = request
+                try:
+                    result = job(conn)
+                except Exception as e:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    result = e
+                if callback:
+                    self.results.put((callback, result))
+        finally:
+            conn.close()
 
 class AlterclipGUI:
     def __init__(self, root):
@@ -12,9 +90,40 @@ class AlterclipGUI:
         self.root.geometry("1000x600")
         
         # Variables
-        self.selected_url_id = None
+        self.selected_url_ids = ()
         self.selected_tags = set()
         
+        # Estado de la carga paginada de URLs
+        self.urls_total = None
+        self.urls_cursor = None
+        self.urls_exhausted = False
+        self.urls_loading = False
+        self.urls_generation = 0
+        
+        # URLs cargadas en memoria y clave de búsqueda sin acentos de cada una
+        # (título, plataforma y tags)
+        self.url_info = {}
+        self.url_order = []
+        self.search_keys = {}
+        
+        # Lista visible: ids que cumplen el filtro y cuántos están ya en el Treeview
+        self.view = self.url_order
+        self.view_rendered = 0
+        self.render_pending = False
+        self.search_query = ''
+        self.search_in_db = False
+        self.search_after_id = None
+        self.search_generation = 0
+        
+        # Resultados del hilo de base de datos pendientes de aplicar en la interfaz
+        self.ui_queue = queue.Queue()
+        self.db = DatabaseWorker(self.get_db_path(), self.ui_queue)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Índice nombre de tag -> items del árbol y tags resaltados ahora mismo
+        self.tag_items = {}
+        self.highlighted_tags = set()
+        
         # Configurar el grid
         self.root.grid_columnconfigure(0, weight=1)
         self.root.grid_columnconfigure(1, weight=1)
@@ -27,11 +136,26 @@ class AlterclipGUI:
         
         # Configurar el grid del frame de URLs
         self.urls_frame.grid_columnconfigure(0, weight=1)
-        self.urls_frame.grid_rowconfigure(0, weight=1)
+        self.urls_frame.grid_rowconfigure(1, weight=1)
+        
+        # Caja de búsqueda incremental
+        search_frame = ttk.Frame(self.urls_frame)
+        search_frame.grid(row=0, column=0, columnspan=2, sticky="ew", padx=5)
+        search_frame.grid_columnconfigure(1, weight=1)
+        ttk.Label(search_frame, text="Buscar:").grid(row=0, column=0, padx=(0, 5))
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', self.on_search_changed)
+        ttk.Entry(search_frame, textvariable=self.search_var).grid(row=0, column=1, sticky="ew")
+        # Si el historial no está cargado entero, buscar en SQLite en lugar de en memoria
+        self.search_db_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(search_frame, text="Buscar en la base de datos si no está todo cargado",
+                        variable=self.search_db_var,
+                        command=self.apply_search).grid(row=0, column=2, padx=(5, 0))
         
         # Treeview para las URLs
-        self.urls_list = ttk.Treeview(self.urls_frame, columns=('ID', 'Título', 'Plataforma'), show='headings')
-        self.urls_list.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
+        self.urls_list = ttk.Treeview(self.urls_frame, columns=('ID', 'Título', 'Plataforma'), show='headings',
+                                     selectmode='extended')
+        self.urls_list.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
         
         # Configurar las columnas
         self.urls_list.column('ID', width=50)
@@ -45,8 +169,8 @@ class AlterclipGUI:
         
         # Scrollbar para las URLs
         self.urls_scroll = ttk.Scrollbar(self.urls_frame, orient="vertical", command=self.urls_list.yview)
-        self.urls_scroll.grid(row=0, column=1, sticky="ns")
-        self.urls_list.configure(yscrollcommand=self.urls_scroll.set)
+        self.urls_scroll.grid(row=1, column=1, sticky="ns")
+        self.urls_list.configure(yscrollcommand=self.on_urls_scroll)
         
         # Frame para la lista de tags
         self.tags_frame = ttk.LabelFrame(root, text="Tags", padding="5")
@@ -59,6 +183,7 @@ class AlterclipGUI:
         # Treeview para los tags
         self.tags_list = ttk.Treeview(self.tags_frame, show='tree')
         self.tags_list.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
+        self.tags_list.tag_configure('associated', foreground='red')
         
         # Deshabilitar la interacción con los triángulos de expansión
         self.tags_list.bind('<Button-1>', self.on_tree_click)
@@ -97,383 +222,510 @@ class AlterclipGUI:
         
         # Eventos
         self.urls_list.bind('<<TreeviewSelect>>', self.on_url_select)
+        self.urls_list.bind('<Control-a>', self.select_all_urls)
         # Solo necesitamos el evento de clic para el Treeview
         self.tags_list.bind('<Button-1>', self.on_tree_click)
         
-        # Cargar datos
+        # Cargar datos (las URLs se cargan por páginas en segundo plano)
+        self.root.after(UI_POLL_MS, self.process_ui_queue)
         self.loading_initial = True
         self.load_urls()
         self.load_tags()
         self.loading_initial = False
 
+    def on_close(self):
+        """Detener el hilo de base de datos y cerrar la ventana"""
+        self.db.stop()
+        self.root.destroy()
+
+    def process_ui_queue(self):
+        """Aplica en el hilo de Tk los resultados del hilo de base de datos"""
+        try:
+            while True:
+                callback, result = self.ui_queue.get_nowait()
+                try:
+                    callback(result)
+                except Exception as e:
+                    print(f"Error al actualizar la interfaz: {str(e)}")
+        except queue.Empty:
+            pass
+        self.root.after(UI_POLL_MS, self.process_ui_queue)
+
     def add_selected_tags(self):
-        """Agregar los tags seleccionados a la URL"""
-        if not self.selected_url_id:
-            messagebox.showwarning("Advertencia", "Por favor, seleccione una URL")
+        """Agregar los tags seleccionados a todas las URLs seleccionadas"""
+        if not self.selected_url_ids:
+            messagebox.showwarning("Advertencia", "Por favor, seleccione al menos una URL")
             return
             
         if not self.selected_tags:
             messagebox.showwarning("Advertencia", "Por favor, seleccione al menos un tag")
             return
-            
-        conn = self.create_connection()
-        try:
-            cursor = conn.cursor()
-            
-            for tag in self.selected_tags:
-                # Obtener el ID del tag
-                tag_id = self.get_tag_id(tag)
-                if not tag_id:
-                    messagebox.showerror("Error", f"El tag '{tag}' no existe")
-                    conn.close()
-                    return
-                    
-                # Verificar si la asociación ya existe
-                cursor.execute('SELECT 1 FROM url_tags WHERE url_id = ? AND tag_id = ?', (self.selected_url_id, tag_id))
-                if cursor.fetchone():
-                    messagebox.showwarning("Advertencia", f"La URL ya tiene el tag '{tag}'")
-                    conn.close()
-                    return
-                    
-                # Crear la asociación
-                cursor.execute('INSERT INTO url_tags (url_id, tag_id) VALUES (?, ?)', (self.selected_url_id, tag_id))
-            
-            conn.commit()
-            messagebox.showinfo("Éxito", "Tags agregados correctamente")
-            self.update_tag_visualization(self.selected_url_id)  # Refrescar la visualización
-            self.selected_tags.clear()
-            self.update_buttons()
-            
-        except sqlite3.Error as e:
-            messagebox.showerror("Error", f"Error al agregar tags: {str(e)}")
-            conn.rollback()
-        finally:
-            conn.close()
+        
+        url_ids = list(self.selected_url_ids)
+        tag_names = {self.clean_tag_name(name) for name in self.selected_tags}
+        
+        def add_tags(conn):
+            # Todas las asociaciones en una sola transacción; las que ya
+            # existen las descarta la restricción UNIQUE(url_id, tag_id)
+            with conn:
+                tag_ids = self.resolve_tag_ids(conn, tag_names)
+                cursor = conn.executemany('INSERT OR IGNORE INTO url_tags (url_id, tag_id) VALUES (?, ?)',
+                                 [(url_id, tag_id) for url_id in url_ids for tag_id in tag_ids.values()])
+                # rowcount no incluye las filas que tocan los triggers
+                changed = cursor.rowcount
+            return sorted(tag_ids), changed, sorted(tag_names - set(tag_ids))
+        
+        def on_added(result):
+            if isinstance(result, Exception):
+                messagebox.showerror("Error", f"Error al agregar tags: {str(result)}")
+                return
+            applied, changed, missing = result
+            self.show_tags_summary("agregados", applied, len(url_ids), changed, missing)
+        
+        self.db.submit(add_tags, on_added)
 
     def remove_selected_tags(self):
-        """Remover los tags seleccionados de la URL"""
-        if not self.selected_url_id:
-            messagebox.showwarning("Advertencia", "Por favor, seleccione una URL")
+        """Remover los tags seleccionados de todas las URLs seleccionadas"""
+        if not self.selected_url_ids:
+            messagebox.showwarning("Advertencia", "Por favor, seleccione al menos una URL")
             return
             
         if not self.selected_tags:
             messagebox.showwarning("Advertencia", "Por favor, seleccione al menos un tag")
             return
-            
-        conn = self.create_connection()
-        cursor = conn.cursor()
-        
-        for tag in self.selected_tags:
-            # Obtener el ID del tag
-            tag_id = self.get_tag_id(tag)
-            if not tag_id:
-                messagebox.showerror("Error", f"El tag '{tag}' no existe")
-                conn.close()
-                return
-                
-            # Eliminar la asociación
-            cursor.execute('DELETE FROM url_tags WHERE url_id = ? AND tag_id = ?', (self.selected_url_id, tag_id))
-            
-            if cursor.rowcount == 0:
-                messagebox.showwarning("Advertencia", f"La URL no tiene el tag '{tag}'")
-                conn.close()
+        
+        url_ids = list(self.selected_url_ids)
+        tag_names = {self.clean_tag_name(name) for name in self.selected_tags}
+        
+        def remove_tags(conn):
+            with conn:
+                tag_ids = self.resolve_tag_ids(conn, tag_names)
+                cursor = conn.executemany('DELETE FROM url_tags WHERE url_id = ? AND tag_id = ?',
+                                 [(url_id, tag_id) for url_id in url_ids for tag_id in tag_ids.values()])
+                changed = cursor.rowcount
+            return sorted(tag_ids), changed, sorted(tag_names - set(tag_ids))
+        
+        def on_removed(result):
+            if isinstance(result, Exception):
+                messagebox.showerror("Error", f"Error al remover tags: {str(result)}")
                 return
-                
-        conn.commit()
-        conn.close()
+            applied, changed, missing = result
+            self.show_tags_summary("removidos", applied, len(url_ids), changed, missing)
         
-        messagebox.showinfo("Éxito", "Tags removidos correctamente")
-        self.update_tag_visualization(self.selected_url_id)  # Refrescar la visualización
+        self.db.submit(remove_tags, on_removed)
+
+    def show_tags_summary(self, action, applied, url_count, changed, missing):
+        """Mostrar un único mensaje con el resultado de agregar o remover tags
+        
+        Args:
+            action: "agregados" o "removidos"
+            applied: Nombres de los tags que existen y se han procesado
+            url_count: Número de URLs seleccionadas
+            changed: Número de asociaciones URL-tag creadas o borradas
+            missing: Nombres de tags que no existen en la base de datos
+        """
+        urls_text = "1 URL" if url_count == 1 else f"{url_count} URLs"
+        lines = [f"Tags {action} en {urls_text}: {', '.join(applied) if applied else 'ninguno'}",
+                 f"Asociaciones {'nuevas' if action == 'agregados' else 'borradas'}: {changed}"]
+        unchanged = url_count * len(applied) - changed
+        if unchanged:
+            lines.append(f"Sin cambios (la URL {'ya tenía' if action == 'agregados' else 'no tenía'} el tag): {unchanged}")
+        if missing:
+            lines.append(f"No existen: {', '.join(missing)}")
+        
+        if changed:
+            messagebox.showinfo("Éxito", "\n".join(lines))
+        else:
+            messagebox.showwarning("Advertencia", "\n".join(lines))
+        
+        if self.selected_url_ids:
+            self.update_tag_visualization(self.selected_url_ids)  # Refrescar la visualización
         self.selected_tags.clear()
         self.update_buttons()
 
-    def add_selected_tags(self):
-        """Agregar los tags seleccionados a la URL"""
-        if not self.selected_url_id:
-            messagebox.showwarning("Advertencia", "Por favor, seleccione una URL")
-            return
-            
-        if not self.selected_tags:
-            messagebox.showwarning("Advertencia", "Por favor, seleccione al menos un tag")
-            return
-            
-        conn = self.create_connection()
-        try:
-            cursor = conn.cursor()
-            
-            for tag in self.selected_tags:
-                # Obtener el ID del tag
-                tag_id = self.get_tag_id(tag)
-                if not tag_id:
-                    messagebox.showerror("Error", f"El tag '{tag}' no existe")
-                    conn.close()
-                    return
-                    
-                # Verificar si la asociación ya existe
-                cursor.execute('SELECT 1 FROM url_tags WHERE url_id = ? AND tag_id = ?', (self.selected_url_id, tag_id))
-                if cursor.fetchone():
-                    messagebox.showwarning("Advertencia", f"La URL ya tiene el tag '{tag}'")
-                    conn.close()
-                    return
-                    
-                # Crear la asociación
-                cursor.execute('INSERT INTO url_tags (url_id, tag_id) VALUES (?, ?)', (self.selected_url_id, tag_id))
-            
-            conn.commit()
-            messagebox.showinfo("Éxito", "Tags agregados correctamente")
-            self.update_tag_visualization(self.selected_url_id)  # Refrescar la visualización
-            self.selected_tags.clear()
-            self.update_buttons()
-            
-        except sqlite3.Error as e:
-            messagebox.showerror("Error", f"Error al agregar tags: {str(e)}")
-            conn.rollback()
-        finally:
-            conn.close()
-
     def get_db_path(self):
         """Obtiene la ruta de la base de datos"""
-        db_path = Path(user_log_dir("alterclip")) / "streaming_history.db"
+        db_path = Path(os.getenv("ALTERCLIP_DB", Path(user_log_dir("alterclip")) / "streaming_history.db"))
         # Asegurarse de que el directorio exista
         db_path.parent.mkdir(parents=True, exist_ok=True)
         return db_path
 
-    def create_connection(self):
-        """Crea una conexión a la base de datos"""
-        conn = sqlite3.connect(str(self.get_db_path()))
-        return conn
-
-    def get_tag_id(self, tag_name):
-        """Obtiene el ID de un tag por su nombre"""
-        # Limpiar el nombre del tag eliminando prefijos como '└─ '
+    def clean_tag_name(self, tag_name):
+        """Limpia el nombre del tag eliminando prefijos como '└─ '"""
         clean_tag_name = tag_name.strip()
         if clean_tag_name.startswith('└─ '):
             clean_tag_name = clean_tag_name[3:].strip()
-        
-        conn = self.create_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id FROM tags WHERE name = ?', (clean_tag_name,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else None
+        return clean_tag_name
 
-    def get_url_tags(self, url_id):
-        """Obtener los tags asociados a una URL"""
-        conn = self.create_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT t.name
-                FROM tags t
-                JOIN url_tags ut ON t.id = ut.tag_id
-                WHERE ut.url_id = ?
-            ''', (url_id,))
-            
-            # Obtener los nombres de los tags
-            return {row[0] for row in cursor.fetchall()}
-            
-        except sqlite3.Error as e:
-            print(f"Error al obtener tags de URL: {str(e)}")
-            return set()
-        finally:
-            conn.close()
+    def resolve_tag_ids(self, conn, tag_names):
+        """Obtiene los IDs de varios tags por su nombre (ya limpio) con una sola consulta"""
+        if not tag_names:
+            return {}
+        placeholders = ','.join(['?'] * len(tag_names))
+        cursor = conn.execute(f'SELECT name, id FROM tags WHERE name IN ({placeholders})',
+                              list(tag_names))
+        return dict(cursor.fetchall())
+
+    def get_urls_tags(self, conn, url_ids):
+        """Obtener los tags de varias URLs con una sola consulta
 
-    def get_tag_hierarchy(self):
+        Returns:
+            dict: {url_id: set de nombres de tags}, con todas las URLs pedidas
+        """
+        tags_by_url = {url_id: set() for url_id in url_ids}
+        cursor = conn.execute('''
+            SELECT ut.url_id, t.name
+            FROM url_tags ut
+            JOIN tags t ON t.id = ut.tag_id
+            WHERE ut.url_id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(list(url_ids)),))
+        for url_id, name in cursor:
+            tags_by_url[url_id].add(name)
+        return tags_by_url
+
+    def get_tag_hierarchy(self, conn):
         """Obtiene la jerarquía de tags desde la base de datos"""
-        conn = self.create_connection()
-        try:
-            cursor = conn.cursor()
-            
-            # Obtener todos los tags y sus relaciones
-            cursor.execute('''
-                SELECT t1.id, t1.name, th.parent_id
-                FROM tags t1
-                LEFT JOIN tag_hierarchy th ON t1.id = th.child_id
-            ''')
-            
-            # Crear la estructura jerárquica
-            def build_hierarchy(tags):
-                # Primero, obtener todos los tags raíz (sin padre)
-                roots = [tag for tag in tags if tag[2] is None]
-                
-                # Función auxiliar para obtener hijos directos
-                def get_children(tags, parent_id):
-                    return [tag for tag in tags if tag[2] == parent_id]
-                
-                # Función recursiva para construir la jerarquía
-                def build_tree(tag_id):
-                    children = get_children(tags, tag_id)
-                    return [{
-                        'id': child[0],
-                        'name': child[1],
-                        'children': build_tree(child[0]) if child[0] != tag_id else []
-                    } for child in children]
-                
-                # Construir la jerarquía a partir de las raíces
-                return [{
-                    'id': root[0],
-                    'name': root[1],
-                    'children': build_tree(root[0])
-                } for root in roots]
-            
-            tags = cursor.fetchall()
-            return build_hierarchy(tags)
-            
-        except sqlite3.Error as e:
-            print(f"Error al obtener jerarquía de tags: {str(e)}")
-            messagebox.showerror("Error", f"Error al obtener jerarquía de tags: {str(e)}")
-            return []
-        finally:
-            conn.close()
+        # Obtener todos los tags y sus relaciones
+        cursor = conn.execute('''
+            SELECT t1.id, t1.name, th.parent_id
+            FROM tags t1
+            LEFT JOIN tag_hierarchy th ON t1.id = th.child_id
+            ORDER BY t1.name
+        ''')
+        tags = cursor.fetchall()
+        
+        # Agrupar los hijos por padre en una sola pasada
+        nodes = {}
+        children = {}
+        roots = []
+        for tag_id, name, parent_id in tags:
+            nodes[tag_id] = name
+            if parent_id is None:
+                roots.append(tag_id)
+            else:
+                children.setdefault(parent_id, []).append(tag_id)
+        
+        # Construir el árbol; `path` evita bucles si la jerarquía tiene ciclos
+        def build_tree(tag_id, path):
+            path = path | {tag_id}
+            return {
+                'id': tag_id,
+                'name': nodes[tag_id],
+                'children': [build_tree(child_id, path)
+                             for child_id in children.get(tag_id, [])
+                             if child_id not in path],
+            }
+        
+        return [build_tree(root_id, frozenset()) for root_id in roots]
 
     def load_urls(self):
-        """Cargar las URLs y sus tags en la lista"""
-        conn = self.create_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT sh.id, sh.title, sh.platform
-                FROM streaming_history sh
-                ORDER BY sh.timestamp DESC
-            ''')
-            
-            # Limpiar la lista actual
-            for item in self.urls_list.get_children():
-                self.urls_list.delete(item)
-            
-            # Insertar los nuevos datos
-            for row in cursor.fetchall():
-                url_id = row[0]
-                title = row[1]
-                platform = row[2]
-                self.urls_list.insert('', 'end', values=(url_id, title, platform))
-            
-        except sqlite3.Error as e:
-            print(f"Error al cargar URLs: {str(e)}")
-            messagebox.showerror("Error", f"Error al cargar URLs: {str(e)}")
-        finally:
-            conn.close()
+        """Empezar a cargar las URLs desde el principio
 
-    def load_tags(self):
-        """Cargar los tags en la lista"""
-        try:
-            # Establecer bandera de carga
-            self.loading_initial = True
-            
-            # Obtener la jerarquía de tags
-            tags = self.get_tag_hierarchy()
-            
-            # Limpiar la lista actual
-            for item in self.tags_list.get_children():
-                self.tags_list.delete(item)
-            
-            # Insertar los tags con su jerarquía
-            self._insert_tags_recursive(tags)
-            
-            # Expandir todos los tags que tienen hijos
-            for item in self.tags_list.get_children():
-                self.tags_list.item(item, open=True)
-            
-            # Deshabilitar la expansión de nodos
-            for item in self.tags_list.get_children():
-                self.tags_list.item(item, open=True, tags=('no_expand',))
-            
-            # No llamamos a update_tag_visualization aquí porque no hay URL seleccionada
-            print("Tags cargados exitosamente")  # Debug
+        Primero se muestra el número total de URLs y después se van leyendo
+        páginas de URLS_PAGE_SIZE filas a medida que el usuario se desplaza.
+        Las consultas se hacen en el hilo de base de datos para no bloquear la
+        interfaz, y en el Treeview solo se insertan las filas que se van a ver.
+        """
+        # Los resultados de cargas anteriores que sigan en vuelo se descartan
+        self.urls_generation += 1
+        generation = self.urls_generation
+        
+        self.urls_total = None
+        self.urls_cursor = None
+        self.urls_exhausted = False
+        self.urls_loading = False
+        self.url_info = {}
+        self.url_order = []
+        self.search_keys = {}
+        self.render_pending = True
+        self.apply_search()
+        
+        def on_count(result):
+            if generation != self.urls_generation:
+                return
+            if isinstance(result, Exception):
+                print(f"Error al contar URLs: {str(result)}")
+                return
+            self.urls_total = result
+            self.update_urls_title()
+        
+        self.db.submit(self.count_urls, on_count)
+        self.load_more_urls()
+
+    def load_more_urls(self):
+        """Pedir la siguiente página de URLs si no hay otra en camino"""
+        if self.urls_loading or self.urls_exhausted:
+            return
+        self.urls_loading = True
+        generation = self.urls_generation
+        cursor_position = self.urls_cursor
+        
+        self.db.submit(lambda conn: self.fetch_urls_page(conn, cursor_position),
+                       lambda result: self.on_urls_page(generation, result))
+
+    def count_urls(self, conn):
+        """Número total de URLs del historial"""
+        return conn.execute('SELECT COUNT(*) FROM streaming_history').fetchone()[0]
+
+    def fetch_urls_page(self, conn, cursor_position):
+        """Lee la página de URLs siguiente a `cursor_position` (timestamp, id)"""
+        # Paginación por clave (timestamp, id): cada página cuesta lo mismo
+        # independientemente de lo lejos que esté en el historial
+        where = ''
+        params = []
+        if cursor_position is not None:
+            timestamp, url_id = cursor_position
+            where = 'WHERE sh.timestamp < ? OR (sh.timestamp = ? AND sh.id < ?)'
+            params = [timestamp, timestamp, url_id]
+        return conn.execute(f'''
+            SELECT sh.id, sh.title, sh.platform, sh.timestamp,
+                   (SELECT GROUP_CONCAT(t.name, ' ')
+                    FROM url_tags ut JOIN tags t ON t.id = ut.tag_id
+                    WHERE ut.url_id = sh.id) AS tags
+            FROM streaming_history sh
+            {where}
+            ORDER BY sh.timestamp DESC, sh.id DESC
+            LIMIT ?
+        ''', params + [URLS_PAGE_SIZE]).fetchall()
+
+    def remember_urls(self, rows):
+        """Guardar en memoria las URLs recibidas y su clave de búsqueda"""
+        for url_id, title, platform, _, tags in rows:
+            self.url_info[url_id] = (title, platform)
+            self.search_keys[url_id] = remove_accents(f"{title or ''} {platform or ''} {tags or ''}")
+
+    def on_urls_page(self, generation, rows):
+        """Añadir a la lista una página de URLs recibida del hilo de base de datos"""
+        if generation != self.urls_generation:
+            return
+        self.urls_loading = False
+        
+        if isinstance(rows, Exception):
+            print(f"Error al cargar URLs: {str(rows)}")
+            messagebox.showerror("Error", f"Error al cargar URLs: {str(rows)}")
+            return
+        
+        self.remember_urls(rows)
+        new_ids = [row[0] for row in rows]
+        self.url_order.extend(new_ids)
+        if len(rows) < URLS_PAGE_SIZE:
+            self.urls_exhausted = True
+        else:
+            self.urls_cursor = (rows[-1][3], rows[-1][0])
+        
+        # Con un filtro en memoria activo, las URLs nuevas que coinciden se
+        # añaden al final de la lista visible
+        if self.search_query and not self.search_in_db:
+            self.view.extend(self.filter_ids(new_ids, self.search_query.split()))
+        
+        if self.render_pending:
+            self.render_pending = False
+            self.render_more()
+        self.update_urls_title()
+
+    def render_more(self):
+        """Insertar en el Treeview el siguiente bloque de la lista visible
+
+        Si ya está todo insertado y quedan páginas por leer, se pide la
+        siguiente y el bloque se inserta cuando llegue.
+        """
+        chunk = self.view[self.view_rendered:self.view_rendered + URLS_RENDER_CHUNK]
+        for url_id in chunk:
+            title, platform = self.url_info[url_id]
+            self.urls_list.insert('', 'end', values=(url_id, title, platform))
+        self.view_rendered += len(chunk)
+        
+        if not chunk and not self.search_in_db and not self.urls_exhausted:
+            self.render_pending = True
+            self.load_more_urls()
+
+    def on_urls_scroll(self, first, last):
+        """Actualizar la barra de desplazamiento y mostrar más URLs cerca del final"""
+        self.urls_scroll.set(first, last)
+        if float(last) >= URLS_LOAD_AHEAD:
+            self.render_more()
+
+    def filter_ids(self, ids, terms):
+        """Devuelve los ids cuya clave de búsqueda contiene todos los términos"""
+        keys = self.search_keys
+        for term in terms:
+            ids = [url_id for url_id in ids if term in keys[url_id]]
+        return ids
+
+    def on_search_changed(self, *args):
+        """Programar el filtrado tras una breve pausa en la escritura"""
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.apply_search)
+
+    def apply_search(self):
+        """Filtrar la lista de URLs con el texto de la caja de búsqueda
+
+        Si el historial está cargado entero (o se ha desactivado la búsqueda
+        en la base de datos) se filtra en memoria; al ampliar la búsqueda
+        anterior solo se recorren sus resultados. Si no, la consulta se hace en
+        SQLite con la misma normalización sin acentos.
+        """
+        self.search_after_id = None
+        query = remove_accents(self.search_var.get()).strip()
+        terms = query.split()
+        previous_query = self.search_query if not self.search_in_db else ''
+        self.search_query = query
+        self.search_generation += 1
+        
+        if not terms:
+            self.search_in_db = False
+            self.show_view(self.url_order)
+        elif self.urls_exhausted or not self.search_db_var.get():
+            self.search_in_db = False
+            base = self.view if previous_query and query.startswith(previous_query) else self.url_order
+            self.show_view(self.filter_ids(base, terms))
+        else:
+            self.search_in_db = True
+            self.search_database(terms)
+
+    def search_database(self, terms):
+        """Buscar en SQLite las URLs que contienen todos los términos"""
+        generation = self.search_generation
+        
+        def on_results(rows):
+            if generation != self.search_generation:
+                return
+            if isinstance(rows, Exception):
+                print(f"Error al buscar URLs: {str(rows)}")
+                return
+            self.remember_urls(rows)
+            self.show_view([row[0] for row in rows])
+        
+        self.db.submit(lambda conn: self.search_urls(conn, terms), on_results)
+
+    def search_urls(self, conn, terms):
+        """URLs cuyo título, plataforma o tags contienen todos los términos"""
+        conditions = ' AND '.join(['key LIKE ?'] * len(terms))
+        return conn.execute(f'''
+            SELECT id, title, platform, timestamp, tags FROM (
+                SELECT sh.id, sh.title, sh.platform, sh.timestamp, tags,
+                       remove_accents(COALESCE(sh.title, '') || ' ' || COALESCE(sh.platform, '')
+                                      || ' ' || COALESCE(tags, '')) AS key
+                FROM (
+                    SELECT sh.*, (SELECT GROUP_CONCAT(t.name, ' ')
+                                  FROM url_tags ut JOIN tags t ON t.id = ut.tag_id
+                                  WHERE ut.url_id = sh.id) AS tags
+                    FROM streaming_history sh
+                ) sh
+            )
+            WHERE {conditions}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        ''', [f"%{term}%" for term in terms] + [SEARCH_DB_LIMIT]).fetchall()
+
+    def show_view(self, ids):
+        """Sustituir la lista visible por los ids indicados"""
+        self.view = ids
+        self.view_rendered = 0
+        self.urls_list.delete(*self.urls_list.get_children())
+        self.render_more()
+        self.update_urls_title()
+
+    def update_urls_title(self):
+        """Mostrar en el marco de la lista cuántas URLs hay, cuántas se han cargado
+        y cuántas coinciden con la búsqueda"""
+        if self.urls_total is None:
+            text = "Historial de URLs"
+        elif len(self.url_order) < self.urls_total and not self.urls_exhausted:
+            text = f"Historial de URLs ({self.urls_total}, cargadas {len(self.url_order)})"
+        else:
+            text = f"Historial de URLs ({self.urls_total})"
+        
+        if self.search_query:
+            if self.search_in_db and len(self.view) >= SEARCH_DB_LIMIT:
+                text += f" - primeras {len(self.view)} coincidencias"
+            else:
+                text += f" - {len(self.view)} coincidencias"
+        self.urls_frame.configure(text=text)
+
+    def load_tags(self, on_loaded=None):
+        """Cargar los tags en la lista
+
+        La jerarquía se lee en el hilo de base de datos; on_loaded, si se
+        indica, se llama cuando el árbol ya está dibujado.
+        """
+        def on_hierarchy(tags):
+            if isinstance(tags, Exception):
+                print(f"Error al cargar tags: {str(tags)}")
+                messagebox.showerror("Error", f"Error al cargar los tags: {str(tags)}")
+                return
+            try:
+                # Establecer bandera de carga
+                self.loading_initial = True
+                
+                # Limpiar la lista actual
+                self.tags_list.delete(*self.tags_list.get_children())
+                self.tag_items = {}
+                self.highlighted_tags = set()
+                
+                # Insertar los tags con su jerarquía
+                self._insert_tags_recursive(tags)
+                
+                # Expandir todos los tags y deshabilitar la expansión de nodos
+                for item in self.tags_list.get_children():
+                    self.tags_list.item(item, open=True, tags=('no_expand',))
+                
+                # Volver a resaltar los tags de la URL seleccionada, si la hay
+                if self.selected_url_ids:
+                    self.update_tag_visualization(self.selected_url_ids)
+            finally:
+                # Restaurar bandera de carga
+                self.loading_initial = False
             
-        except Exception as e:
-            print(f"Error al cargar tags: {str(e)}")
-            messagebox.showerror("Error", f"Error al cargar los tags: {str(e)}")
-        finally:
-            # Restaurar bandera de carga
-            self.loading_initial = False
-            # Asegurarse de que los eventos estén habilitados
-            self.tags_list.bind('<Button-1>', self.on_tree_click)
+            if on_loaded:
+                on_loaded()
+        
+        self.db.submit(self.get_tag_hierarchy, on_hierarchy)
 
     def _insert_tags_recursive(self, tags, parent='', level=0):
-
         """Insertar tags recursivamente manteniendo la jerarquía"""
         for tag in tags:
-            original_name = tag['name']
-            
             # Insertar el tag con el estilo por defecto y el nombre original
             item = self.tags_list.insert(parent, 'end', 
                                         tags=('normal',), 
                                         text=tag['name'])
             
+            # Un tag con varios padres aparece varias veces en el árbol
+            self.tag_items.setdefault(tag['name'], []).append(item)
+            
             if tag['children']:
                 # Expandir los nodos que tienen hijos
                 self._insert_tags_recursive(tag['children'], item, level + 1)
                 self.tags_list.item(item, open=True)
 
-        if self.loading_initial:
-            return
-
-        if not self.selected_url_id:
-            messagebox.showwarning("Advertencia", "Selecciona una URL primero")
-            return
-        
-        if not self.selected_tags:
-            messagebox.showwarning("Advertencia", "Selecciona al menos un tag")
-            return
-        
-        conn = self.create_connection()
+    def on_url_select(self, event):
+        """Manejar la selección de una o varias URLs"""
         try:
-            cursor = conn.cursor()
-            
-            # Eliminar cada tag seleccionado
-            for tag in self.selected_tags:
-                tag_id = self.get_tag_id(tag)
-                if tag_id:
-                    # Eliminar la asociación
-                    cursor.execute('DELETE FROM url_tags WHERE url_id = ? AND tag_id = ?', 
-                                 (self.selected_url_id, tag_id))
-                    
-                    if cursor.rowcount == 0:
-                        messagebox.showwarning("Advertencia", f"La URL no tiene el tag '{tag}'")
-                        continue
+            self.selected_url_ids = tuple(self.urls_list.item(item)['values'][0]
+                                          for item in self.urls_list.selection())
             
-            conn.commit()
+            # Actualizar la visualización de los tags
+            if self.selected_url_ids:
+                self.update_tag_visualization(self.selected_url_ids)
             
-            messagebox.showinfo("Éxito", "Tags removidos correctamente")
-            self.update_tag_visualization(self.selected_url_id)  # Refrescar la visualización
-            self.selected_tags.clear()
+            # Actualizar los botones
             self.update_buttons()
-            
-        except sqlite3.Error as e:
-            conn.rollback()
-            messagebox.showerror("Error", f"Error al remover tags: {str(e)}")
-        finally:
-            conn.close()
+        except Exception as e:
+            print(f"Error al seleccionar URL: {str(e)}")
+            messagebox.showerror("Error", f"Error al seleccionar URL: {str(e)}")
 
-    def on_url_select(self, event):
-        """Manejar la selección de una URL"""
-        selected_item = self.urls_list.selection()
-        if selected_item:
-            item = selected_item[0]
-            try:
-                url_id = self.urls_list.item(item)['values'][0]
-                self.selected_url_id = url_id
-                
-                # Actualizar la visualización de los tags
-                self.update_tag_visualization(url_id)
-                
-                # Actualizar los botones
-                self.update_buttons()
-            except Exception as e:
-                print(f"Error al seleccionar URL: {str(e)}")
-                messagebox.showerror("Error", f"Error al seleccionar URL: {str(e)}")
+    def select_all_urls(self, event=None):
+        """Seleccionar todas las URLs mostradas en la lista"""
+        self.urls_list.selection_set(self.urls_list.get_children())
+        return 'break'
 
     def reload_urls(self):
         """Recargar la lista de URLs"""
         try:
-            # Limpiar la lista actual
-            for item in self.urls_list.get_children():
-                self.urls_list.delete(item)
-            
-            # Cargar las URLs nuevamente
+            # Vuelve a empezar la carga por páginas; el título del marco
+            # muestra el progreso
             self.load_urls()
-            messagebox.showinfo("Éxito", "URLs recargadas correctamente")
         except Exception as e:
             print(f"Error al recargar URLs: {str(e)}")
             messagebox.showerror("Error", f"Error al recargar URLs: {str(e)}")
@@ -481,13 +733,8 @@ class AlterclipGUI:
     def reload_tags(self):
         """Recargar la lista de tags"""
         try:
-            # Limpiar la lista actual
-            for item in self.tags_list.get_children():
-                self.tags_list.delete(item)
-            
-            # Cargar los tags nuevamente
-            self.load_tags()
-            messagebox.showinfo("Éxito", "Tags recargados correctamente")
+            # Cargar los tags nuevamente (load_tags limpia la lista al recibirlos)
+            self.load_tags(on_loaded=lambda: messagebox.showinfo("Éxito", "Tags recargados correctamente"))
         except Exception as e:
             print(f"Error al recargar tags: {str(e)}")
             messagebox.showerror("Error", f"Error al recargar tags: {str(e)}")
@@ -521,7 +768,7 @@ class AlterclipGUI:
             # Obtener el nombre del tag (usando text en lugar de values)
             tag = item['text']
             
-            if not self.selected_url_id:
+            if not self.selected_url_ids:
                 messagebox.showwarning("Advertencia", "Selecciona una URL primero")
                 return
             
@@ -533,55 +780,50 @@ class AlterclipGUI:
             
             self.update_buttons()
 
-    def update_tag_visualization(self, url_id):
-        """Actualizar la visualización de los tags según su asociación con la URL"""
-        # Configurar el estilo para los tags asociados
-        self.tags_list.tag_configure('associated', foreground='red')
-        
-        # Obtener los tags asociados
-        associated_tags = self.get_url_tags(url_id)
-        print(f"Tags asociados obtenidos: {associated_tags}")  # Debug
-        
-        # Limpiar todos los estilos actuales
-        for item in self.tags_list.get_children():
-            self.tags_list.item(item, tags=('normal',))
-            for child in self.tags_list.get_children(item):
-                self.tags_list.item(child, tags=('normal',))
-        
-        # Función auxiliar para recorrer todos los items recursivamente
-        def process_item(item_id):
-            # Obtener el nombre del tag (usando text en lugar de values)
-            tag_name = self.tags_list.item(item_id)['text']
-            print(f"Comparando tag: {tag_name} con tags asociados")  # Debug
+    def update_tag_visualization(self, url_ids):
+        """Resaltar los tags que tienen todas las URLs seleccionadas
+
+        Solo se cambia el estilo de los tags cuya asociación difiere de la
+        selección mostrada anteriormente, usando el índice nombre -> items del
+        árbol.
+        """
+        def on_tags(tags_by_url):
+            if isinstance(tags_by_url, Exception):
+                print(f"Error al obtener tags de URL: {str(tags_by_url)}")
+                return
+            # Si mientras tanto ha cambiado la selección, esta respuesta sobra
+            if url_ids != self.selected_url_ids:
+                return
             
-            # Verificar si el tag está en la lista de tags asociados
-            if tag_name in associated_tags:
-                print(f"¡Encontrado! Tag {tag_name} está en los asociados")  # Debug
-                # Aplicar el estilo asociado
-                self.tags_list.item(item_id, tags=('associated',))
+            # Mantener al día las claves de búsqueda de las URLs
+            for url_id, tags in tags_by_url.items():
+                if url_id in self.url_info:
+                    title, platform = self.url_info[url_id]
+                    self.search_keys[url_id] = remove_accents(
+                        f"{title or ''} {platform or ''} {' '.join(tags)}")
             
-            # Procesar los hijos
-            children = self.tags_list.get_children(item_id)
-            for child in children:
-                process_item(child)
-        
-        # Iniciar el procesamiento desde la raíz
-        root_items = self.tags_list.get_children()
-        for item in root_items:
-            process_item(item)
-        
-        # Expandir todos los tags que tienen hijos
-        for item in self.tags_list.get_children():
-            self.tags_list.item(item, open=True)
+            associated_tags = set.intersection(*tags_by_url.values())
+            for tag_name in self.highlighted_tags ^ associated_tags:
+                style = ('associated',) if tag_name in associated_tags else ('normal',)
+                for item in self.tag_items.get(tag_name, ()):
+                    self.tags_list.item(item, tags=style)
+            
+            self.highlighted_tags = associated_tags
         
-        print("Visualización de tags actualizada")  # Debug
+        self.db.submit(lambda conn: self.get_urls_tags(conn, url_ids), on_tags)
 
     def update_buttons(self):
         """Actualizar el estado de los botones"""
-        self.add_button['state'] = 'normal' if self.selected_url_id and self.selected_tags else 'disabled'
-        self.remove_button['state'] = 'normal' if self.selected_url_id and self.selected_tags else 'disabled'
+        self.add_button['state'] = 'normal' if self.selected_url_ids and self.selected_tags else 'disabled'
+        self.remove_button['state'] = 'normal' if self.selected_url_ids and self.selected_tags else 'disabled'
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Interfaz gráfica para etiquetar el historial de alterclip')
+    parser.add_argument('--profile', action='store_true',
+                        help='Registra las consultas SQL y guarda un perfil de cProfile al salir (ver ALTERCLIP_PROFILE)')
+    args = parser.parse_args()
+    profiling.enable("gui", args.profile)
+
     root = tk.Tk()
     app = AlterclipGUI(root)
     root.mainloop()
@@ -16,6 +16,7 @@
 # with this program. If not, see <https://www.gnu.org/licenses/>. 
 #
 
+import argparse
 import pyperclip
 import time
 import os
@@ -33,7 +34,14 @@ from typing import Optional
 import shlex
 import requests
 import re
-from urllib.parse import urlparse, urlunparse, parse_qs
+import hashlib
+import json
+import math
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urlunparse
+from alterclip_urls import canonical_key, ensure_canonical_key, fill_canonical_keys, get_content_title
+import alterclip_profile as profiling
 
 # Constantes
 REPRODUCTOR_VIDEO = os.getenv("ALTERCLIP_PLAYER", "mpv")
@@ -44,11 +52,216 @@ SIGNAL_STREAMING = signal.SIGUSR1
 SIGNAL_OFFLINE = signal.SIGUSR2
 UDP_PORT = 12345
 
+# URLs recientes cuyo id y título se guardan en memoria
+RECENT_URLS_SIZE = int(os.getenv("ALTERCLIP_RECENT_URLS", "512"))
+
+# Tasa de falsos positivos del filtro Bloom y capacidad mínima; se
+# dimensiona para el doble de URLs que haya al arrancar
+BLOOM_ERROR_RATE = 0.01
+BLOOM_MIN_CAPACITY = 10000
+
+# Cada cuántos segundos se escriben en el log los aciertos de la caché de URLs
+CACHE_STATS_INTERVAL = 3600
+
+# URLs dentro de un texto cualquiera. Los signos finales se recortan
+# después (ver recortar_url), para no volver a recorrer el texto
+URL_RE = re.compile(r'https?://[^\s<>"\'`\[\]{}|\\^]+')
+URL_TRAILING = '.,;:!?\'")'
+
+# Títulos que se consultan a la vez al capturar varias URLs nuevas
+TITLE_WORKERS = 4
+
+def recortar_url(url: str) -> str:
+    """Quita la puntuación que sigue a una URL en un texto
+
+    Los paréntesis de cierre solo se quitan si no tienen su pareja dentro de
+    la URL, como en los enlaces de Markdown o en "(ver https://...)".
+    """
+    fin = len(url)
+    sobrantes = url.count(')') - url.count('(')
+    while fin and url[fin - 1] in URL_TRAILING:
+        if url[fin - 1] == ')':
+            if sobrantes <= 0:
+                break
+            sobrantes -= 1
+        fin -= 1
+    return url[:fin]
+
+class FiltroBloom:
+    """Conjunto aproximado: puede dar falsos positivos, nunca falsos negativos"""
+
+    def __init__(self, capacidad: int, tasa_error: float = BLOOM_ERROR_RATE):
+        self.capacidad = capacidad
+        self.bits_totales = max(8, int(-capacidad * math.log(tasa_error) / math.log(2) ** 2))
+        self.funciones = max(1, round(self.bits_totales / capacidad * math.log(2)))
+        self.bits = bytearray((self.bits_totales + 7) // 8)
+        self.elementos = 0
+
+    def _posiciones(self, clave: str):
+        # Doble hash: las k posiciones salen de dos mitades de un único resumen
+        resumen = hashlib.blake2b(clave.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(resumen[:8], 'little')
+        h2 = int.from_bytes(resumen[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits_totales for i in range(self.funciones)]
+
+    def añadir(self, clave: str) -> None:
+        for posicion in self._posiciones(clave):
+            self.bits[posicion >> 3] |= 1 << (posicion & 7)
+        self.elementos += 1
+
+    def __contains__(self, clave: str) -> bool:
+        return all(self.bits[posicion >> 3] & (1 << (posicion & 7)) for posicion in self._posiciones(clave))
+
+
+class CacheURLs:
+    """URLs del historial conocidas por el demonio
+
+    Un filtro Bloom con las claves canónicas de todo el historial descarta
+    sin consultar la base de datos las URLs que nunca se han guardado, y una
+    LRU de las últimas URLs vistas devuelve su id y título sin consultarla
+    tampoco. Si otro programa modifica la base de datos (lo indica
+    `PRAGMA data_version`), las URLs nuevas se añaden al filtro y la LRU se
+    vacía, por si se ha borrado alguna.
+    """
+
+    def __init__(self, db_path: Path, tamaño: int = RECENT_URLS_SIZE):
+        self.db_path = db_path
+        self.tamaño = tamaño
+        self.conn = None
+        self.bloom = None
+        self.recientes = OrderedDict()
+        self.ultimo_id = 0
+        self.version = None
+        self._reiniciar_estadisticas()
+
+    def _reiniciar_estadisticas(self):
+        self.inicio_estadisticas = time.monotonic()
+        self.busquedas = 0
+        self.aciertos_lru = 0
+        self.descartes_bloom = 0
+        self.consultas_db = 0
+        self.falsos_positivos = 0
+
+    def cargar(self) -> None:
+        """Construye el filtro Bloom con todas las claves del historial"""
+        inicio = time.monotonic()
+        if self.conn is None:
+            self.conn = profiling.connect(self.db_path)
+        fill_canonical_keys(self.conn)
+        total, self.ultimo_id = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM streaming_history").fetchone()
+        self.bloom = FiltroBloom(max(2 * total, BLOOM_MIN_CAPACITY))
+        for (clave,) in self.conn.execute("SELECT canonical_key FROM streaming_history"):
+            self.bloom.añadir(clave)
+        self.recientes.clear()
+        self.version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        logging.info("Filtro Bloom cargado con %d URLs en %.2f s (%d KiB)",
+                     total, time.monotonic() - inicio, len(self.bloom.bits) // 1024)
+
+    def _sincronizar(self) -> None:
+        """Incorpora los cambios que otros programas hayan hecho en el historial"""
+        if self.bloom is None:
+            self.cargar()
+            return
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.version:
+            return
+        self.version = version
+        self.recientes.clear()
+        fill_canonical_keys(self.conn)
+        for url_id, clave in self.conn.execute(
+                "SELECT id, canonical_key FROM streaming_history WHERE id > ?", (self.ultimo_id,)):
+            self.bloom.añadir(clave)
+            self.ultimo_id = max(self.ultimo_id, url_id)
+        if self.bloom.elementos > self.bloom.capacidad:
+            # Con más elementos de los previstos crecen los falsos positivos
+            self.cargar()
+
+    def _recordar(self, clave: str, entrada: tuple) -> None:
+        self.recientes[clave] = entrada
+        self.recientes.move_to_end(clave)
+        while len(self.recientes) > self.tamaño:
+            self.recientes.popitem(last=False)
+
+    def buscar(self, url: str) -> Optional[tuple]:
+        """Devuelve (id, título) si la URL ya está en el historial, o None"""
+        self._sincronizar()
+        clave = canonical_key(url)
+        self.busquedas += 1
+
+        entrada = self.recientes.get(clave)
+        if entrada is not None:
+            self.recientes.move_to_end(clave)
+            self.aciertos_lru += 1
+            return entrada
+        if clave not in self.bloom:
+            self.descartes_bloom += 1
+            return None
+
+        self.consultas_db += 1
+        entrada = self.conn.execute(
+            "SELECT id, title FROM streaming_history WHERE canonical_key = ? ORDER BY id LIMIT 1",
+            (clave,)).fetchone()
+        if entrada is None:
+            self.falsos_positivos += 1
+            return None
+        self._recordar(clave, tuple(entrada))
+        return self.recientes[clave]
+
+    def insertar(self, url: str, title: str, platform: str) -> int:
+        """Guarda una URL nueva y devuelve su id"""
+        self.insertar_varias([(url, title, platform)])
+        return self.recientes[canonical_key(url)][0]
+
+    def insertar_varias(self, filas: list) -> int:
+        """Guarda en una sola transacción varias URLs nuevas (url, título, plataforma)
+
+        La inserción de cada una se omite si otro programa ha guardado la
+        misma clave mientras tanto, de modo que el filtro nunca provoca
+        duplicados.
+
+        Returns:
+            int: Número de URLs insertadas
+        """
+        claves = [canonical_key(url) for url, _, _ in filas]
+        with self.conn:
+            cursor = self.conn.executemany('''
+                INSERT INTO streaming_history (url, title, platform, canonical_key)
+                SELECT ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM streaming_history WHERE canonical_key = ?)
+            ''', [(url, title, platform, clave, clave) for (url, title, platform), clave in zip(filas, claves)])
+        # MIN(id) hace que el título sea el de la entrada más antigua
+        for url_id, clave, title in self.conn.execute('''
+            SELECT MIN(id), canonical_key, title FROM streaming_history
+            WHERE canonical_key IN (SELECT value FROM json_each(?))
+            GROUP BY canonical_key
+        ''', (json.dumps(claves),)):
+            self.bloom.añadir(clave)
+            self._recordar(clave, (url_id, title))
+            self.ultimo_id = max(self.ultimo_id, url_id)
+        return cursor.rowcount
+
+    def registrar_si_toca(self, forzar: bool = False) -> None:
+        """Escribe en el log cómo se han resuelto las búsquedas y reinicia"""
+        if not forzar and time.monotonic() - self.inicio_estadisticas < CACHE_STATS_INTERVAL:
+            return
+        if self.busquedas:
+            logging.info(
+                "Caché de URLs: %d búsquedas, %.0f%% en la LRU, %.0f%% descartadas por el filtro Bloom, "
+                "%.0f%% consultadas en la base de datos (%d falsos positivos)",
+                self.busquedas, 100 * self.aciertos_lru / self.busquedas,
+                100 * self.descartes_bloom / self.busquedas,
+                100 * self.consultas_db / self.busquedas, self.falsos_positivos
+            )
+        self._reiniciar_estadisticas()
+
+
 class Alterclip:
     def __init__(self):
-        # Inicializar la base de datos
-        self.db_path = Path(user_log_dir("alterclip")) / "streaming_history.db"
+        # Inicializar la base de datos (ALTERCLIP_DB permite usar otra)
+        self.db_path = Path(os.getenv("ALTERCLIP_DB", Path(user_log_dir("alterclip")) / "streaming_history.db"))
         self._initialize_db()
+        self.urls_conocidas = CacheURLs(self.db_path)
         
         self.modo = MODO_OFFLINE
         self.prev_clipboard = ""
@@ -123,21 +336,6 @@ class Alterclip:
         
         return False
 
-    def get_archive_title(self,url):
-        if not url.startswith("https://archive.org/details/"):
-            return None
-        
-        identifier = url.split("/details/")[-1]
-        api_url = f"https://archive.org/metadata/{identifier}"
-        
-        try:
-            response = requests.get(api_url)
-            response.raise_for_status()
-            data = response.json()
-            return data.get("metadata", {}).get("title")
-        except Exception:
-            return None
-
     def reproducir_streaming(self, url: str):
         def reproducir_en_hilo(url):
             try:
@@ -159,39 +357,63 @@ class Alterclip:
     def es_streaming_compatible(self, url: str) -> bool:
         return any(source in url for source in self.streaming_sources)
 
+    def reescribir_url(self, url: str) -> str:
+        """Aplica a una URL los reemplazos de dominio"""
+        #for original, nuevo in self.reemplazos.items():
+        #    if original in cadena:
+        #        return cadena.replace(original, nuevo)
+        # Reemplazos seguros por dominio
+        parsed = urlparse(url)
+        if parsed.netloc in self.reemplazos:
+            nuevo_netloc = self.reemplazos[parsed.netloc]
+            parsed = parsed._replace(netloc=nuevo_netloc)
+            return urlunparse(parsed)
+        return url
+
     def interceptar_cambiar_url(self, cadena: str) -> str:
-        """Intercepta y modifica las URLs según sea necesario"""
-        if '\n' in cadena or not cadena.startswith(('http://', 'https://', 'share.only/')):
-            return cadena
+        """Intercepta y modifica las URLs según sea necesario
 
+        El texto puede ser una URL suelta o cualquier bloque (un chat, Markdown,
+        una lista de enlaces...). Se recorre una sola vez con URL_RE: cada URL
+        encontrada se reescribe, las de streaming se guardan todas juntas al
+        final y el texto se reconstruye uniendo los trozos.
+        """
         # Si es una URL con prefijo share.only/, devolver la URL sin el prefijo
         if cadena.startswith('share.only/'):  # Prefijo para URLs de copia
             return cadena[11:]  # Eliminamos el prefijo share.only/
 
-        if cadena.startswith('https://share.google'):
+        if '://' not in cadena:
+            return cadena
+
+        if cadena.startswith('https://share.google') and not any(c.isspace() for c in cadena):
             return self.resolve_share_google(cadena)
 
+        partes = []
+        streaming = []
+        anterior = 0
+        for coincidencia in URL_RE.finditer(cadena):
+            url = recortar_url(coincidencia.group())
+            inicio = coincidencia.start()
+            partes.append(cadena[anterior:inicio])
+            partes.append(self.reescribir_url(url))
+            anterior = inicio + len(url)
+            if self.es_streaming_compatible(url):
+                streaming.append(url)
+        if not partes:
+            return cadena
+        partes.append(cadena[anterior:])
+
         # Si es una URL de streaming, la guardamos en la base de datos
-        if self.es_streaming_compatible(cadena):
-            self._save_streaming_url(cadena)
+        if streaming:
+            self._save_streaming_urls(streaming)
             
-            # Solo reproducimos si estamos en modo streaming
-            if self.modo == MODO_STREAMING:
-                self.reproducir_streaming(cadena)
+            # Solo reproducimos si estamos en modo streaming y se ha copiado
+            # únicamente la URL
+            if self.modo == MODO_STREAMING and cadena.strip() == streaming[0]:
+                self.reproducir_streaming(streaming[0])
                 return cadena
 
-        # Si no es streaming ni de copia, aplicamos los reemplazos normales
-        #for original, nuevo in self.reemplazos.items():
-        #    if original in cadena:
-        #        return cadena.replace(original, nuevo)
-        # Reemplazos seguros por dominio
-        parsed = urlparse(cadena)
-        if parsed.netloc in self.reemplazos:
-            nuevo_netloc = self.reemplazos[parsed.netloc]
-            parsed = parsed._replace(netloc=nuevo_netloc)
-            return urlunparse(parsed)
-
-        return cadena
+        return ''.join(partes)
 
     def udp_server(self):
         estados = {
@@ -220,7 +442,7 @@ class Alterclip:
         """Inicializa la base de datos y crea la tabla si no existe"""
         try:
             self.db_path.parent.mkdir(parents=True, exist_ok=True)
-            conn = sqlite3.connect(self.db_path)
+            conn = profiling.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS streaming_history (
@@ -279,94 +501,19 @@ class Alterclip:
             ''')
             
             conn.commit()
+            # Clave canónica para reconocer el mismo vídeo con distintas URLs
+            ensure_canonical_key(conn)
             conn.close()
         except Exception as e:
             logging.error(f"Error al inicializar la base de datos: {e}")
 
-    def _get_content_title(self, url: str) -> tuple[str, str]:
-        """Obtiene el título del contenido y la plataforma"""
-        try:
-            # Determinar la plataforma
-            if 'youtube.com' in url or 'youtu.be' in url:
-                platform = 'YouTube'
-                # Para YouTube, usamos la API o parseamos el título del HTML
-                try:
-                    # Intentar usar la API de YouTube
-                    youtube_api_key = os.getenv('YOUTUBE_API_KEY')
-                    if youtube_api_key:
-                        video_id = self._extract_youtube_id(url)
-                        if video_id:
-                            api_url = f'https://www.googleapis.com/youtube/v3/videos?id={video_id}&key={youtube_api_key}&part=snippet'
-                            response = requests.get(api_url)
-                            data = response.json()
-                            if 'items' in data and data['items']:
-                                return data['items'][0]['snippet']['title'], platform
-                except:
-                    pass
-                
-                # Si falla la API, parseamos el HTML
-                response = requests.get(url)
-                title_match = re.search(r'<title>(.*?)</title>', response.text)
-                if title_match:
-                    title = title_match.group(1).split(' - ')[0]
-                    return title, platform
-
-            elif 'instagram.com' in url:
-                platform = 'Instagram'
-                response = requests.get(url)
-                title_match = re.search(r'"description" content="(.*?)"', response.text)
-                if title_match:
-                    return title_match.group(1), platform
-
-            elif 'facebook.com' in url or 'fb.watch' in url:
-                platform = 'Facebook'
-                try:
-                    # Intentar obtener el título usando metadatos Open Graph
-                    response = requests.get(url)
-                    # Buscar el título usando diferentes patrones
-                    title_match = re.search(r'property="og:title" content="(.*?)"', response.text)
-                    if not title_match:
-                        title_match = re.search(r'"title" content="(.*?)"', response.text)
-                    if not title_match:
-                        title_match = re.search(r'<title>(.*?)</title>', response.text)
-                    
-                    if title_match:
-                        title = title_match.group(1).strip()
-                        # Eliminar el sufijo " | Facebook" si existe
-                        title = title.replace(' | Facebook', '').strip()
-                        return title, platform
-                except Exception as e:
-                    logging.error(f"Error al obtener título de Facebook: {e}")
-                    return "Título no disponible", platform
-            elif 'archive.org' in url:
-                platform = 'Archive.org'
-                title = self.get_archive_title(url)
-                if title:
-                    return title, platform
-
-            return "Título no disponible", "Desconocido"
-        except Exception as e:
-            logging.error(f"Error al obtener título: {e}")
-            return "Título no disponible", "Desconocido"
-
-    def _extract_youtube_id(self, url: str) -> str:
-        """Extrae el ID de video de una URL de YouTube"""
-        try:
-            if 'youtu.be' in url:
-                return url.split('/')[-1]
-            
-            parsed_url = urlparse(url)
-            query_params = parse_qs(parsed_url.query)
-            if 'v' in query_params:
-                return query_params['v'][0]
-            
-            return ''
-        except:
-            return ''
-
     def get_id_by_url(self,url: str) -> int:
         """Obtiene el id de una entrada del historial por su url
         
+        La búsqueda se hace por la clave canónica, de modo que youtu.be/X,
+        youtube.com/watch?v=X&t=30 o m.youtube.com/watch?v=X encuentran la
+        misma entrada.
+        
         Args:
             url: URL de la entrada en streaming_history
             
@@ -374,10 +521,13 @@ class Alterclip:
             int: El id de la entrada o None si no se encuentra
         """
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = profiling.connect(self.db_path)
+            fill_canonical_keys(conn)
             cursor = conn.cursor()
-            cursor.execute('SELECT id FROM streaming_history WHERE url = ?', (url,))
+            cursor.execute('SELECT id FROM streaming_history WHERE canonical_key = ? ORDER BY id LIMIT 1',
+                           (canonical_key(url),))
             result = cursor.fetchone()
+            conn.close()
             
             if not result:
                 #print(f"No se encontró ninguna entrada con url {url}", file=sys.stderr)
@@ -391,25 +541,43 @@ class Alterclip:
 
     def _save_streaming_url(self, url: str):
         """Guarda una URL de streaming en la base de datos"""
+        self._save_streaming_urls([url])
+
+    def _save_streaming_urls(self, urls: list):
+        """Guarda de una vez las URLs de streaming que aún no están en la base de datos"""
         try:
-            title, platform = self._get_content_title(url)
-            id = self.get_id_by_url(url)
-            if id:
-                logging.info(f"URL {url} ya existe en la base de datos con id {id}")
+            nuevas = []
+            claves = set()
+            for url in urls:
+                clave = canonical_key(url)
+                if clave in claves:
+                    continue
+                claves.add(clave)
+                conocida = self.urls_conocidas.buscar(url)
+                if conocida:
+                    logging.info(f"URL {url} ya existe en la base de datos con id {conocida[0]}: {conocida[1]}")
+                else:
+                    nuevas.append(url)
+            if not nuevas:
+                return
+
+            # El título solo se busca para las URLs nuevas, varias a la vez
+            if len(nuevas) == 1:
+                titulos = [get_content_title(nuevas[0])]
             else:
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute('INSERT INTO streaming_history (url, title, platform) VALUES (?, ?, ?)', 
-                            (url, title, platform))
-                conn.commit()
-                conn.close()
+                with ThreadPoolExecutor(max_workers=TITLE_WORKERS) as pool:
+                    titulos = list(pool.map(get_content_title, nuevas))
+            insertadas = self.urls_conocidas.insertar_varias(
+                [(url, title, platform) for url, (title, platform) in zip(nuevas, titulos)])
+            if len(urls) > 1:
+                logging.info(f"{insertadas} URLs de streaming nuevas guardadas de {len(urls)} encontradas en el texto")
         except Exception as e:
             logging.error(f"Error al guardar URL en la base de datos: {e}")
 
     def get_streaming_history(self, limit: int = 10):
         """Obtiene el historial de URLs de streaming"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = profiling.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute('SELECT id, url, timestamp FROM streaming_history ORDER BY timestamp DESC LIMIT ?', (limit,))
             results = cursor.fetchall()
@@ -429,6 +597,8 @@ class Alterclip:
         hilo_udp = threading.Thread(target=self.udp_server, daemon=True)
         hilo_udp.start()
 
+        self.urls_conocidas.cargar()
+
         # Limpiar el portapapeles
         pyperclip.copy("")
 
@@ -449,8 +619,10 @@ class Alterclip:
                         else:
                             self.prev_clipboard = text
 
+                self.urls_conocidas.registrar_si_toca()
                 time.sleep(0.2)
         except KeyboardInterrupt:
+            self.urls_conocidas.registrar_si_toca(forzar=True)
             logging.info("Programa terminado por el usuario.")
 
 
@@ -458,6 +630,11 @@ class Alterclip:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Intercepta URLs del portapapeles y las modifica o reproduce')
+    parser.add_argument('--profile', action='store_true',
+                        help='Registra las consultas SQL y guarda un perfil de cProfile al salir (ver ALTERCLIP_PROFILE)')
+    args = parser.parse_args()
+
     app_name = "alterclip"
     log_dir = Path(user_log_dir(app_name))
     log_dir.mkdir(parents=True, exist_ok=True)
@@ -472,5 +649,6 @@ if __name__ == "__main__":
         ]
     )
 
+    profiling.enable(app_name, args.profile)
     app = Alterclip()
     app.iniciar()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+#
+# Recuentos por facetas del historial de alterclip.
+#
+# Calcula con una sola consulta, para el filtro actual, cuántas URLs tiene
+# cada etiqueta (directamente y sumando sus descendientes sin contar dos
+# veces la misma URL), cuántas hay de cada plataforma y cuántas están vistas
+# o pendientes. Lo usan el CLI (`tag list` y `tag hierarchy`) y la interfaz
+# web.
+#
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Tuple
+
+# Número de combinaciones de filtros cuyos recuentos se guardan en memoria
+FACET_CACHE_SIZE = 32
+
+FACETS_QUERY = """
+    WITH RECURSIVE
+    {filtered_cte},
+    closure(ancestor, descendant) AS (
+        SELECT id, id FROM tags
+        UNION
+        SELECT c.ancestor, th.child_id
+        FROM closure c
+        JOIN tag_hierarchy th ON th.parent_id = c.descendant
+    ),
+    tagged AS (
+        SELECT ut.url_id, ut.tag_id
+        FROM url_tags ut
+        JOIN filtered f ON f.id = ut.url_id
+    )
+    SELECT 'tag', c.ancestor,
+           COUNT(DISTINCT CASE WHEN tg.tag_id = c.ancestor THEN tg.url_id END),
+           COUNT(DISTINCT tg.url_id)
+    FROM closure c
+    JOIN tagged tg ON tg.tag_id = c.descendant
+    GROUP BY c.ancestor
+    UNION ALL
+    SELECT 'platform', platform, COUNT(*), COUNT(*)
+    FROM filtered
+    GROUP BY platform
+    UNION ALL
+    SELECT 'visto', CASE WHEN COALESCE(visto, 0) > 0 THEN 'seen' ELSE 'unseen' END, COUNT(*), COUNT(*)
+    FROM filtered
+    GROUP BY 2
+"""
+
+
+def database_stamp(db_path: Path) -> Tuple[str, float]:
+    """Sello barato que cambia cada vez que se escribe en la base de datos
+
+    Se construye con el tamaño y la fecha de modificación del fichero y de
+    su WAL, así que no hace falta ninguna consulta para saber si los
+    recuentos guardados siguen siendo válidos. Detecta también las
+    escrituras del demonio o del CLI.
+
+    Returns:
+        tuple: (sello, fecha de la última modificación como timestamp)
+    """
+    parts = []
+    last_modified = 0.0
+    for suffix in ('', '-wal'):
+        try:
+            st = os.stat(f"{db_path}{suffix}")
+        except FileNotFoundError:
+            continue
+        parts.append(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+        last_modified = max(last_modified, st.st_mtime)
+    return '.'.join(parts), last_modified
+
+
+def _filtered_cte(search=None, tag=None, platform=None) -> Tuple[str, list]:
+    """Construye la CTE `filtered` con las entradas que cumplen el filtro"""
+    conditions = []
+    params = []
+
+    if tag:
+        # La etiqueta filtra también por todas sus descendientes
+        conditions.append("""sh.id IN (
+            WITH RECURSIVE filter_tags(id) AS (
+                SELECT id FROM tags WHERE name = ?
+                UNION
+                SELECT th.child_id FROM tag_hierarchy th JOIN filter_tags ft ON th.parent_id = ft.id
+            )
+            SELECT ut.url_id FROM url_tags ut JOIN filter_tags ft ON ut.tag_id = ft.id
+        )""")
+        params.append(tag)
+
+    if search:
+        conditions.append("(LOWER(sh.title) LIKE ? OR LOWER(sh.url) LIKE ?)")
+        search_term = f"%{search.lower()}%"
+        params.extend([search_term, search_term])
+
+    if platform:
+        conditions.append("LOWER(sh.platform) = LOWER(?)")
+        params.append(platform)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cte = f"filtered AS (SELECT sh.id, sh.platform, sh.visto FROM streaming_history sh {where})"
+    return cte, params
+
+
+def compute_facets(conn: sqlite3.Connection, search=None, tag=None, platform=None) -> dict:
+    """Calcula los recuentos por facetas con una sola consulta
+
+    Returns:
+        dict: {
+            'tags': {tag_id: {'direct': n, 'total': n}},
+            'platforms': {plataforma: n},
+            'visto': {'seen': n, 'unseen': n},
+            'total': n,
+        }
+        Las etiquetas sin ninguna URL no aparecen en 'tags'.
+    """
+    cte, params = _filtered_cte(search, tag, platform)
+    facets = {'tags': {}, 'platforms': {}, 'visto': {'seen': 0, 'unseen': 0}, 'total': 0}
+
+    for facet, key, direct, total in conn.execute(FACETS_QUERY.format(filtered_cte=cte), params):
+        if facet == 'tag':
+            facets['tags'][key] = {'direct': direct, 'total': total}
+        elif facet == 'platform':
+            facets['platforms'][key] = direct
+        else:
+            facets['visto'][key] = direct
+            facets['total'] += direct
+
+    return facets
+
+
+class FacetService:
+    """Recuentos por facetas con caché hasta que cambie la base de datos
+
+    Args:
+        db_path: Ruta de la base de datos (para el sello de cambios)
+        connect: Función sin argumentos que devuelve un gestor de contexto
+            que entrega una conexión, por ejemplo el pool de la web
+    """
+
+    def __init__(self, db_path: Path, connect):
+        self.db_path = db_path
+        self.connect = connect
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+
+    def get(self, search=None, tag=None, platform=None) -> dict:
+        """Devuelve los recuentos para el filtro indicado"""
+        key = (database_stamp(self.db_path)[0], search or None, tag or None, platform or None)
+        with self.lock:
+            facets = self.cache.get(key)
+            if facets is not None:
+                self.cache.move_to_end(key)
+                return facets
+
+        with self.connect() as conn:
+            facets = compute_facets(conn, search, tag, platform)
+
+        with self.lock:
+            # Los recuentos con un sello antiguo ya no sirven
+            for stale in [k for k in self.cache if k[0] != key[0]]:
+                del self.cache[stale]
+            self.cache[key] = facets
+            while len(self.cache) > FACET_CACHE_SIZE:
+                self.cache.popitem(last=False)
+        return facets
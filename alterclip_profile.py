@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+#
+# Perfilado del demonio, el CLI, la web y la GUI.
+#
+# Se activa con la opción --profile de cada programa o con la variable de
+# entorno ALTERCLIP_PROFILE, que admite una lista separada por comas de:
+#
+#   sql          registra cada sentencia SQL con su duración; las que pasan
+#                de ALTERCLIP_SLOW_QUERY_MS (100 por defecto) se registran
+#                además con su EXPLAIN QUERY PLAN
+#   cprofile     guarda al salir un perfil de cProfile (.prof) de todos los
+#                hilos, legible con pstats o snakeviz
+#   tracemalloc  guarda al salir una instantánea de tracemalloc
+#
+# "1" equivale a sql,cprofile y "all" a las tres. Todo se escribe en
+# ALTERCLIP_PROFILE_DIR (por defecto, el subdirectorio profile del
+# directorio de logs) con el nombre <programa>-<fecha>-<pid>.*, y el
+# registro se muestra también por la salida de errores.
+#
+import atexit
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from platformdirs import user_log_dir
+
+MODES = ('sql', 'cprofile', 'tracemalloc')
+DEFAULT_MODES = ('sql', 'cprofile')
+
+SLOW_QUERY_MS = float(os.getenv("ALTERCLIP_SLOW_QUERY_MS", "100"))
+
+# Longitud máxima de cada sentencia en el registro
+LOG_SQL_LENGTH = 500
+
+# Sentencias trazadas que se guardan por cada ejecución (la consulta y sus disparadores)
+TRACE_LIMIT = 50
+
+# Funciones y líneas que se resumen en el registro al salir
+SUMMARY_LINES = 25
+
+logger = logging.getLogger("alterclip.profile")
+
+_active = set()
+_prefix = None
+_profiles = []
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def parse_modes(value: str) -> set:
+    """Convierte el valor de ALTERCLIP_PROFILE en el conjunto de modos"""
+    value = (value or '').strip().lower()
+    if value in ('', '0', 'false', 'no'):
+        return set()
+    if value in ('1', 'true', 'yes', 'on'):
+        return set(DEFAULT_MODES)
+    if value == 'all':
+        return set(MODES)
+    modes = {mode.strip() for mode in value.split(',') if mode.strip()}
+    unknown = modes - set(MODES)
+    if unknown:
+        raise ValueError(f"Modos de perfilado desconocidos: {', '.join(sorted(unknown))} "
+                         f"(válidos: {', '.join(MODES)}, 1, all)")
+    return modes
+
+
+def enable(name: str, flag: bool = False) -> set:
+    """Activa el perfilado pedido por ALTERCLIP_PROFILE o por --profile
+
+    Se puede llamar varias veces (por ejemplo, al importar y al leer los
+    argumentos); solo se activa lo que aún no lo estaba.
+
+    Args:
+        name: Nombre del programa, usado en los ficheros generados
+        flag: True si se pasó --profile (equivale a ALTERCLIP_PROFILE=1 si
+              la variable no indica otros modos)
+
+    Returns:
+        set: Modos activos
+    """
+    global _prefix
+    modes = parse_modes(os.getenv("ALTERCLIP_PROFILE"))
+    if flag and not modes:
+        modes = set(DEFAULT_MODES)
+    new = modes - _active
+    if not new:
+        return set(_active)
+
+    if _prefix is None:
+        profile_dir = Path(os.getenv("ALTERCLIP_PROFILE_DIR", Path(user_log_dir("alterclip")) / "profile"))
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        _prefix = profile_dir / f"{name}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        formatter = logging.Formatter('%(asctime)s [%(threadName)s] %(message)s')
+        for handler in (logging.FileHandler(f"{_prefix}.log", encoding='utf-8'), logging.StreamHandler()):
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
+        atexit.register(dump)
+        # Para que los perfiles se guarden también al recibir SIGTERM
+        if (threading.current_thread() is threading.main_thread()
+                and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL):
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if 'cprofile' in new:
+        _start_cprofile()
+    if 'tracemalloc' in new and not tracemalloc.is_tracing():
+        tracemalloc.start(10)
+    _active.update(new)
+    logger.info("Perfilado de %s activo: %s (consultas lentas: > %.0f ms, ficheros: %s.*)",
+                name, ', '.join(sorted(_active)), SLOW_QUERY_MS, _prefix)
+    return set(_active)
+
+
+def _start_cprofile() -> None:
+    """Perfila el hilo actual y cada hilo que se cree a partir de ahora"""
+    def profile_thread(frame, event, arg):
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Desde Python 3.12 un solo perfil cubre todos los hilos
+            return
+        _profiles.append(profile)
+
+    profile = cProfile.Profile()
+    profile.enable()
+    _profiles.append(profile)
+    threading.setprofile(profile_thread)
+
+
+def connect(database, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect que registra las sentencias si el modo sql está activo"""
+    if 'sql' in _active:
+        kwargs.setdefault('factory', ProfiledConnection)
+    return sqlite3.connect(database, **kwargs)
+
+
+def _shorten(sql: str) -> str:
+    sql = ' '.join(sql.split())
+    return sql if len(sql) <= LOG_SQL_LENGTH else sql[:LOG_SQL_LENGTH] + '…'
+
+
+def _format_plan(rows) -> str:
+    """Sangra las filas de EXPLAIN QUERY PLAN (id, padre, -, detalle) como un árbol"""
+    depth = {0: 0}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, 0) + 1
+        lines.append(f"{'  ' * depth[node_id]}{detail}")
+    return '\n'.join(lines)
+
+
+def _record(sql: str, elapsed: float) -> None:
+    """Acumula el tiempo de cada sentencia (sin parámetros) para el resumen final"""
+    key = _shorten(sql)
+    with _stats_lock:
+        count, total, worst = _stats.get(key, (0, 0.0, 0.0))
+        _stats[key] = (count + 1, total + elapsed, max(worst, elapsed))
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor que mide cada sentencia desde que se ejecuta hasta que se leen sus filas
+
+    La duración incluye las lecturas con fetch* o iterando, porque SQLite
+    va calculando las filas según se piden. La sentencia se registra al
+    leer la última fila, al ejecutar otra o al liberar el cursor.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._statement = None
+        self._elapsed = 0.0
+
+    def _run(self, method, sql, parameters, many=False):
+        self._finish()
+        traced = self.connection._traced
+        traced.clear()
+        start = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            self._elapsed = time.perf_counter() - start
+            self._statement = (sql, parameters, list(traced), many)
+            if self.description is None:
+                self._finish()
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters, many=True)
+
+    def _timed_fetch(self, method, *args, last=False):
+        start = time.perf_counter()
+        result = method(*args)
+        self._elapsed += time.perf_counter() - start
+        if last or not result:
+            self._finish()
+        return result
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed_fetch(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall, last=True)
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return super().__next__()
+        except StopIteration:
+            self._finish()
+            raise
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _finish(self):
+        statement = getattr(self, '_statement', None)
+        if statement is None:
+            return
+        self._statement = None
+        sql, parameters, traced, many = statement
+        elapsed_ms = self._elapsed * 1000
+        _record(sql, self._elapsed)
+
+        # La primera sentencia trazada es la de la consulta, con los
+        # parámetros sustituidos; el resto son las de los disparadores
+        shown = _shorten(traced[0] if traced and not many else sql)
+        extra = f" (+{len(traced) - 1} en disparadores)" if len(traced) > 1 and not many else ''
+        if many:
+            extra = ' (executemany)'
+        if elapsed_ms < SLOW_QUERY_MS:
+            logger.debug("%8.2f ms  %s%s", elapsed_ms, shown, extra)
+            return
+
+        plan = ''
+        if not many:
+            try:
+                rows = sqlite3.Cursor(self.connection).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+                plan = '\n' + _format_plan(tuple(row) for row in rows)
+            except sqlite3.Error:
+                pass
+        logger.warning("Consulta lenta: %.2f ms  %s%s%s", elapsed_ms, shown, extra, plan)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Conexión cuyos cursores miden las sentencias con ayuda de la traza de SQLite"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._traced = []
+        self.set_trace_callback(self._trace)
+
+    def _trace(self, statement):
+        # Con executemany no hace falta guardar cada fila
+        if len(self._traced) < TRACE_LIMIT:
+            self._traced.append(statement)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        super().commit()
+        elapsed = time.perf_counter() - start
+        _record('COMMIT', elapsed)
+        logger.debug("%8.2f ms  COMMIT", elapsed * 1000)
+
+
+def dump() -> None:
+    """Guarda los perfiles de cProfile y tracemalloc y resume las sentencias SQL"""
+    if _stats:
+        with _stats_lock:
+            stats = sorted(_stats.items(), key=lambda item: item[1][1], reverse=True)
+        total = sum(count for _, (count, _, _) in stats)
+        lines = [f"{count:>7} {spent * 1000:>10.1f} {worst * 1000:>9.1f}  {sql}"
+                 for sql, (count, spent, worst) in stats[:SUMMARY_LINES]]
+        logger.info("%d sentencias SQL en %.1f ms. Las que más tiempo suman:\n"
+                    "  Veces   Total ms   Peor ms  Sentencia\n%s",
+                    total, sum(spent for _, (_, spent, _) in stats) * 1000, '\n'.join(lines))
+
+    # La instantánea se toma antes de procesar los perfiles para no medirlos
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(f"{_prefix}.tracemalloc")
+        current, peak = tracemalloc.get_traced_memory()
+        top = '\n'.join(str(stat) for stat in snapshot.statistics('lineno')[:SUMMARY_LINES])
+        logger.info("Instantánea de tracemalloc guardada en %s.tracemalloc "
+                    "(memoria actual: %.1f MiB, pico: %.1f MiB)\n%s",
+                    _prefix, current / 2**20, peak / 2**20, top)
+
+    if _profiles:
+        stats = None
+        for profile in _profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except (TypeError, ValueError):
+                continue
+        if stats is not None:
+            stats.dump_stats(f"{_prefix}.prof")
+            summary = io.StringIO()
+            stats.stream = summary
+            stats.sort_stats('cumulative').print_stats(SUMMARY_LINES)
+            logger.info("Perfil de cProfile guardado en %s.prof\n%s", _prefix, summary.getvalue())
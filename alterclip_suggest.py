@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+#
+# Sugerencias de etiquetas sin conexión.
+#
+# Aprende de las asociaciones que ya hay en `url_tags`: cada título se
+# convierte en un vector de n-gramas de caracteres (3 y 4 letras, sin
+# acentos ni mayúsculas) repartidos en HASH_DIM posiciones, y cada etiqueta
+# se resume en la suma de los vectores de sus títulos. Para sugerir, se
+# pondera con IDF y se compara el título con el centroide de cada etiqueta
+# por similitud coseno, todo con NumPy y en milisegundos.
+#
+# Las sumas son muy dispersas (unos cientos de posiciones por etiqueta de
+# las HASH_DIM posibles), así que se guardan solo las no nulas, ordenadas
+# por posición: para puntuar un título basta con leer las de sus n-gramas.
+#
+# El modelo se guarda en disco junto con el sello de lo que se entrenó:
+# mayor rowid de `url_tags`, número de filas y un CRC de cada asociación con
+# su título. Si el sello no ha cambiado no se toca nada; si solo hay filas
+# nuevas se añaden de forma incremental, y si se ha borrado alguna
+# asociación, se ha reutilizado su rowid o ha cambiado algún título se
+# vuelve a entrenar desde cero.
+#
+import bisect
+import sqlite3
+import unicodedata
+import zlib
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dependencia opcional
+    np = None
+
+# Número de posiciones de los vectores (los n-gramas se reparten por hash)
+HASH_DIM = 1 << 15
+NGRAM_SIZES = (3, 4)
+MODEL_VERSION = 3
+
+# Cada valor no nulo se identifica por posición << ROW_BITS | fila de la etiqueta
+ROW_BITS = 32
+ROW_MASK = (1 << ROW_BITS) - 1
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin acentos, con los signos convertidos en espacios"""
+    text = ''.join(
+        c for c in unicodedata.normalize('NFD', text or '')
+        if unicodedata.category(c) != 'Mn'
+    ).lower()
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in text).split())
+
+
+def title_features(title: str) -> dict:
+    """Frecuencia de cada posición de hash en los n-gramas del título"""
+    text = f" {fold(title)} "
+    features = {}
+    for n in NGRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            index = zlib.crc32(text[i:i + n].encode('utf-8')) % HASH_DIM
+            features[index] = features.get(index, 0) + 1
+    return features
+
+
+def _checksum(rows, crc: int = 0) -> int:
+    """Continúa el CRC de las filas (rowid, etiqueta, título)"""
+    for rowid, tag_id, title in rows:
+        crc = zlib.crc32(f"{rowid}\t{tag_id}\t{title}\n".encode('utf-8'), crc)
+    return crc
+
+
+class TagSuggester:
+    """Clasificador de títulos por centroides TF-IDF entrenado con `url_tags`
+
+    Args:
+        model_path: Fichero .npz donde se guarda el modelo entre ejecuciones
+    """
+
+    def __init__(self, model_path: Path):
+        if np is None:
+            raise ImportError("Las sugerencias locales necesitan NumPy (pip install numpy)")
+        self.model_path = Path(model_path)
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.tag_ids = []
+        self.tag_index = {}
+        # Sumas de cada etiqueta en formato disperso, ordenadas por clave
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros(0, dtype=np.float32)
+        self.df = np.zeros(HASH_DIM, dtype=np.float32)
+        self.n_docs = 0
+        self.last_rowid = 0
+        self.n_rows = 0
+        self.checksum = 0
+        self._centroids = None
+        self._rows = None
+        self._starts = None
+
+    def _load(self):
+        try:
+            data = np.load(self.model_path)
+        except (OSError, ValueError):
+            return
+        if int(data['version']) != MODEL_VERSION:
+            return
+        self.tag_ids = [int(t) for t in data['tag_ids']]
+        self.tag_index = {tag_id: i for i, tag_id in enumerate(self.tag_ids)}
+        self.keys = data['keys']
+        self.values = data['values']
+        self.df = data['df']
+        self.n_docs = int(data['n_docs'])
+        self.last_rowid = int(data['last_rowid'])
+        self.n_rows = int(data['n_rows'])
+        self.checksum = int(data['checksum'])
+
+    def _save(self):
+        self.model_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.model_path.with_name(self.model_path.name + '.tmp.npz')
+        np.savez_compressed(tmp, version=MODEL_VERSION, tag_ids=np.array(self.tag_ids, dtype=np.int64),
+                            keys=self.keys, values=self.values, df=self.df, n_docs=self.n_docs,
+                            last_rowid=self.last_rowid, n_rows=self.n_rows, checksum=self.checksum)
+        tmp.replace(self.model_path)
+
+    def update(self, conn: sqlite3.Connection) -> int:
+        """Entrena con las asociaciones nuevas de `url_tags`
+
+        Se leen todas las asociaciones con su título para comprobar el sello,
+        pero si siguen como en el último entrenamiento guardado no se
+        calcula nada ni se reescribe el modelo.
+
+        Returns:
+            int: Número de asociaciones incorporadas al modelo
+        """
+        stored = conn.execute("""
+            SELECT ut.rowid, ut.tag_id, sh.title
+            FROM url_tags ut
+            JOIN streaming_history sh ON sh.id = ut.url_id
+            ORDER BY ut.rowid
+        """).fetchall()
+
+        n_known = bisect.bisect_right([row[0] for row in stored], self.last_rowid)
+        checksum = _checksum(stored[:n_known])
+        if n_known == self.n_rows and checksum == self.checksum:
+            if n_known == len(stored):
+                return 0
+        else:
+            # Se ha borrado o modificado alguna asociación ya entrenada
+            self._reset()
+            n_known, checksum = 0, 0
+
+        rows = [(tag_id, title) for _, tag_id, title in stored[n_known:]]
+        for tag_id in sorted({tag_id for tag_id, _ in rows} - set(self.tag_index)):
+            self.tag_index[tag_id] = len(self.tag_ids)
+            self.tag_ids.append(tag_id)
+
+        keys = [self.keys]
+        values = [self.values]
+        for tag_id, title in rows:
+            features = title_features(title)
+            if not features:
+                continue
+            indices = np.fromiter(features.keys(), dtype=np.int64, count=len(features))
+            counts = np.fromiter(features.values(), dtype=np.float32, count=len(features))
+            # Cada título cuenta lo mismo, sea largo o corto
+            keys.append((indices << ROW_BITS) | self.tag_index[tag_id])
+            values.append(counts / np.linalg.norm(counts))
+            self.df[indices] += 1
+            self.n_docs += 1
+
+        # Se suman los valores repetidos (misma etiqueta y posición)
+        self.keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        self.values = np.bincount(inverse, weights=np.concatenate(values),
+                                  minlength=len(self.keys)).astype(np.float32)
+
+        self.last_rowid = stored[-1][0] if stored else 0
+        self.n_rows = len(stored)
+        self.checksum = _checksum(stored[n_known:], checksum)
+        self._centroids = None
+        self._save()
+        return len(rows)
+
+    def _idf(self):
+        return np.log((1 + self.n_docs) / (1 + self.df)).astype(np.float32) + 1
+
+    def suggest(self, title: str, limit: int = 5) -> list:
+        """Etiquetas más parecidas al título
+
+        Returns:
+            list: [(tag_id, similitud entre 0 y 1)] de mayor a menor
+        """
+        if not self.tag_ids:
+            return []
+        features = title_features(title)
+        if not features:
+            return []
+
+        idf = self._idf()
+        if self._centroids is None:
+            # Centroides normalizados, con la misma disposición dispersa que las sumas
+            self._rows = self.keys & ROW_MASK
+            weighted = self.values * idf[self.keys >> ROW_BITS]
+            norms = np.sqrt(np.bincount(self._rows, weights=weighted ** 2, minlength=len(self.tag_ids)))
+            self._centroids = (weighted / np.where(norms == 0, 1, norms)[self._rows]).astype(np.float32)
+            # Inicio de cada posición en las claves ordenadas
+            self._starts = np.searchsorted(self.keys, np.arange(HASH_DIM + 1, dtype=np.int64) << ROW_BITS)
+
+        indices = np.fromiter(features.keys(), dtype=np.int64, count=len(features))
+        weights = np.fromiter(features.values(), dtype=np.float32, count=len(features)) * idf[indices]
+        weights /= np.linalg.norm(weights)
+        scores = np.zeros(len(self.tag_ids), dtype=np.float32)
+        for index, weight in zip(indices, weights):
+            start, end = self._starts[index], self._starts[index + 1]
+            scores[self._rows[start:end]] += self._centroids[start:end] * weight
+
+        top = np.argsort(-scores)[:limit]
+        return [(self.tag_ids[i], float(scores[i])) for i in top if scores[i] > 0]
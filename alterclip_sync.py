@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+#
+# Sincronización del historial entre varios equipos.
+#
+# Cada equipo tiene su propia streaming_history.db. Unos disparadores anotan
+# en `change_log` cada cambio del historial, las etiquetas, la jerarquía y las
+# asociaciones URL-etiqueta usando claves naturales (URL y nombre de
+# etiqueta), que son las mismas en todos los equipos aunque los id no lo
+# sean. `export_delta` empaqueta solo los cambios posteriores al último
+# intercambio con un equipo y `apply_delta` los fusiona:
+#
+#   - Título, plataforma, etiquetas y jerarquía: gana el cambio más reciente;
+#     si empatan, el del equipo con mayor identificador.
+#   - visto: es un contador por equipo (G-counter). Cada equipo envía cuántas
+#     reproducciones conoce de cada equipo y el total es la suma de los
+#     máximos, así que aplicar el mismo delta dos veces o en distinto orden
+#     da lo mismo.
+#
+# Al recibir una URL se busca su vídeo por la clave canónica, así que otra
+# forma del mismo enlace (youtu.be, parámetros de seguimiento...) no crea
+# una entrada duplicada.
+#
+# El mismo registro alimenta los eventos en vivo de la web, que leen las
+# filas con `row_id` (el id local de la entrada del historial).
+#
+import gzip
+import json
+import sqlite3
+import uuid
+from alterclip_urls import canonical_key, ensure_canonical_key
+
+DELTA_VERSION = 1
+
+# Días que se conservan los cambios que no hay que enviar a otros equipos
+CHANGE_LOG_RETENTION_DAYS = 30
+
+# Marca de tiempo en segundos con decimales, igual en todos los equipos
+NOW_SQL = "((julianday('now') - 2440587.5) * 86400.0)"
+
+# Mientras se aplica un delta existe esta fila; los cambios se anotan con
+# sync = 0 para no devolver al otro equipo los suyos propios
+SYNC_SQL = "NOT EXISTS (SELECT 1 FROM sync_state WHERE key = 'applying')"
+
+CHANGE_LOG_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS sync_state (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS sync_peers (
+        peer TEXT PRIMARY KEY,
+        last_sent INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS sync_visto (
+        url TEXT NOT NULL,
+        device TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (url, device)
+    );
+
+    CREATE TABLE IF NOT EXISTS change_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        key TEXT NOT NULL,
+        key2 TEXT NOT NULL DEFAULT '',
+        op TEXT NOT NULL,
+        changed_at REAL NOT NULL,
+        row_id INTEGER,
+        sync INTEGER NOT NULL DEFAULT 1
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_change_log_key ON change_log(entity, key, key2);
+
+    -- Las claves naturales del historial son las URL
+    CREATE INDEX IF NOT EXISTS idx_streaming_history_url ON streaming_history(url);
+
+    CREATE TRIGGER IF NOT EXISTS trg_change_log_history_insert
+    AFTER INSERT ON streaming_history BEGIN
+        INSERT INTO change_log (entity, key, op, changed_at, row_id, sync)
+        VALUES ('history', NEW.url, 'insert', {NOW_SQL}, NEW.id, {SYNC_SQL});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_change_log_history_update
+    AFTER UPDATE OF url, title, platform, visto ON streaming_history BEGIN
+        INSERT INTO change_log (entity, key, op, changed_at, sync)
+        SELECT 'history', OLD.url, 'delete', {NOW_SQL}, {SYNC_SQL} WHERE OLD.url <> NEW.url;
+        INSERT INTO change_log (entity, key, op, changed_at, row_id, sync)
+        VALUES ('history', NEW.url, 'update', {NOW_SQL}, NEW.id, {SYNC_SQL});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_change_log_history_delete
+    AFTER DELETE ON streaming_history BEGIN
+        INSERT INTO change_log (entity, key, op, changed_at, row_id, sync)
+        VALUES ('history', OLD.url, 'delete', {NOW_SQL}, OLD.id, {SYNC_SQL});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_change_log_tags_insert
+    AFTER INSERT ON tags BEGIN
+        INSERT INTO change_log (entity, key, op, changed_at, sync)
+        VALUES ('tag', NEW.name, 'upsert', {NOW_SQL}, {SYNC_SQL});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_change_log_tags_update
+    AFTER UPDATE OF name, description ON tags BEGIN
+        INSERT INTO change_log (entity, key, op, changed_at, sync)
+        SELECT 'tag', OLD.name, 'delete', {NOW_SQL}, {SYNC_SQL} WHERE OLD.name <> NEW.name;
+        INSERT INTO change_log (entity, key, op, changed_at, sync)
+        VALUES ('tag', NEW.name, 'upsert', {NOW_SQL}, {SYNC_SQL});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_change_log_tags_delete
+    AFTER DELETE ON tags BEGIN
+        INSERT INTO change_log (entity, key, op, changed_at, sync)
+        VALUES ('tag', OLD.name, 'delete', {NOW_SQL}, {SYNC_SQL});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_change_log_url_tags_insert
+    AFTER INSERT ON url_tags BEGIN
+        INSERT INTO change_log (entity, key, key2, op, changed_at, row_id, sync)
+        SELECT 'url_tag', sh.url, t.name, 'add', {NOW_SQL}, NEW.url_id, {SYNC_SQL}
+        FROM streaming_history sh, tags t
+        WHERE sh.id = NEW.url_id AND t.id = NEW.tag_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_change_log_url_tags_delete
+    AFTER DELETE ON url_tags BEGIN
+        INSERT INTO change_log (entity, key, key2, op, changed_at, row_id, sync)
+        SELECT 'url_tag', sh.url, t.name, 'remove', {NOW_SQL}, OLD.url_id, {SYNC_SQL}
+        FROM streaming_history sh, tags t
+        WHERE sh.id = OLD.url_id AND t.id = OLD.tag_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_change_log_tag_hierarchy_insert
+    AFTER INSERT ON tag_hierarchy BEGIN
+        INSERT INTO change_log (entity, key, key2, op, changed_at, sync)
+        SELECT 'tag_edge', p.name, c.name, 'add', {NOW_SQL}, {SYNC_SQL}
+        FROM tags p, tags c
+        WHERE p.id = NEW.parent_id AND c.id = NEW.child_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_change_log_tag_hierarchy_delete
+    AFTER DELETE ON tag_hierarchy BEGIN
+        INSERT INTO change_log (entity, key, key2, op, changed_at, sync)
+        SELECT 'tag_edge', p.name, c.name, 'remove', {NOW_SQL}, {SYNC_SQL}
+        FROM tags p, tags c
+        WHERE p.id = OLD.parent_id AND c.id = OLD.child_id;
+    END;
+"""
+
+# Al crear el registro por primera vez se anota todo lo que ya existe con
+# fecha 0, para que el primer intercambio lo envíe y cualquier cambio real
+# posterior gane sobre ello. Las reproducciones anteriores se guardan en el
+# apartado común 'base', que se fusiona con el máximo: si dos equipos parten
+# de copias de la misma base de datos no se cuentan dos veces.
+SEED_SQL = """
+    INSERT OR IGNORE INTO sync_visto (url, device, count)
+    SELECT url, 'base', MAX(visto) FROM streaming_history WHERE visto > 0 GROUP BY url;
+    INSERT INTO change_log (entity, key, op, changed_at)
+    SELECT 'tag', name, 'upsert', 0 FROM tags;
+    INSERT INTO change_log (entity, key, op, changed_at)
+    SELECT DISTINCT 'history', url, 'update', 0 FROM streaming_history;
+    INSERT INTO change_log (entity, key, key2, op, changed_at)
+    SELECT DISTINCT 'tag_edge', p.name, c.name, 'add', 0
+    FROM tag_hierarchy th
+    JOIN tags p ON p.id = th.parent_id
+    JOIN tags c ON c.id = th.child_id;
+    INSERT INTO change_log (entity, key, key2, op, changed_at)
+    SELECT DISTINCT 'url_tag', sh.url, t.name, 'add', 0
+    FROM url_tags ut
+    JOIN streaming_history sh ON sh.id = ut.url_id
+    JOIN tags t ON t.id = ut.tag_id;
+"""
+
+# Versiones anteriores tenían un registro para la web (`change_log` sin
+# claves naturales) y otro para la sincronización (`sync_log`)
+LEGACY_WEB_TRIGGERS = ('trg_history_insert_log', 'trg_history_update_log', 'trg_history_delete_log',
+                       'trg_url_tags_insert_log', 'trg_url_tags_delete_log')
+LEGACY_SYNC_TRIGGERS = tuple(f"trg_sync_{table}_{op}"
+                             for table, ops in (('history', ('insert', 'update', 'delete')),
+                                                ('tags', ('insert', 'update', 'delete')),
+                                                ('url_tags', ('insert', 'delete')),
+                                                ('tag_hierarchy', ('insert', 'delete')))
+                             for op in ops)
+
+
+def _legacy_migration(conn):
+    """SQL que pasa los registros de versiones anteriores a `change_log`
+
+    Returns:
+        tuple: (SQL previo al esquema, SQL posterior, si hay que sembrar)
+    """
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(change_log)")}
+    before, after = [], []
+
+    old_web_id = 0
+    if 'change_log' in tables and 'key' not in columns:
+        # El registro antiguo de la web solo servía para los eventos en vivo;
+        # se conserva su último id para que los clientes no se salten nada
+        old_web_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+        before += [f"DROP TRIGGER IF EXISTS {name};" for name in LEGACY_WEB_TRIGGERS]
+        before.append("DROP TABLE change_log;")
+        tables.discard('change_log')
+
+    if 'sync_log' in tables:
+        # Se copian con sus id para que `sync_peers.last_sent` siga valiendo
+        after.append("""
+            INSERT INTO change_log (id, entity, key, key2, op, changed_at)
+            SELECT id, entity, key, key2,
+                   CASE WHEN entity = 'history' AND op = 'upsert' THEN 'update' ELSE op END,
+                   changed_at
+            FROM sync_log ORDER BY id;
+        """)
+        after += [f"DROP TRIGGER IF EXISTS {name};" for name in LEGACY_SYNC_TRIGGERS]
+        after.append("DROP TABLE sync_log;")
+    if old_web_id:
+        after.append(f"""
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'change_log', 0
+            WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'change_log');
+            UPDATE sqlite_sequence SET seq = MAX(seq, {old_web_id}) WHERE name = 'change_log';
+        """)
+
+    seed = 'change_log' not in tables and 'sync_log' not in tables
+    return ' '.join(before), ' '.join(after), seed
+
+
+def ensure_change_log(conn: sqlite3.Connection, compact: bool = False) -> str:
+    """Crea el registro de cambios, sus disparadores y las tablas de la sincronización
+
+    Los disparadores anotan cada cambio sea quien sea quien escriba: el
+    demonio, el CLI, la GUI, la web o la propia sincronización. Con `compact`
+    se purga además lo que ya no necesita nadie (ver compact_change_log).
+
+    Returns:
+        str: Identificador de este equipo
+    """
+    before, after, seed = _legacy_migration(conn)
+    with conn:
+        conn.executescript(f"BEGIN; {before} {CHANGE_LOG_SCHEMA} {after} {SEED_SQL if seed else ''} COMMIT;")
+        if compact:
+            compact_change_log(conn)
+        row = conn.execute("SELECT value FROM sync_state WHERE key = 'device_id'").fetchone()
+        if row:
+            return row[0]
+        device = uuid.uuid4().hex
+        conn.execute("INSERT INTO sync_state (key, value) VALUES ('device_id', ?)", (device,))
+    return device
+
+
+def compact_change_log(conn: sqlite3.Connection) -> None:
+    """Borra del registro los cambios que ya no necesita nadie
+
+    Se conservan los de los últimos CHANGE_LOG_RETENTION_DAYS días, que leen
+    los eventos en vivo, y de los anteriores los que aún no se han enviado a
+    algún equipo. De cada clave se conserva siempre el último cambio, que es
+    el que decide quién gana al fusionar y el que recibirá un equipo nuevo.
+    """
+    conn.execute(f"""
+        DELETE FROM change_log
+        WHERE changed_at < {NOW_SQL} - {CHANGE_LOG_RETENTION_DAYS} * 86400
+          AND (sync = 0
+               OR (id <= COALESCE((SELECT MIN(last_sent) FROM sync_peers),
+                                  (SELECT MAX(id) FROM change_log))
+                   AND id NOT IN (SELECT MAX(id) FROM change_log WHERE sync = 1
+                                  GROUP BY entity, key, key2)))
+    """)
+
+
+def _visto_vector(conn, urls):
+    """Reproducciones de cada URL recibidas de otros equipos, {url: {equipo: n}}"""
+    remote = {}
+    for url, other, count in conn.execute(
+        "SELECT url, device, count FROM sync_visto WHERE url IN (SELECT value FROM json_each(?))",
+        (json.dumps(urls),)
+    ):
+        remote.setdefault(url, {})[other] = count
+    return remote
+
+
+def build_delta(conn: sqlite3.Connection, since: int = 0) -> dict:
+    """Construye el delta con los cambios del registro posteriores a `since`
+
+    De cada clave solo se envía el último cambio, con el estado actual de la
+    fila, así que un vídeo modificado muchas veces ocupa lo mismo que uno
+    modificado una sola vez.
+    """
+    device = ensure_change_log(conn)
+    to_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+    rows = conn.execute("""
+        SELECT l.entity, l.key, l.key2, l.op, l.changed_at
+        FROM change_log l
+        JOIN (SELECT MAX(id) AS id FROM change_log
+              WHERE id > ? AND id <= ? AND sync = 1
+              GROUP BY entity, key, key2) last ON last.id = l.id
+        ORDER BY l.id
+    """, (since, to_id)).fetchall()
+
+    delta = {'version': DELTA_VERSION, 'device': device, 'from': since, 'to': to_id,
+             'history': [], 'tags': [], 'url_tags': [], 'tag_edges': []}
+
+    changed = {'history': {}, 'tag': {}}
+    for entity, key, key2, op, changed_at in rows:
+        if entity in changed:
+            changed[entity][key] = (op, changed_at)
+        elif entity == 'url_tag':
+            delta['url_tags'].append({'url': key, 'tag': key2, 'present': op == 'add',
+                                      'changed_at': changed_at})
+        elif entity == 'tag_edge':
+            delta['tag_edges'].append({'parent': key, 'child': key2, 'present': op == 'add',
+                                       'changed_at': changed_at})
+
+    tag_names = list(changed['tag'])
+    descriptions = dict(conn.execute(
+        "SELECT name, description FROM tags WHERE name IN (SELECT value FROM json_each(?))",
+        (json.dumps(tag_names),)
+    ))
+    for name, (op, changed_at) in changed['tag'].items():
+        if op == 'upsert' and name in descriptions:
+            delta['tags'].append({'name': name, 'description': descriptions[name],
+                                  'changed_at': changed_at})
+        else:
+            delta['tags'].append({'name': name, 'deleted': True, 'changed_at': changed_at})
+
+    urls = list(changed['history'])
+    current = {}
+    for url, title, platform, timestamp, visto in conn.execute("""
+        SELECT url, title, platform, timestamp, COALESCE(visto, 0)
+        FROM streaming_history
+        WHERE id IN (SELECT MIN(id) FROM streaming_history
+                     WHERE url IN (SELECT value FROM json_each(?))
+                     GROUP BY url)
+    """, (json.dumps(urls),)):
+        current[url] = (title, platform, timestamp, visto)
+    remote = _visto_vector(conn, urls)
+
+    for url, (op, changed_at) in changed['history'].items():
+        if op != 'delete' and url in current:
+            title, platform, timestamp, visto = current[url]
+            vector = dict(remote.get(url, {}))
+            vector[device] = max(visto - sum(vector.values()), 0)
+            delta['history'].append({'url': url, 'title': title, 'platform': platform,
+                                     'timestamp': timestamp, 'visto': vector,
+                                     'changed_at': changed_at})
+        else:
+            delta['history'].append({'url': url, 'deleted': True, 'changed_at': changed_at})
+
+    return delta
+
+
+def export_delta(conn: sqlite3.Connection, peer: str, path, since: int = None) -> dict:
+    """Escribe en `path` los cambios que `peer` aún no ha recibido
+
+    El punto de sincronización con `peer` avanza en cuanto se escribe el
+    fichero. Con `since` se puede repetir un envío desde un punto anterior.
+    """
+    ensure_change_log(conn)
+    if since is None:
+        row = conn.execute("SELECT last_sent FROM sync_peers WHERE peer = ?", (peer,)).fetchone()
+        since = row[0] if row else 0
+
+    delta = build_delta(conn, since)
+    write_delta(path, delta)
+
+    with conn:
+        conn.execute("""
+            INSERT INTO sync_peers (peer, last_sent) VALUES (?, ?)
+            ON CONFLICT(peer) DO UPDATE SET last_sent = excluded.last_sent
+        """, (peer, delta['to']))
+        compact_change_log(conn)
+    return delta
+
+
+def write_delta(path, delta: dict) -> None:
+    """Guarda el delta como JSON comprimido con gzip"""
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(delta, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def read_delta(path) -> dict:
+    """Lee un delta escrito con write_delta
+
+    Raises:
+        ValueError: Si el fichero no es un delta de una versión conocida
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        delta = json.load(f)
+    if not isinstance(delta, dict) or delta.get('version') != DELTA_VERSION:
+        raise ValueError("El fichero no es un delta de sincronización válido")
+    return delta
+
+
+def apply_delta(conn: sqlite3.Connection, delta: dict) -> dict:
+    """Fusiona un delta de otro equipo en una sola transacción
+
+    Solo se aplican y se anotan los cambios que de verdad modifican algo, así
+    que lo que llega de un equipo no vuelve entero a él en el siguiente
+    intercambio.
+
+    Returns:
+        dict: Número de cambios aplicados, descartados por ser más antiguos
+            que los locales y que ya coincidían con lo local
+    """
+    device = ensure_change_log(conn)
+    sender = delta['device']
+    if sender == device:
+        raise ValueError("El delta se exportó desde este mismo equipo")
+    stats = {'applied': 0, 'skipped': 0, 'unchanged': 0}
+
+    def local_change(entity, key, key2=''):
+        row = conn.execute(
+            "SELECT MAX(changed_at) FROM change_log WHERE entity = ? AND key = ? AND key2 = ? AND sync = 1",
+            (entity, key, key2)
+        ).fetchone()
+        return row[0] if row[0] is not None else -1
+
+    def log(entity, key, key2, op, changed_at):
+        conn.execute(
+            "INSERT INTO change_log (entity, key, key2, op, changed_at) VALUES (?, ?, ?, ?, ?)",
+            (entity, key, key2, op, changed_at)
+        )
+
+    def wins(entity, key, key2, op, changed_at, differs):
+        """Decide si el cambio remoto se aplica y, si es así, lo anota"""
+        if not differs:
+            stats['unchanged'] += 1
+            return False
+        local = local_change(entity, key, key2)
+        won = changed_at > local or (changed_at == local and sender > device)
+        stats['applied' if won else 'skipped'] += 1
+        if won:
+            # Se anota con su fecha original: así se compara con él el
+            # siguiente delta y llega también a los demás equipos
+            log(entity, key, key2, op, changed_at)
+        return won
+
+    def tag_row(name):
+        return conn.execute("SELECT id, description FROM tags WHERE name = ?", (name,)).fetchone()
+
+    def history_row(url):
+        """Entrada local del mismo vídeo, aunque tenga otra forma de la URL"""
+        return conn.execute(
+            "SELECT url, title, platform, COALESCE(visto, 0) FROM streaming_history "
+            "WHERE canonical_key = ? ORDER BY id LIMIT 1",
+            (canonical_key(url),)
+        ).fetchone()
+
+    def url_ids(url):
+        """(URL local, ids de sus entradas) del mismo vídeo que `url`"""
+        rows = conn.execute("SELECT id, url FROM streaming_history WHERE canonical_key = ? ORDER BY id",
+                            (canonical_key(url),)).fetchall()
+        return (rows[0][1] if rows else url), [row[0] for row in rows]
+
+    ensure_canonical_key(conn)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('applying', '1')")
+
+        for item in delta['tags']:
+            existing = tag_row(item['name'])
+            if item.get('deleted'):
+                if wins('tag', item['name'], '', 'delete', item['changed_at'], existing is not None):
+                    conn.execute("DELETE FROM url_tags WHERE tag_id = ?", (existing[0],))
+                    conn.execute("DELETE FROM tag_hierarchy WHERE parent_id = ? OR child_id = ?",
+                                 (existing[0], existing[0]))
+                    conn.execute("DELETE FROM tags WHERE id = ?", (existing[0],))
+            elif wins('tag', item['name'], '', 'upsert', item['changed_at'],
+                      existing is None or existing[1] != item['description']):
+                if existing is None:
+                    conn.execute("INSERT INTO tags (name, description) VALUES (?, ?)",
+                                 (item['name'], item['description']))
+                else:
+                    conn.execute("UPDATE tags SET description = ? WHERE id = ?",
+                                 (item['description'], existing[0]))
+
+        for item in delta['history']:
+            # Si el vídeo ya está con otra forma de la URL se usa la de aquí
+            row = history_row(item['url'])
+            url = row[0] if row else item['url']
+            current = row[1:] if row else None
+            key = canonical_key(url)
+
+            if item.get('deleted'):
+                if wins('history', url, '', 'delete', item['changed_at'], current is not None):
+                    for url_id in url_ids(url)[1]:
+                        conn.execute("DELETE FROM url_tags WHERE url_id = ?", (url_id,))
+                    conn.execute("DELETE FROM streaming_history WHERE canonical_key = ?", (key,))
+                    conn.execute("DELETE FROM sync_visto WHERE url = ?", (url,))
+                continue
+
+            # Reproducciones: las propias de este equipo más el máximo
+            # conocido de cada uno de los demás
+            known = _visto_vector(conn, [url]).get(url, {})
+            local_visto = current[2] if current else 0
+            own = max(local_visto - sum(known.values()), 0)
+            for other, count in item['visto'].items():
+                if other != device and count > known.get(other, 0):
+                    known[other] = count
+                    conn.execute("INSERT OR REPLACE INTO sync_visto (url, device, count) VALUES (?, ?, ?)",
+                                 (url, other, count))
+            visto = own + sum(known.values())
+
+            if current is None:
+                if wins('history', url, '', 'update', item['changed_at'], True):
+                    conn.execute("""
+                        INSERT INTO streaming_history (url, title, platform, timestamp, visto, canonical_key)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, (url, item['title'], item['platform'], item['timestamp'], visto, key))
+                continue
+
+            if (current[0], current[1]) != (item['title'], item['platform']):
+                if wins('history', url, '', 'update', item['changed_at'], True):
+                    conn.execute("UPDATE streaming_history SET title = ?, platform = ? WHERE canonical_key = ?",
+                                 (item['title'], item['platform'], key))
+            elif visto == local_visto:
+                stats['unchanged'] += 1
+            else:
+                stats['applied'] += 1
+            if visto != local_visto:
+                conn.execute("UPDATE streaming_history SET visto = ? WHERE canonical_key = ?", (visto, key))
+                # El nuevo total también tiene que llegar a los demás equipos
+                log('history', url, '', 'update',
+                    max(local_change('history', url), item['changed_at']))
+
+        for item in delta['tag_edges']:
+            parent, child = tag_row(item['parent']), tag_row(item['child'])
+            if parent is None or child is None:
+                continue
+            present = conn.execute(
+                "SELECT 1 FROM tag_hierarchy WHERE parent_id = ? AND child_id = ?", (parent[0], child[0])
+            ).fetchone() is not None
+            if not wins('tag_edge', item['parent'], item['child'], 'add' if item['present'] else 'remove',
+                        item['changed_at'], present != item['present']):
+                continue
+            if item['present']:
+                conn.execute("INSERT INTO tag_hierarchy (parent_id, child_id) VALUES (?, ?)",
+                             (parent[0], child[0]))
+            else:
+                conn.execute("DELETE FROM tag_hierarchy WHERE parent_id = ? AND child_id = ?",
+                             (parent[0], child[0]))
+
+        for item in delta['url_tags']:
+            tag = tag_row(item['tag'])
+            url, ids = url_ids(item['url'])
+            if tag is None or not ids:
+                continue
+            present = conn.execute(
+                "SELECT 1 FROM url_tags WHERE url_id = ? AND tag_id = ?", (ids[0], tag[0])
+            ).fetchone() is not None
+            if not wins('url_tag', url, item['tag'], 'add' if item['present'] else 'remove',
+                        item['changed_at'], present != item['present']):
+                continue
+            for url_id in ids:
+                if item['present']:
+                    conn.execute("INSERT OR IGNORE INTO url_tags (url_id, tag_id) VALUES (?, ?)",
+                                 (url_id, tag[0]))
+                else:
+                    conn.execute("DELETE FROM url_tags WHERE url_id = ? AND tag_id = ?", (url_id, tag[0]))
+
+        conn.execute("DELETE FROM sync_state WHERE key = 'applying'")
+
+    return stats
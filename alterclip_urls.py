@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+#
+# Claves canónicas de las URLs del historial.
+#
+# Un mismo vídeo llega con muchas formas distintas: youtu.be/X,
+# youtube.com/watch?v=X&t=30, m.youtube.com/watch?v=X&si=..., etc. La clave
+# canónica las reduce a una sola ("youtube:X") para que el historial no las
+# guarde como vídeos distintos. Las URLs de plataformas desconocidas se
+# normalizan quitando parámetros de seguimiento, el fragmento y los prefijos
+# www./m. del dominio.
+#
+# También se deduce aquí la plataforma de cada URL y se consulta su título,
+# para que el demonio y la fusión del diario de Android lo hagan igual.
+#
+import logging
+import os
+import re
+import sqlite3
+import requests
+from typing import Tuple
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+# Parámetros de seguimiento, que se quitan en cualquier dominio. Solo los que
+# nunca identifican el contenido: otros como s, t o ref son la búsqueda o el
+# hilo en muchas webs.
+TRACKING_PARAMS = {'si', 'fbclid', 'gclid', 'igshid', 'igsh', 'mibextid'}
+TRACKING_PREFIXES = ('utm_',)
+
+# Parámetros que en YouTube no cambian el vídeo (instante de inicio, origen...)
+YOUTUBE_PARAMS = {'t', 'start', 'time_continue', 'pp', 'ab_channel', 'feature'}
+YOUTUBE_HOSTS = {'youtube.com', 'youtu.be', 'youtube-nocookie.com'}
+
+# Prefijos del dominio que sirven el mismo contenido. web. no está: web.archive.org
+# (Wayback Machine) no es archive.org
+HOST_PREFIXES = ('www.', 'm.', 'mobile.', 'music.')
+
+# Versión del cálculo de las claves. Si cambia, ensure_canonical_key las
+# recalcula todas; va en el nombre del índice para no necesitar otra tabla
+CANONICAL_KEY_VERSION = 2
+CANONICAL_KEY_INDEX = f"idx_streaming_history_canonical_key_v{CANONICAL_KEY_VERSION}"
+
+_YOUTUBE_ID = re.compile(r'^[\w-]{11}$')
+
+
+def _host(netloc: str) -> str:
+    host = netloc.lower().rsplit('@', 1)[-1].split(':', 1)[0]
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+
+def _youtube_key(host, parts, query):
+    if host == 'youtu.be':
+        video_id = parts[0] if parts else ''
+    elif parts[:1] == ['watch']:
+        video_id = query.get('v', '')
+    elif len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live', 'v'):
+        video_id = parts[1]
+    else:
+        return None
+    return f"youtube:{video_id}" if _YOUTUBE_ID.match(video_id) else None
+
+
+def _instagram_key(host, parts, query):
+    if len(parts) >= 2 and parts[0] in ('p', 'reel', 'reels', 'tv'):
+        return f"instagram:{parts[1]}"
+    return None
+
+
+def _facebook_key(host, parts, query):
+    if host == 'fb.watch' and parts:
+        return f"facebook:watch:{parts[0]}"
+    if parts[:1] == ['watch'] and query.get('v'):
+        return f"facebook:{query['v']}"
+    for marker in ('videos', 'reel'):
+        if marker in parts:
+            index = parts.index(marker) + 1
+            if index < len(parts) and parts[index].isdigit():
+                return f"facebook:{parts[index]}"
+    return None
+
+
+def _archive_key(host, parts, query):
+    if len(parts) >= 2 and parts[0] in ('details', 'embed'):
+        return f"archive:{parts[1]}"
+    return None
+
+
+def _x_key(host, parts, query):
+    if 'status' in parts:
+        index = parts.index('status') + 1
+        if index < len(parts) and parts[index].isdigit():
+            return f"x:{parts[index]}"
+    return None
+
+
+# Dominio (sin www./m.) -> función que extrae la clave de la plataforma
+PLATFORM_KEYS = {
+    'youtube.com': _youtube_key,
+    'youtu.be': _youtube_key,
+    'youtube-nocookie.com': _youtube_key,
+    'instagram.com': _instagram_key,
+    'facebook.com': _facebook_key,
+    'fb.watch': _facebook_key,
+    'archive.org': _archive_key,
+    'x.com': _x_key,
+    'twitter.com': _x_key,
+}
+
+
+def canonical_key(url: str) -> str:
+    """Devuelve la clave canónica de una URL
+
+    Si la plataforma es conocida, la clave es "plataforma:id"; si no, la URL
+    normalizada sin esquema, sin parámetros de seguimiento y con el resto de
+    parámetros ordenados.
+    """
+    url = (url or '').strip()
+    try:
+        split = urlsplit(url if '://' in url else f"https://{url}")
+    except ValueError:
+        return url
+    host = _host(split.netloc)
+    parts = [part for part in split.path.split('/') if part]
+    query = dict(parse_qsl(split.query, keep_blank_values=True))
+
+    extractor = PLATFORM_KEYS.get(host)
+    if extractor:
+        key = extractor(host, parts, query)
+        if key:
+            return key
+
+    ignored = TRACKING_PARAMS | YOUTUBE_PARAMS if host in YOUTUBE_HOSTS else TRACKING_PARAMS
+    params = sorted(
+        (name, value) for name, value in parse_qsl(split.query, keep_blank_values=True)
+        if name.lower() not in ignored and not name.lower().startswith(TRACKING_PREFIXES)
+    )
+    # La ruta se conserva tal cual (salvo las barras de los extremos): puede
+    # llevar otra URL dentro, como en web.archive.org/web/2020/https://...
+    path = split.path.strip('/')
+    return f"{host}/{path}" + (f"?{urlencode(params)}" if params else '')
+
+
+# Dominio (o dominio padre) -> nombre de la plataforma guardado en el historial
+PLATFORM_NAMES = {
+    'youtube.com': 'YouTube',
+    'youtu.be': 'YouTube',
+    'youtube-nocookie.com': 'YouTube',
+    'instagram.com': 'Instagram',
+    'facebook.com': 'Facebook',
+    'fb.watch': 'Facebook',
+    'archive.org': 'Archive.org',
+}
+UNKNOWN_PLATFORM = "Desconocido"
+UNKNOWN_TITLE = "Título no disponible"
+
+
+def url_platform(url: str) -> str:
+    """Deduce la plataforma de una URL por su dominio, sin conectarse a nada"""
+    url = (url or '').strip()
+    try:
+        host = urlsplit(url if '://' in url else f"https://{url}").hostname or ''
+    except ValueError:
+        return UNKNOWN_PLATFORM
+    labels = host.split('.')
+    for i in range(len(labels) - 1):
+        platform = PLATFORM_NAMES.get('.'.join(labels[i:]))
+        if platform:
+            return platform
+    return UNKNOWN_PLATFORM
+
+
+def get_archive_title(url: str) -> str:
+    """Obtiene el título de un elemento de archive.org con su API de metadatos"""
+    if not url.startswith("https://archive.org/details/"):
+        return None
+
+    identifier = url.split("/details/")[-1]
+    api_url = f"https://archive.org/metadata/{identifier}"
+
+    try:
+        response = requests.get(api_url)
+        response.raise_for_status()
+        data = response.json()
+        return data.get("metadata", {}).get("title")
+    except Exception:
+        return None
+
+
+def get_content_title(url: str) -> Tuple[str, str]:
+    """Obtiene el título del contenido y la plataforma
+
+    La plataforma se deduce con url_platform, así que es la misma aunque no
+    se consiga el título.
+    """
+    platform = url_platform(url)
+    try:
+        if platform == 'YouTube':
+            # Para YouTube, usamos la API o parseamos el título del HTML
+            try:
+                # Intentar usar la API de YouTube
+                youtube_api_key = os.getenv('YOUTUBE_API_KEY')
+                key = canonical_key(url)
+                if youtube_api_key and key.startswith('youtube:'):
+                    video_id = key.split(':', 1)[1]
+                    api_url = f'https://www.googleapis.com/youtube/v3/videos?id={video_id}&key={youtube_api_key}&part=snippet'
+                    response = requests.get(api_url)
+                    data = response.json()
+                    if 'items' in data and data['items']:
+                        return data['items'][0]['snippet']['title'], platform
+            except Exception:
+                pass
+
+            # Si falla la API, parseamos el HTML
+            response = requests.get(url)
+            title_match = re.search(r'<title>(.*?)</title>', response.text)
+            if title_match:
+                title = title_match.group(1).split(' - ')[0]
+                return title, platform
+
+        elif platform == 'Instagram':
+            response = requests.get(url)
+            title_match = re.search(r'"description" content="(.*?)"', response.text)
+            if title_match:
+                return title_match.group(1), platform
+
+        elif platform == 'Facebook':
+            # Intentar obtener el título usando metadatos Open Graph
+            response = requests.get(url)
+            # Buscar el título usando diferentes patrones
+            title_match = re.search(r'property="og:title" content="(.*?)"', response.text)
+            if not title_match:
+                title_match = re.search(r'"title" content="(.*?)"', response.text)
+            if not title_match:
+                title_match = re.search(r'<title>(.*?)</title>', response.text)
+
+            if title_match:
+                title = title_match.group(1).strip()
+                # Eliminar el sufijo " | Facebook" si existe
+                title = title.replace(' | Facebook', '').strip()
+                return title, platform
+
+        elif platform == 'Archive.org':
+            title = get_archive_title(url)
+            if title:
+                return title, platform
+
+        return UNKNOWN_TITLE, platform
+    except Exception as e:
+        logging.error(f"Error al obtener título: {e}")
+        return UNKNOWN_TITLE, platform
+
+
+def fill_canonical_keys(conn: sqlite3.Connection) -> int:
+    """Calcula la clave de las entradas que no la tienen
+
+    Las entradas que otros programas insertan sin clave (la sincronización,
+    la web...) se completan aquí; gracias al índice, si no hay ninguna
+    pendiente la consulta es inmediata.
+
+    Returns:
+        int: Número de entradas completadas
+    """
+    rows = conn.execute("SELECT id, url FROM streaming_history WHERE canonical_key IS NULL").fetchall()
+    if rows:
+        with conn:
+            conn.executemany("UPDATE streaming_history SET canonical_key = ? WHERE id = ?",
+                             [(canonical_key(url), row_id) for row_id, url in rows])
+    return len(rows)
+
+
+def ensure_canonical_key(conn: sqlite3.Connection) -> None:
+    """Añade la columna `canonical_key` con su índice y la rellena donde falte
+
+    Si las claves se calcularon con una versión anterior de canonical_key
+    (no existe el índice de la versión actual), se recalculan todas.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(streaming_history)")]
+    current = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                           (CANONICAL_KEY_INDEX,)).fetchone()
+    with conn:
+        if 'canonical_key' not in columns:
+            conn.execute("ALTER TABLE streaming_history ADD COLUMN canonical_key TEXT")
+        elif not current:
+            conn.execute("UPDATE streaming_history SET canonical_key = NULL")
+        if not current:
+            old = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                               "AND name LIKE 'idx_streaming_history_canonical_key%'").fetchall()
+            for (name,) in old:
+                conn.execute(f'DROP INDEX "{name}"')
+            conn.execute(f"CREATE INDEX {CANONICAL_KEY_INDEX} ON streaming_history(canonical_key)")
+    fill_canonical_keys(conn)
+
+
+def find_duplicates(conn: sqlite3.Connection) -> list:
+    """Busca las entradas del historial que comparten clave canónica
+
+    Returns:
+        list: (clave, [(id, url, título, visto), ...]) por cada grupo, con la
+              entrada más antigua primero
+    """
+    ensure_canonical_key(conn)
+    groups = conn.execute("""
+        SELECT canonical_key FROM streaming_history
+        GROUP BY canonical_key HAVING COUNT(*) > 1
+    """).fetchall()
+    return [(key, conn.execute("""
+                SELECT id, url, title, COALESCE(visto, 0) FROM streaming_history
+                WHERE canonical_key = ?
+                ORDER BY timestamp, id
+            """, (key,)).fetchall())
+            for (key,) in groups]
+
+
+def merge_duplicates(conn: sqlite3.Connection, backup: str = None,
+                     dry_run: bool = False) -> Tuple[int, int]:
+    """Une las entradas del historial que comparten clave canónica
+
+    Se conserva la entrada más antigua. Recibe las etiquetas de las demás,
+    la suma de sus reproducciones y, si no tenía título, el primero que haya.
+    Las demás se eliminan, así que antes se copia la base de datos entera en
+    `backup`; sin copia solo se permite la simulación.
+
+    Args:
+        conn: Conexión a la base de datos
+        backup: Ruta de la copia de seguridad que se hace antes de borrar
+        dry_run: Si es True, solo cuenta los duplicados sin modificar nada
+
+    Returns:
+        tuple: (grupos de duplicados, entradas eliminadas o que se eliminarían)
+    """
+    groups = find_duplicates(conn)
+    removed = sum(len(rows) - 1 for _, rows in groups)
+    if dry_run or not groups:
+        return len(groups), removed
+    if not backup:
+        raise ValueError("Hace falta una copia de seguridad para unir los duplicados")
+
+    target = sqlite3.connect(backup)
+    try:
+        conn.backup(target)
+    finally:
+        target.close()
+
+    with conn:
+        for key, rows in groups:
+            keeper = rows[0][0]
+            duplicates = [row[0] for row in rows[1:]]
+            title = next((row[2] for row in rows if row[2] and row[2] != UNKNOWN_TITLE), rows[0][2])
+
+            conn.executemany("INSERT OR IGNORE INTO url_tags (url_id, tag_id) "
+                             "SELECT ?, tag_id FROM url_tags WHERE url_id = ?",
+                             [(keeper, dup) for dup in duplicates])
+            conn.executemany("DELETE FROM url_tags WHERE url_id = ?", [(dup,) for dup in duplicates])
+            conn.execute("UPDATE streaming_history SET title = ?, visto = ? WHERE id = ?",
+                         (title, sum(row[3] for row in rows), keeper))
+            conn.executemany("DELETE FROM streaming_history WHERE id = ?", [(dup,) for dup in duplicates])
+    return len(groups), removed
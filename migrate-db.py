@@ -1,20 +1,30 @@
 #!/usr/bin/env python
 #
 # Ejecutar si tu base de datos necesita añadir la columna visto en
-# la tabla streaming_history.
+# la tabla streaming_history, o para unir las entradas duplicadas que
+# son el mismo vídeo con distinta URL (youtu.be/X, youtube.com/watch?v=X&t=30,
+# m.youtube.com/watch?v=X...) junto con sus tags.
 #
-# Solo se necesita ejecutar una vez
+# Solo se necesita ejecutar una vez. Antes de borrar los duplicados se copia
+# la base de datos junto a la original (streaming_history.db.<fecha>.bak);
+# con --dry-run solo se muestran los duplicados que se unirían.
 #
 #
+import os
 import sqlite3
+import sys
+from datetime import datetime
 from pathlib import Path
 from platformdirs import user_log_dir
+from alterclip_urls import find_duplicates, merge_duplicates
 
 def get_db_path() -> Path:
-    """Obtiene la ruta de la base de datos"""
-    return Path(user_log_dir("alterclip")) / "streaming_history.db"
+    """Obtiene la ruta de la base de datos (ALTERCLIP_DB permite usar otra)"""
+    return Path(os.getenv("ALTERCLIP_DB", Path(user_log_dir("alterclip")) / "streaming_history.db"))
 
-conn = sqlite3.connect(get_db_path())
+dry_run = '--dry-run' in sys.argv[1:]
+db_path = get_db_path()
+conn = sqlite3.connect(db_path)
 
 #Vamos a realizar migración para añadir la nueva columna "visto" a streaming_history
 cursor = conn.cursor()
@@ -30,3 +40,22 @@ else:
     print("La tabla ya trae la columna visto. No es necesario hacer nada")
 
 conn.commit()
+
+# Unir duplicados por clave canónica (añade la columna canonical_key si falta)
+if dry_run:
+    for key, rows in find_duplicates(conn):
+        print(key)
+        for url_id, url, title, _ in rows:
+            print(f"  {'conservar' if url_id == rows[0][0] else 'unir     '} {url_id:>6}  {url}  {title or ''}")
+    grupos, eliminadas = merge_duplicates(conn, dry_run=True)
+    print(f"Se fusionarían {eliminadas} entradas en {grupos} vídeos (sin cambios por --dry-run)")
+else:
+    backup = f"{db_path}.{datetime.now():%Y%m%d-%H%M%S}.bak"
+    grupos, eliminadas = merge_duplicates(conn, backup=backup)
+    if eliminadas:
+        print(f"Duplicados unidos: {eliminadas} entradas fusionadas en {grupos} vídeos")
+        print(f"Copia de seguridad previa en {backup}")
+    else:
+        print("No hay entradas duplicadas")
+
+conn.close()
@@ -1,27 +1,294 @@
 #!/usr/bin/env python3
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for
 import sqlite3
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 from pathlib import Path
+from typing import List, Tuple
 import unicodedata
-from datetime import datetime
+from datetime import datetime, timezone
 from platformdirs import user_log_dir
-from urllib.parse import unquote  # Para decodificar URLs
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Módulos compartidos con el CLI, en el directorio raíz del proyecto
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from alterclip_facets import FacetService, database_stamp
+from alterclip_sync import ensure_change_log
+import alterclip_profile as profiling
+
+# Número máximo de conexiones de lectura abiertas a la vez
+READ_POOL_SIZE = int(os.getenv("ALTERCLIP_WEB_READ_POOL", "8"))
+
+# Las respuestas más pequeñas que esto no se comprimen
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/css', 'text/javascript', 'application/javascript'}
+
+# Número de respuestas JSON (y sus versiones comprimidas) que se guardan en memoria
+RESPONSE_CACHE_SIZE = 64
+
+# Tamaño de página del historial y máximo que se admite por petición
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+# Número de sugerencias que devuelve por defecto el autocompletado de etiquetas
+TAG_SUGGEST_LIMIT = 10
+
+# Eventos en vivo (SSE): cada cuánto se mira si ha cambiado la base de datos,
+# cada cuánto se envía un comentario para mantener viva la conexión y cuántas
+# conexiones simultáneas se admiten (cada una ocupa un hilo del servidor)
+EVENTS_POLL_INTERVAL = 1.0
+EVENTS_KEEPALIVE = 15.0
+EVENTS_MAX_STREAMS = int(os.getenv("ALTERCLIP_WEB_MAX_STREAMS", "4"))
+EVENTS_BATCH_SIZE = 200
+
+# Máximo de operaciones que admite una petición a /api/batch
+BATCH_MAX_OPERATIONS = 1000
+
+# Parámetros por consulta en las listas IN (...): SQLite compilado con las
+# opciones antiguas no admite más de 999 variables
+SQL_IN_CHUNK_SIZE = 500
 
 app = Flask(__name__)
 
+# Con ALTERCLIP_PROFILE se perfila también bajo un servidor WSGI externo
+profiling.enable('web')
+
 # Añadir la fecha actual al contexto de todas las plantillas
 @app.context_processor
 def inject_now():
     return {'now': datetime.now()}
 
 def get_db_path() -> Path:
-    """Obtiene la ruta de la base de datos"""
-    return Path(user_log_dir("alterclip")) / "streaming_history.db"
+    """Obtiene la ruta de la base de datos (ALTERCLIP_DB permite usar otra)"""
+    return Path(os.getenv("ALTERCLIP_DB", Path(user_log_dir("alterclip")) / "streaming_history.db"))
+
+class ReadConnectionPool:
+    """Pool de conexiones SQLite de solo lectura reutilizadas entre peticiones
+
+    Las conexiones se abren bajo demanda hasta un máximo de `size`; cuando
+    están todas ocupadas, la petición espera a que otra libere la suya.
+    """
+
+    def __init__(self, db_path: Path, size: int):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = profiling.connect(f"{self.db_path.as_uri()}?mode=ro", uri=True,
+                                 check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if not can_create:
+            return self._idle.get()
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+
+class WriterConnection:
+    """Conexión única para las modificaciones, serializada con un cerrojo"""
+
+    def __init__(self, db_path: Path):
+        self.conn = profiling.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        # WAL permite que los lectores no se bloqueen mientras se escribe
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        # El registro de cambios es el mismo que usa la sincronización
+        ensure_change_log(self.conn, compact=True)
+        self.lock = threading.Lock()
+
+
+_pools_lock = threading.Lock()
+_read_pool = None
+_writer = None
+
+def _get_pools():
+    """Inicializa de forma perezosa el escritor y el pool de lectura
+
+    El escritor se crea primero para que la base de datos ya esté en modo
+    WAL cuando se abran las conexiones de solo lectura.
+    """
+    global _read_pool, _writer
+    if _read_pool is None:
+        with _pools_lock:
+            if _read_pool is None:
+                db_path = get_db_path()
+                _writer = WriterConnection(db_path)
+                _read_pool = ReadConnectionPool(db_path, READ_POOL_SIZE)
+    return _read_pool, _writer
+
+@contextmanager
+def read_connection():
+    """Presta una conexión de solo lectura del pool durante el bloque"""
+    pool, _ = _get_pools()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+@contextmanager
+def write_connection():
+    """Da acceso exclusivo a la conexión de escritura
+
+    Al salir del bloque se confirma la transacción, o se deshace si se
+    produjo una excepción.
+    """
+    _, writer = _get_pools()
+    with writer.lock:
+        try:
+            yield writer.conn
+            writer.conn.commit()
+        except Exception:
+            writer.conn.rollback()
+            raise
+
+# Recuentos por etiqueta, plataforma y visto, cacheados hasta que cambien los datos
+facet_service = FacetService(get_db_path(), read_connection)
 
-def get_connection():
-    """Crea y devuelve una conexión a la base de datos"""
-    return sqlite3.connect(get_db_path())
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+def _cache_get(key):
+    with _response_cache_lock:
+        value = _response_cache.get(key)
+        if value is not None:
+            _response_cache.move_to_end(key)
+        return value
+
+def _cache_put(key, value) -> None:
+    with _response_cache_lock:
+        _response_cache[key] = value
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+def conditional_json(view):
+    """Añade validadores ETag/Last-Modified a una vista JSON
+
+    El ETag se deriva del sello de cambios de la base de datos y de la ruta
+    completa de la petición. Si el cliente ya tiene la versión actual se
+    responde 304 sin ejecutar ninguna consulta, y si otro cliente la pidió
+    antes se reutiliza el cuerpo guardado en memoria.
+
+    Si el cliente envía If-None-Match solo cuenta el ETag. Last-Modified
+    tiene precisión de segundos, así que no se envía mientras la base de
+    datos se ha modificado en el segundo en curso: una escritura posterior
+    en ese mismo segundo no cambiaría la fecha y el cliente recibiría un 304
+    con datos viejos.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        stamp, mtime = database_stamp(get_db_path())
+        etag = hashlib.sha1(f"{stamp}|{request.full_path}".encode()).hexdigest()[:20]
+        last_modified = datetime.fromtimestamp(int(mtime), timezone.utc)
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = (request.if_modified_since is not None
+                            and last_modified <= request.if_modified_since
+                            and int(mtime) < int(time.time()))
+
+        if not_modified:
+            response = app.response_class(status=304)
+        else:
+            body = _cache_get(('body', etag))
+            if body is not None:
+                response = app.response_class(body, mimetype='application/json')
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                _cache_put(('body', etag), response.get_data())
+
+        response.set_etag(etag, weak=True)
+        if int(mtime) < int(time.time()):
+            response.last_modified = last_modified
+        # Obligar al navegador a revalidar siempre con el servidor
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
+
+@app.after_request
+def compress_response(response):
+    """Comprime con brotli o gzip las respuestas grandes si el cliente lo admite"""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    if brotli is not None and request.accept_encodings.quality('br') > 0:
+        encoding = 'br'
+    elif request.accept_encodings.quality('gzip') > 0:
+        encoding = 'gzip'
+    else:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    # Las respuestas con ETag son idénticas mientras no cambie la base de
+    # datos, así que su versión comprimida se puede reutilizar
+    etag, _ = response.get_etag()
+    compressed = _cache_get((encoding, etag)) if etag else None
+    if compressed is None:
+        if encoding == 'br':
+            compressed = brotli.compress(data, quality=5)
+        else:
+            compressed = gzip.compress(data, compresslevel=6)
+        if etag:
+            _cache_put((encoding, etag), compressed)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
 
 def remove_accents(text):
     """Elimina los acentos de una cadena de texto"""
@@ -32,92 +299,339 @@ def remove_accents(text):
         if unicodedata.category(c) != 'Mn'
     ).lower()
 
-def get_streaming_history(limit=50, search=None, tag=None, platform=None):
-    """Obtiene el historial de streaming con filtros opcionales"""
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row  # Para acceder a las columnas por nombre
-    cursor = conn.cursor()
-    
-    # Primero obtenemos los IDs de las URLs que coinciden con los filtros
-    query = """
-    SELECT DISTINCT sh.id
-    FROM streaming_history sh
+class TagPrefixIndex:
+    """Índice en memoria para autocompletar etiquetas
+
+    Guarda en un trie los nombres de las etiquetas, cada palabra del nombre
+    y la ruta completa en la jerarquía, todo sin acentos y en minúsculas.
+    Cada nodo del trie conoce las etiquetas que cuelgan de él, así que una
+    búsqueda solo recorre tantos nodos como letras tenga el prefijo.
+
+    El índice se construye la primera vez que se usa y se reconstruye cuando
+    cambia la base de datos (incluidas las escrituras del demonio o del CLI)
+    o cuando se llama a invalidate() tras modificar etiquetas desde la web.
+    """
+
+    # Tipos de coincidencia, de mejor a peor
+    MATCH_EXACT, MATCH_NAME, MATCH_WORD, MATCH_PATH = range(4)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stamp = None
+        # (trie, etiquetas): se sustituyen juntos para que una búsqueda
+        # concurrente nunca vea el trie de un índice y las etiquetas de otro
+        self.index = ({}, {})
+
+    def invalidate(self) -> None:
+        """Fuerza la reconstrucción del índice en la siguiente búsqueda"""
+        with self.lock:
+            self.stamp = None
+
+    def _insert(self, root: dict, key: str, tag_id: int, kind: int) -> None:
+        node = root
+        for char in key:
+            node = node.setdefault(char, {})
+            matches = node.setdefault(None, {})
+            if kind < matches.get(tag_id, self.MATCH_PATH + 1):
+                matches[tag_id] = kind
+
+    def _build(self) -> None:
+        with read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, name, description FROM tags")
+            tags = {row['id']: dict(row) for row in cursor.fetchall()}
+            cursor.execute("SELECT parent_id, child_id FROM tag_hierarchy")
+            parent_of = {child_id: parent_id for parent_id, child_id in cursor.fetchall()}
+
+        root = {}
+        for tag_id, tag in tags.items():
+            # Ruta completa subiendo por la jerarquía (protegida frente a ciclos)
+            path = [tag['name']]
+            seen = {tag_id}
+            parent_id = parent_of.get(tag_id)
+            while parent_id in tags and parent_id not in seen:
+                seen.add(parent_id)
+                path.append(tags[parent_id]['name'])
+                parent_id = parent_of.get(parent_id)
+            tag['full_path'] = ' > '.join(reversed(path))
+            tag['folded'] = remove_accents(tag['name'])
+
+            self._insert(root, tag['folded'], tag_id, self.MATCH_NAME)
+            for word in tag['folded'].split()[1:]:
+                self._insert(root, word, tag_id, self.MATCH_WORD)
+            self._insert(root, remove_accents(tag['full_path']), tag_id, self.MATCH_PATH)
+            for ancestor in path[1:]:
+                self._insert(root, remove_accents(ancestor), tag_id, self.MATCH_PATH)
+        self.index = (root, tags)
+
+    def _ensure_current(self) -> None:
+        stamp, _ = database_stamp(get_db_path())
+        with self.lock:
+            if self.stamp != stamp:
+                self._build()
+                self.stamp = stamp
+
+    def search(self, prefix: str, limit: int = TAG_SUGGEST_LIMIT) -> list:
+        """Devuelve las etiquetas que empiezan por `prefix`, ordenadas por relevancia
+
+        Primero la coincidencia exacta, luego las etiquetas cuyo nombre empieza
+        por el prefijo, después las que tienen una palabra que empieza por él y
+        por último las que lo contienen en su ruta (por ejemplo, sus padres).
+        """
+        self._ensure_current()
+        folded = remove_accents(prefix.strip())
+        if not folded:
+            return []
+
+        root, tags = self.index
+        node = root
+        for char in folded:
+            node = node.get(char)
+            if node is None:
+                return []
+
+        ranked = []
+        for tag_id, kind in node.get(None, {}).items():
+            tag = tags[tag_id]
+            if tag['folded'] == folded:
+                kind = self.MATCH_EXACT
+            ranked.append((kind, len(tag['name']), tag['full_path'], tag_id))
+        ranked.sort()
+
+        return [
+            {
+                'id': tag_id,
+                'name': tags[tag_id]['name'],
+                'description': tags[tag_id]['description'],
+                'full_path': tags[tag_id]['full_path'],
+            }
+            for _, _, _, tag_id in ranked[:limit]
+        ]
+
+tag_index = TagPrefixIndex()
+
+class ChangeWatcher:
+    """Vigila el registro de cambios y avisa a las conexiones de eventos en vivo
+
+    Un único hilo comprueba cada EVENTS_POLL_INTERVAL segundos el sello de
+    cambios de la base de datos (un stat, sin consultas) y solo cuando cambia
+    lee el último id de `change_log`. Las conexiones SSE esperan en una
+    condición a que ese id supere el último que enviaron.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.last_id = None
+        self.thread = None
+        self.streams = 0
+
+    def _read_last_id(self) -> int:
+        with read_connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+
+    def _run(self) -> None:
+        stamp = None
+        while True:
+            try:
+                current, _ = database_stamp(get_db_path())
+                if current != stamp:
+                    stamp = current
+                    last_id = self._read_last_id()
+                    with self.condition:
+                        if last_id != self.last_id:
+                            self.last_id = last_id
+                            self.condition.notify_all()
+            except Exception as e:
+                print(f"Error al vigilar los cambios de la base de datos: {e}")
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+    def current_id(self) -> int:
+        """Arranca el hilo si hace falta y devuelve el último id conocido"""
+        with self.condition:
+            if self.thread is None:
+                self.last_id = self._read_last_id()
+                self.thread = threading.Thread(target=self._run, name='change-watcher', daemon=True)
+                self.thread.start()
+            return self.last_id
+
+    def wait_for(self, after_id: int, timeout: float) -> bool:
+        """Espera a que haya cambios posteriores a `after_id`"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.last_id > after_id, timeout)
+
+    def acquire_stream(self) -> bool:
+        with self.condition:
+            if self.streams >= EVENTS_MAX_STREAMS:
+                return False
+            self.streams += 1
+            return True
+
+    def release_stream(self) -> None:
+        with self.condition:
+            self.streams -= 1
+
+change_watcher = ChangeWatcher()
+
+def read_history_changes(after_id: int) -> Tuple[int, List]:
+    """Lee los cambios del historial posteriores a `after_id`
+
+    Los cambios de una misma entrada se agrupan en uno solo. Las inserciones y
+    modificaciones incluyen la entrada actual con sus etiquetas.
+
+    Returns:
+        tuple: (id del último cambio leído, lista de eventos)
+    """
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, row_id, CASE WHEN entity = 'url_tag' THEN 'update' ELSE op END
+            FROM change_log
+            WHERE id > ? AND entity IN ('history', 'url_tag') AND row_id IS NOT NULL
+            ORDER BY id
+            LIMIT ?
+        """, (after_id, EVENTS_BATCH_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            return after_id, []
+
+        ops = {}
+        for _, row_id, op in rows:
+            # Una inserción seguida de modificaciones sigue siendo una inserción
+            if op == 'update' and ops.get(row_id) == 'insert':
+                continue
+            ops[row_id] = op
+
+        live_ids = [row_id for row_id, op in ops.items() if op != 'delete']
+        entries = {entry['id']: entry for entry in fetch_history_entries(cursor, live_ids)}
+
+    events = []
+    for row_id, op in ops.items():
+        if row_id in entries:
+            events.append({"op": op, "item": entries[row_id]})
+        else:
+            events.append({"op": "delete", "id": row_id})
+    return rows[-1][0], events
+
+def encode_history_cursor(entry: dict) -> str:
+    """Codifica la posición de una entrada del historial como cursor opaco"""
+    raw = f"{entry['timestamp']}|{entry['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_history_cursor(token: str) -> Tuple[str, int]:
+    """Decodifica un cursor del historial
+
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        timestamp, entry_id = raw.rsplit('|', 1)
+        return timestamp, int(entry_id)
+    except Exception:
+        raise ValueError(f"Cursor no válido: {token}")
+
+def get_streaming_history(limit=50, search=None, tag=None, platform=None, after=None):
+    """Obtiene el historial de streaming con filtros opcionales
+
+    Si se indica `after` (una tupla (timestamp, id) obtenida con
+    decode_history_cursor), solo se devuelven las entradas posteriores a
+    esa posición en el orden del historial.
     """
+    with read_connection() as conn:
+        cursor = conn.cursor()
+    
+        # Primero obtenemos los IDs de las URLs que coinciden con los filtros
+        query = """
+        SELECT DISTINCT sh.id
+        FROM streaming_history sh
+        """
     
-    where_conditions = []
-    params = []
+        where_conditions = []
+        params = []
     
-    if tag:
-        # Primero obtenemos el ID del tag
-        cursor.execute("SELECT id FROM tags WHERE name = ?", (tag,))
-        tag_row = cursor.fetchone()
+        if tag:
+            # Primero obtenemos el ID del tag
+            cursor.execute("SELECT id FROM tags WHERE name = ?", (tag,))
+            tag_row = cursor.fetchone()
         
-        if tag_row:
-            tag_id = tag_row[0]
+            if tag_row:
+                tag_id = tag_row[0]
             
-            # Obtenemos todos los IDs de tags hijos (incluyendo el propio tag)
-            cursor.execute("""
-                WITH RECURSIVE child_tags(id) AS (
-                    SELECT id FROM tags WHERE id = ?
-                    UNION ALL
-                    SELECT th.child_id 
-                    FROM tag_hierarchy th
-                    JOIN child_tags ct ON th.parent_id = ct.id
-                )
-                SELECT id FROM child_tags
-            """, (tag_id,))
+                # Obtenemos todos los IDs de tags hijos (incluyendo el propio tag)
+                cursor.execute("""
+                    WITH RECURSIVE child_tags(id) AS (
+                        SELECT id FROM tags WHERE id = ?
+                        UNION ALL
+                        SELECT th.child_id 
+                        FROM tag_hierarchy th
+                        JOIN child_tags ct ON th.parent_id = ct.id
+                    )
+                    SELECT id FROM child_tags
+                """, (tag_id,))
             
-            child_tag_ids = [row[0] for row in cursor.fetchall()]
+                child_tag_ids = [row[0] for row in cursor.fetchall()]
             
-            # Modificamos la consulta para buscar cualquiera de los tags hijos
-            query += """
-            JOIN url_tags ut ON sh.id = ut.url_id
-            """
-            placeholders = ','.join(['?'] * len(child_tag_ids))
-            where_conditions.append(f"ut.tag_id IN ({placeholders})")
-            params.extend(child_tag_ids)
-        else:
-            # Si el tag no existe, no devolvemos resultados
-            return []
-    
-    if search:
-        where_conditions.append("(LOWER(sh.title) LIKE ? OR LOWER(sh.url) LIKE ?)")
-        search_term = f"%{search.lower()}%"
-        params.extend([search_term, search_term])
+                # Modificamos la consulta para buscar cualquiera de los tags hijos
+                query += """
+                JOIN url_tags ut ON sh.id = ut.url_id
+                """
+                placeholders = ','.join(['?'] * len(child_tag_ids))
+                where_conditions.append(f"ut.tag_id IN ({placeholders})")
+                params.extend(child_tag_ids)
+            else:
+                # Si el tag no existe, no devolvemos resultados
+                return []
     
-    if platform:
-        where_conditions.append("LOWER(sh.platform) = LOWER(?)")
-        params.append(platform)
+        if search:
+            where_conditions.append("(LOWER(sh.title) LIKE ? OR LOWER(sh.url) LIKE ?)")
+            search_term = f"%{search.lower()}%"
+            params.extend([search_term, search_term])
     
-    if where_conditions:
-        query += " WHERE " + " AND ".join(where_conditions)
+        if platform:
+            where_conditions.append("LOWER(sh.platform) = LOWER(?)")
+            params.append(platform)
+
+        if after:
+            # Paginación por clave: continuar justo después de la última entrada vista
+            cursor_timestamp, cursor_id = after
+            where_conditions.append("(sh.timestamp < ? OR (sh.timestamp = ? AND sh.id < ?))")
+            params.extend([cursor_timestamp, cursor_timestamp, cursor_id])
     
-    query += " ORDER BY sh.timestamp DESC LIMIT ?"
-    params.append(limit)
+        if where_conditions:
+            query += " WHERE " + " AND ".join(where_conditions)
     
-    cursor.execute(query, params)
-    url_ids = [row[0] for row in cursor.fetchall()]
+        query += " ORDER BY sh.timestamp DESC, sh.id DESC LIMIT ?"
+        params.append(limit)
     
+        cursor.execute(query, params)
+        url_ids = [row[0] for row in cursor.fetchall()]
+        return fetch_history_entries(cursor, url_ids)
+
+def fetch_history_entries(cursor, url_ids):
+    """Obtiene las entradas del historial indicadas junto con sus etiquetas
+
+    Las entradas se devuelven ordenadas de más reciente a más antigua; los
+    ids que ya no existen se omiten.
+    """
     if not url_ids:
         return []
-    
-    # Ahora obtenemos los detalles completos de las URLs y sus etiquetas
+
     placeholders = ','.join(['?'] * len(url_ids))
-    
+
     # Obtenemos los detalles de las URLs
     cursor.execute(f"""
         SELECT id, url, title, platform, timestamp, visto
         FROM streaming_history
         WHERE id IN ({placeholders})
-        ORDER BY timestamp DESC
+        ORDER BY timestamp DESC, id DESC
     """, url_ids)
-    
+
     results = []
     for row in cursor.fetchall():
         result = dict(row)
         result['tags'] = []
         results.append(result)
-    
+
     # Obtenemos todas las etiquetas para las URLs seleccionadas
     cursor.execute(f"""
         SELECT ut.url_id, t.id, t.name
@@ -125,81 +639,91 @@ def get_streaming_history(limit=50, search=None, tag=None, platform=None):
         JOIN tags t ON ut.tag_id = t.id
         WHERE ut.url_id IN ({placeholders})
     """, url_ids)
-    
+
     # Asignamos las etiquetas a cada URL
     url_tags = {}
     for url_id, tag_id, tag_name in cursor.fetchall():
         if url_id not in url_tags:
             url_tags[url_id] = []
         url_tags[url_id].append({"id": tag_id, "name": tag_name})
-    
+
     # Actualizamos los resultados con las etiquetas
     for result in results:
         result['tags'] = url_tags.get(result['id'], [])
-    
-    conn.close()
+
     return results
 
+def get_history_page(limit=HISTORY_PAGE_SIZE, search=None, tag=None, platform=None, cursor=None):
+    """Obtiene una página del historial y el cursor para continuar
+
+    Returns:
+        tuple: (entradas, cursor de la siguiente página o None si no hay más)
+    """
+    decoded = decode_history_cursor(cursor) if cursor else None
+    entries = get_streaming_history(limit=limit + 1, search=search, tag=tag,
+                                    platform=platform, after=decoded)
+    if len(entries) > limit:
+        entries = entries[:limit]
+        return entries, encode_history_cursor(entries[-1])
+    return entries, None
+
 def get_tags():
     """Obtiene todos los tags únicos con su jerarquía"""
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with read_connection() as conn:
+        cursor = conn.cursor()
     
-    # Obtenemos todos los tags
-    cursor.execute("""
-        SELECT id, name, description 
-        FROM tags
-        ORDER BY name
-    """)
+        # Obtenemos todos los tags
+        cursor.execute("""
+            SELECT id, name, description 
+            FROM tags
+            ORDER BY name
+        """)
     
-    tags = []
-    for row in cursor:
-        tags.append({
-            'id': row['id'],
-            'name': row['name'],
-            'description': row['description']
-        })
+        tags = []
+        for row in cursor:
+            tags.append({
+                'id': row['id'],
+                'name': row['name'],
+                'description': row['description']
+            })
     
-    # Obtenemos las relaciones de jerarquía
-    cursor.execute("""
-        SELECT parent_id, child_id 
-        FROM tag_hierarchy
-    """)
+        # Obtenemos las relaciones de jerarquía
+        cursor.execute("""
+            SELECT parent_id, child_id 
+            FROM tag_hierarchy
+        """)
     
-    # Creamos un diccionario para mapear hijos a padres
-    child_to_parent = {}
-    for parent_id, child_id in cursor:
-        child_to_parent[child_id] = parent_id
+        # Creamos un diccionario para mapear hijos a padres
+        child_to_parent = {}
+        for parent_id, child_id in cursor:
+            child_to_parent[child_id] = parent_id
     
-    # Construimos la jerarquía
-    tag_by_id = {tag['id']: tag for tag in tags}
-    for tag in tags:
-        tag_id = tag['id']
-        if tag_id in child_to_parent:
-            parent_id = child_to_parent[tag_id]
-            if parent_id in tag_by_id:
-                parent_name = tag_by_id[parent_id]['name']
-                tag['full_path'] = f"{parent_name} > {tag['name']}"
+        # Construimos la jerarquía
+        tag_by_id = {tag['id']: tag for tag in tags}
+        for tag in tags:
+            tag_id = tag['id']
+            if tag_id in child_to_parent:
+                parent_id = child_to_parent[tag_id]
+                if parent_id in tag_by_id:
+                    parent_name = tag_by_id[parent_id]['name']
+                    tag['full_path'] = f"{parent_name} > {tag['name']}"
+                else:
+                    tag['full_path'] = tag['name']
             else:
                 tag['full_path'] = tag['name']
-        else:
-            tag['full_path'] = tag['name']
     
-    # Ordenamos por el path completo
-    tags.sort(key=lambda x: x['full_path'])
+        # Ordenamos por el path completo
+        tags.sort(key=lambda x: x['full_path'])
     
-    conn.close()
-    return tags
+        return tags
 
 def get_platforms():
     """Obtiene todas las plataformas únicas"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT platform FROM streaming_history WHERE platform IS NOT NULL ORDER BY platform")
-    platforms = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return platforms
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT platform FROM streaming_history WHERE platform IS NOT NULL ORDER BY platform")
+        platforms = [row[0] for row in cursor.fetchall()]
+        return platforms
 
 @app.route('/')
 def index():
@@ -208,66 +732,65 @@ def index():
     tag = request.args.get('tag')
     platform = request.args.get('platform')
     
-    history = get_streaming_history(search=search, tag=tag, platform=platform)
+    history, next_cursor = get_history_page(search=search, tag=tag, platform=platform)
     tags = get_tags()
     platforms = get_platforms()
     
     # Obtener todos los tags jerárquicamente
     def get_hierarchical_tags():
-        conn = get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Obtener todos los tags
-        cursor.execute("""
-            SELECT id, name, COALESCE(description, '') as description 
-            FROM tags 
-            ORDER BY name
-        """)
-        all_tags = {row['id']: dict(row) for row in cursor.fetchall()}
+        with read_connection() as conn:
+            cursor = conn.cursor()
         
-        # Obtener las relaciones de jerarquía
-        cursor.execute("""
-            SELECT parent_id, child_id 
-            FROM tag_hierarchy 
-            ORDER BY parent_id, child_id
-        """)
+            # Obtener todos los tags
+            cursor.execute("""
+                SELECT id, name, COALESCE(description, '') as description 
+                FROM tags 
+                ORDER BY name
+            """)
+            all_tags = {row['id']: dict(row) for row in cursor.fetchall()}
         
-        # Construir la jerarquía
-        hierarchy = {}
-        for parent_id, child_id in cursor.fetchall():
-            if parent_id not in hierarchy:
-                hierarchy[parent_id] = []
-            hierarchy[parent_id].append(child_id)
-        
-        # Encontrar los tags raíz (sin padres)
-        all_child_ids = {child_id for children in hierarchy.values() for child_id in children}
-        root_tag_ids = [tag_id for tag_id in all_tags if tag_id not in all_child_ids]
-        
-        # Construir la lista jerárquica
-        def build_hierarchical_list(tag_id, level=0):
-            tag = all_tags[tag_id].copy()
-            tag['level'] = level
-            result = [tag]
+            # Obtener las relaciones de jerarquía
+            cursor.execute("""
+                SELECT parent_id, child_id 
+                FROM tag_hierarchy 
+                ORDER BY parent_id, child_id
+            """)
+        
+            # Construir la jerarquía
+            hierarchy = {}
+            for parent_id, child_id in cursor.fetchall():
+                if parent_id not in hierarchy:
+                    hierarchy[parent_id] = []
+                hierarchy[parent_id].append(child_id)
+        
+            # Encontrar los tags raíz (sin padres)
+            all_child_ids = {child_id for children in hierarchy.values() for child_id in children}
+            root_tag_ids = [tag_id for tag_id in all_tags if tag_id not in all_child_ids]
+        
+            # Construir la lista jerárquica
+            def build_hierarchical_list(tag_id, level=0):
+                tag = all_tags[tag_id].copy()
+                tag['level'] = level
+                result = [tag]
             
-            if tag_id in hierarchy:
-                for child_id in hierarchy[tag_id]:
-                    result.extend(build_hierarchical_list(child_id, level + 1))
+                if tag_id in hierarchy:
+                    for child_id in hierarchy[tag_id]:
+                        result.extend(build_hierarchical_list(child_id, level + 1))
             
-            return result
+                return result
         
-        # Construir la lista completa
-        hierarchical_tags = []
-        for root_id in root_tag_ids:
-            hierarchical_tags.extend(build_hierarchical_list(root_id))
+            # Construir la lista completa
+            hierarchical_tags = []
+            for root_id in root_tag_ids:
+                hierarchical_tags.extend(build_hierarchical_list(root_id))
         
-        conn.close()
-        return hierarchical_tags
+            return hierarchical_tags
     
     all_tags = get_hierarchical_tags()
     
     return render_template('index.html', 
                          history=history, 
+                         next_cursor=next_cursor,
                          tags=tags,
                          all_tags=all_tags,
                          platforms=platforms,
@@ -278,115 +801,210 @@ def index():
 @app.route('/tag/<tag_name>')
 def tag_view(tag_name):
     """Vista para mostrar contenido de un tag específico"""
-    history = get_streaming_history(tag=tag_name)
+    history, next_cursor = get_history_page(tag=tag_name)
     tags = get_tags()
     platforms = get_platforms()
     
     return render_template('index.html', 
                          history=history, 
+                         next_cursor=next_cursor,
                          tags=tags,
                          platforms=platforms,
                          current_tag=tag_name)
 
 @app.route('/api/history')
+@conditional_json
 def api_history():
-    """API para obtener el historial en formato JSON"""
+    """API para obtener el historial en formato JSON, paginado por cursor
+
+    Devuelve {"items": [...], "next_cursor": "..."}; para obtener la página
+    siguiente basta con repetir la petición añadiendo cursor=<next_cursor>.
+    next_cursor es null cuando no quedan más entradas.
+    """
     search = request.args.get('search')
     tag = request.args.get('tag')
     platform = request.args.get('platform')
-    limit = int(request.args.get('limit', 50))
-    
-    history = get_streaming_history(limit=limit, search=search, tag=tag, platform=platform)
-    return jsonify(history)
+    cursor = request.args.get('cursor')
+    try:
+        limit = int(request.args.get('limit', HISTORY_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"status": "error", "message": "El parámetro 'limit' debe ser un número"}), 400
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+    try:
+        history, next_cursor = get_history_page(limit=limit, search=search, tag=tag,
+                                                platform=platform, cursor=cursor)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"items": history, "next_cursor": next_cursor})
+
+@app.route('/api/events')
+def api_events():
+    """Flujo de eventos (Server-Sent Events) con los cambios del historial
+
+    Cada evento `history` lleva `{"op": "insert"|"update", "item": {...}}` o
+    `{"op": "delete", "id": ...}`. El id de cada evento es la posición en el
+    registro de cambios, así que al reconectar el navegador envía
+    `Last-Event-ID` y se reanuda sin perder cambios.
+    """
+    if not change_watcher.acquire_stream():
+        response = jsonify({"status": "error", "message": "Demasiadas conexiones de eventos abiertas"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+
+    try:
+        last_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_id = None
+    try:
+        current_id = change_watcher.current_id()
+    except Exception:
+        change_watcher.release_stream()
+        raise
+    if last_id is None or last_id > current_id:
+        last_id = current_id
+
+    # waitress informa de los clientes que se han desconectado (ver serve_production)
+    client_disconnected = request.environ.get('waitress.client_disconnected', lambda: False)
+
+    def generate(last_id):
+        yield "retry: 5000\n\n"
+        last_write = time.monotonic()
+        while not client_disconnected():
+            if not change_watcher.wait_for(last_id, EVENTS_POLL_INTERVAL * 5):
+                if time.monotonic() - last_write >= EVENTS_KEEPALIVE:
+                    # Comentario para mantener viva la conexión a través de proxies
+                    yield ": keepalive\n\n"
+                    last_write = time.monotonic()
+                continue
+            last_id, events = read_history_changes(last_id)
+            for event in events:
+                yield f"id: {last_id}\nevent: history\ndata: {json.dumps(event)}\n\n"
+            last_write = time.monotonic()
+
+    response = Response(generate(last_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(change_watcher.release_stream)
+    return response
 
 @app.route('/api/tags')
+@conditional_json
 def api_tags():
-    """API para obtener todos los tags"""
+    """API para obtener todos los tags
+
+    Con el parámetro `name` devuelve solo las etiquetas que coinciden con ese
+    nombre (sin distinguir acentos ni mayúsculas) usando el índice de prefijos.
+    """
+    name = request.args.get('name', '').strip()
+    if name:
+        return jsonify({"status": "success", "tags": tag_index.search(name)})
     tags = get_tags()
     return jsonify(tags)
 
+@app.route('/api/tags/suggest')
+def api_tags_suggest():
+    """Autocompletado de etiquetas por prefijo de nombre, palabra o ruta"""
+    try:
+        limit = int(request.args.get('limit', TAG_SUGGEST_LIMIT))
+    except ValueError:
+        return jsonify({"status": "error", "message": "El parámetro 'limit' debe ser un número"}), 400
+    limit = max(1, min(limit, 100))
+    return jsonify({"status": "success", "tags": tag_index.search(request.args.get('q', ''), limit)})
+
 @app.route('/api/mark_as_viewed/<int:url_id>', methods=['POST'])
 def mark_as_viewed(url_id):
     """Marca una URL como vista"""
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Incrementar el contador de visto
-        cursor.execute("""
-            UPDATE streaming_history 
-            SET visto = COALESCE(visto, 0) + 1 
-            WHERE id = ?
-        """, (url_id,))
+        with write_connection() as conn:
+            cursor = conn.cursor()
         
-        conn.commit()
-        conn.close()
+            # Incrementar el contador de visto
+            cursor.execute("""
+                UPDATE streaming_history 
+                SET visto = COALESCE(visto, 0) + 1 
+                WHERE id = ?
+            """, (url_id,))
         
-        return jsonify({"status": "success", "message": "Marcado como visto"}), 200
+            return jsonify({"status": "success", "message": "Marcado como visto"}), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/facets')
+@conditional_json
+def api_facets():
+    """Recuentos por etiqueta (directos y con descendientes), plataforma y visto
+
+    Acepta los mismos filtros que /api/history (search, tag y platform).
+    """
+    facets = facet_service.get(
+        search=request.args.get('search'),
+        tag=request.args.get('tag'),
+        platform=request.args.get('platform'),
+    )
+    return jsonify(facets)
+
 @app.route('/api/tag_hierarchy')
+@conditional_json
 def api_tag_hierarchy():
     """API para obtener la jerarquía de tags en formato anidado"""
     def build_hierarchy():
-        conn = get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Obtener todos los tags
-        cursor.execute("""
-            SELECT id, name, COALESCE(description, '') as description 
-            FROM tags
-        """)
-        
-        # Crear un diccionario con todos los tags
-        tag_map = {}
-        for row in cursor:
-            tag_map[row['id']] = {
-                'id': row['id'],
-                'name': row['name'],
-                'description': row['description'],
-                'children': []
-            }
+        with read_connection() as conn:
+            cursor = conn.cursor()
         
-        # Obtener las relaciones de jerarquía
-        cursor.execute("""
-            SELECT parent_id, child_id 
-            FROM tag_hierarchy
-        """)
-        
-        # Construir la jerarquía
-        child_to_parent = {}
-        for parent_id, child_id in cursor:
-            child_to_parent[child_id] = parent_id
+            # Obtener todos los tags
+            cursor.execute("""
+                SELECT id, name, COALESCE(description, '') as description 
+                FROM tags
+            """)
+        
+            # Crear un diccionario con todos los tags
+            tag_map = {}
+            for row in cursor:
+                tag_map[row['id']] = {
+                    'id': row['id'],
+                    'name': row['name'],
+                    'description': row['description'],
+                    'children': []
+                }
+        
+            # Obtener las relaciones de jerarquía
+            cursor.execute("""
+                SELECT parent_id, child_id 
+                FROM tag_hierarchy
+            """)
+        
+            # Construir la jerarquía
+            child_to_parent = {}
+            for parent_id, child_id in cursor:
+                child_to_parent[child_id] = parent_id
             
-            # Si el padre existe, añadir el hijo a sus hijos
-            if parent_id in tag_map and child_id in tag_map:
-                tag_map[parent_id]['children'].append(tag_map[child_id])
-        
-        # Identificar los tags raíz (aquellos que no son hijos de nadie)
-        root_tags = []
-        for tag_id, tag in tag_map.items():
-            if tag_id not in child_to_parent:
-                root_tags.append(tag)
-        
-        # Función para calcular el nivel y ruta completa de cada tag
-        def process_tag(tag, level=0, parent_path=None):
-            path = f"{parent_path} > {tag['name']}" if parent_path else tag['name']
-            tag['level'] = level
-            tag['full_path'] = path
+                # Si el padre existe, añadir el hijo a sus hijos
+                if parent_id in tag_map and child_id in tag_map:
+                    tag_map[parent_id]['children'].append(tag_map[child_id])
+        
+            # Identificar los tags raíz (aquellos que no son hijos de nadie)
+            root_tags = []
+            for tag_id, tag in tag_map.items():
+                if tag_id not in child_to_parent:
+                    root_tags.append(tag)
+        
+            # Función para calcular el nivel y ruta completa de cada tag
+            def process_tag(tag, level=0, parent_path=None):
+                path = f"{parent_path} > {tag['name']}" if parent_path else tag['name']
+                tag['level'] = level
+                tag['full_path'] = path
             
-            # Procesar recursivamente los hijos
-            for child in tag['children']:
-                process_tag(child, level + 1, path)
+                # Procesar recursivamente los hijos
+                for child in tag['children']:
+                    process_tag(child, level + 1, path)
         
-        # Procesar todos los tags raíz
-        for tag in root_tags:
-            process_tag(tag)
+            # Procesar todos los tags raíz
+            for tag in root_tags:
+                process_tag(tag)
         
-        conn.close()
-        return root_tags
+            return root_tags
     
     try:
         hierarchy = build_hierarchy()
@@ -398,19 +1016,16 @@ def api_tag_hierarchy():
 def delete_url(url_id):
     """Elimina una URL del historial"""
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Eliminar las relaciones de etiquetas primero
-        cursor.execute("DELETE FROM url_tags WHERE url_id = ?", (url_id,))
+        with write_connection() as conn:
+            cursor = conn.cursor()
         
-        # Luego eliminar la URL del historial
-        cursor.execute("DELETE FROM streaming_history WHERE id = ?", (url_id,))
+            # Eliminar las relaciones de etiquetas primero
+            cursor.execute("DELETE FROM url_tags WHERE url_id = ?", (url_id,))
         
-        conn.commit()
-        conn.close()
+            # Luego eliminar la URL del historial
+            cursor.execute("DELETE FROM streaming_history WHERE id = ?", (url_id,))
         
-        return jsonify({"status": "success", "message": "URL eliminada correctamente"}), 200
+            return jsonify({"status": "success", "message": "URL eliminada correctamente"}), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -430,28 +1045,25 @@ def create_tag():
         if not name:
             return jsonify({"status": "error", "message": "El nombre de la etiqueta es obligatorio"}), 400
             
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si la etiqueta ya existe
-        cursor.execute("SELECT id FROM tags WHERE name = ?", (name,))
-        if cursor.fetchone():
-            conn.close()
-            return jsonify({"status": "error", "message": "Ya existe una etiqueta con ese nombre"}), 400
+        with write_connection() as conn:
+            cursor = conn.cursor()
         
-        # Insertar la nueva etiqueta
-        cursor.execute("INSERT INTO tags (name, description) VALUES (?, ?)", 
-                     (name, data.get('description', '')))
-        tag_id = cursor.lastrowid
+            # Verificar si la etiqueta ya existe
+            cursor.execute("SELECT id FROM tags WHERE name = ?", (name,))
+            if cursor.fetchone():
+                return jsonify({"status": "error", "message": "Ya existe una etiqueta con ese nombre"}), 400
         
-        # Si tiene padre, crear la relación de jerarquía
-        if parent_id:
-            cursor.execute("INSERT INTO tag_hierarchy (parent_id, child_id) VALUES (?, ?)", 
-                         (parent_id, tag_id))
+            # Insertar la nueva etiqueta
+            cursor.execute("INSERT INTO tags (name, description) VALUES (?, ?)", 
+                         (name, data.get('description', '')))
+            tag_id = cursor.lastrowid
         
-        conn.commit()
-        conn.close()
+            # Si tiene padre, crear la relación de jerarquía
+            if parent_id:
+                cursor.execute("INSERT INTO tag_hierarchy (parent_id, child_id) VALUES (?, ?)", 
+                             (parent_id, tag_id))
         
+        tag_index.invalidate()
         return jsonify({
             "status": "success", 
             "message": "Etiqueta creada correctamente",
@@ -465,34 +1077,32 @@ def create_tag():
 def delete_tag(tag_id):
     """Elimina una etiqueta"""
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si la etiqueta tiene hijos
-        cursor.execute("SELECT COUNT(*) FROM tag_hierarchy WHERE parent_id = ?", (tag_id,))
-        if cursor.fetchone()[0] > 0:
-            return jsonify({
-                "status": "error", 
-                "message": "No se puede eliminar una etiqueta que tiene etiquetas hijas"
-            }), 400
-        
-        # Verificar si la etiqueta está en uso
-        cursor.execute("SELECT COUNT(*) FROM url_tags WHERE tag_id = ?", (tag_id,))
-        if cursor.fetchone()[0] > 0:
-            return jsonify({
-                "status": "error", 
-                "message": "No se puede eliminar una etiqueta que está en uso"
-            }), 400
-        
-        # Eliminar relaciones de jerarquía
-        cursor.execute("DELETE FROM tag_hierarchy WHERE child_id = ?", (tag_id,))
-        
-        # Eliminar la etiqueta
-        cursor.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
-        
-        conn.commit()
-        conn.close()
-        
+        with write_connection() as conn:
+            cursor = conn.cursor()
+        
+            # Verificar si la etiqueta tiene hijos
+            cursor.execute("SELECT COUNT(*) FROM tag_hierarchy WHERE parent_id = ?", (tag_id,))
+            if cursor.fetchone()[0] > 0:
+                return jsonify({
+                    "status": "error", 
+                    "message": "No se puede eliminar una etiqueta que tiene etiquetas hijas"
+                }), 400
+        
+            # Verificar si la etiqueta está en uso
+            cursor.execute("SELECT COUNT(*) FROM url_tags WHERE tag_id = ?", (tag_id,))
+            if cursor.fetchone()[0] > 0:
+                return jsonify({
+                    "status": "error", 
+                    "message": "No se puede eliminar una etiqueta que está en uso"
+                }), 400
+        
+            # Eliminar relaciones de jerarquía
+            cursor.execute("DELETE FROM tag_hierarchy WHERE child_id = ?", (tag_id,))
+        
+            # Eliminar la etiqueta
+            cursor.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
+        
+        tag_index.invalidate()
         return jsonify({"status": "success", "message": "Etiqueta eliminada correctamente"}), 200
         
     except Exception as e:
@@ -508,39 +1118,36 @@ def add_tag_to_url(url_id):
         if not tag_id:
             return jsonify({"status": "error", "message": "Se requiere el ID de la etiqueta"}), 400
             
-        conn = get_connection()
-        cursor = conn.cursor()
+        with write_connection() as conn:
+            cursor = conn.cursor()
         
-        # Verificar si la URL existe
-        cursor.execute("SELECT id FROM streaming_history WHERE id = ?", (url_id,))
-        if not cursor.fetchone():
-            return jsonify({"status": "error", "message": "URL no encontrada"}), 404
+            # Verificar si la URL existe
+            cursor.execute("SELECT id FROM streaming_history WHERE id = ?", (url_id,))
+            if not cursor.fetchone():
+                return jsonify({"status": "error", "message": "URL no encontrada"}), 404
             
-        # Verificar si la etiqueta existe
-        cursor.execute("SELECT id FROM tags WHERE id = ?", (tag_id,))
-        if not cursor.fetchone():
-            return jsonify({"status": "error", "message": "Etiqueta no encontrada"}), 404
+            # Verificar si la etiqueta existe
+            cursor.execute("SELECT id FROM tags WHERE id = ?", (tag_id,))
+            if not cursor.fetchone():
+                return jsonify({"status": "error", "message": "Etiqueta no encontrada"}), 404
             
-        # Verificar si la etiqueta ya está asignada
-        cursor.execute("SELECT 1 FROM url_tags WHERE url_id = ? AND tag_id = ?", (url_id, tag_id))
-        if cursor.fetchone():
-            return jsonify({"status": "error", "message": "La etiqueta ya está asignada a esta URL"}), 400
+            # Verificar si la etiqueta ya está asignada
+            cursor.execute("SELECT 1 FROM url_tags WHERE url_id = ? AND tag_id = ?", (url_id, tag_id))
+            if cursor.fetchone():
+                return jsonify({"status": "error", "message": "La etiqueta ya está asignada a esta URL"}), 400
             
-        # Asignar la etiqueta a la URL
-        cursor.execute("INSERT INTO url_tags (url_id, tag_id) VALUES (?, ?)", (url_id, tag_id))
-        
-        # Obtener información de la etiqueta para la respuesta
-        cursor.execute("SELECT name FROM tags WHERE id = ?", (tag_id,))
-        tag_name = cursor.fetchone()[0]
+            # Asignar la etiqueta a la URL
+            cursor.execute("INSERT INTO url_tags (url_id, tag_id) VALUES (?, ?)", (url_id, tag_id))
         
-        conn.commit()
-        conn.close()
+            # Obtener información de la etiqueta para la respuesta
+            cursor.execute("SELECT name FROM tags WHERE id = ?", (tag_id,))
+            tag_name = cursor.fetchone()[0]
         
-        return jsonify({
-            "status": "success", 
-            "message": "Etiqueta asignada correctamente",
-            "tag": {"id": tag_id, "name": tag_name}
-        }), 201
+            return jsonify({
+                "status": "success", 
+                "message": "Etiqueta asignada correctamente",
+                "tag": {"id": tag_id, "name": tag_name}
+            }), 201
         
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -550,149 +1157,211 @@ def mark_as_unseen(url_id):
     """Marca una URL como no vista"""
     try:
         print(f"Intentando marcar URL {url_id} como no vista")
-        conn = get_connection()
-        cursor = conn.cursor()
+        with write_connection() as conn:
+            cursor = conn.cursor()
         
-        # Verificar si la URL existe primero
-        cursor.execute("SELECT id FROM streaming_history WHERE id = ?", (url_id,))
-        if not cursor.fetchone():
-            conn.close()
-            print(f"Error: URL con ID {url_id} no encontrada")
-            return jsonify({"status": "error", "message": "URL no encontrada"}), 404
+            # Verificar si la URL existe primero
+            cursor.execute("SELECT id FROM streaming_history WHERE id = ?", (url_id,))
+            if not cursor.fetchone():
+                print(f"Error: URL con ID {url_id} no encontrada")
+                return jsonify({"status": "error", "message": "URL no encontrada"}), 404
         
-        # Establecer el contador de visto a 0
-        cursor.execute("""
-            UPDATE streaming_history 
-            SET visto = 0 
-            WHERE id = ?
-        """, (url_id,))
-        
-        # Verificar si se actualizó alguna fila
-        if cursor.rowcount == 0:
-            conn.close()
-            print(f"Error: No se pudo actualizar la URL con ID {url_id}")
-            return jsonify({"status": "error", "message": "No se pudo actualizar la URL"}), 500
-        
-        conn.commit()
-        conn.close()
-        
-        print(f"URL {url_id} marcada como no vista correctamente")
-        return jsonify({"status": "success", "message": "Marcado como no visto"}), 200
+            # Establecer el contador de visto a 0
+            cursor.execute("""
+                UPDATE streaming_history 
+                SET visto = 0 
+                WHERE id = ?
+            """, (url_id,))
+        
+            # Verificar si se actualizó alguna fila
+            if cursor.rowcount == 0:
+                print(f"Error: No se pudo actualizar la URL con ID {url_id}")
+                return jsonify({"status": "error", "message": "No se pudo actualizar la URL"}), 500
+        
+            print(f"URL {url_id} marcada como no vista correctamente")
+            return jsonify({"status": "success", "message": "Marcado como no visto"}), 200
     except Exception as e:
         error_msg = f"Error al marcar como no visto: {str(e)}"
         print(error_msg)
         return jsonify({"status": "error", "message": error_msg}), 500
 
-@app.route('/api/tags')
-def get_tags_by_name():
-    """Obtiene etiquetas por nombre (búsqueda)"""
+@app.route('/api/urls/<int:url_id>/tags/<int:tag_id>', methods=['DELETE'])
+def remove_tag_from_url(url_id, tag_id):
+    """Elimina una etiqueta de una URL"""
     try:
-        # Obtener y decodificar el parámetro 'name' de la URL
-        name_encoded = request.args.get('name', '').strip()
-        if not name_encoded:
-            return jsonify({"status": "error", "message": "Se requiere el parámetro 'name'"}), 400
-            
-        # Decodificar el nombre de la etiqueta (maneja espacios y caracteres especiales)
-        name = unquote(name_encoded)
-        
-        conn = get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Obtener todas las etiquetas para depuración
-        cursor.execute("SELECT id, name FROM tags ORDER BY name")
-        all_tags = [dict(row) for row in cursor.fetchall()]
-        
-        # Primero intentar búsqueda exacta
-        cursor.execute("""
-            SELECT id, name, description 
-            FROM tags 
-            WHERE LOWER(name) = LOWER(?)
-            ORDER BY name
-        """, (name,))
+        with write_connection() as conn:
+            cursor = conn.cursor()
         
-        exact_matches = [dict(row) for row in cursor.fetchall()]
-        
-        # Si no se encontraron resultados, intentar con búsqueda más flexible
-        if not exact_matches:
+            # Verificar si la relación existe
             cursor.execute("""
-                SELECT id, name, description 
-                FROM tags 
-                WHERE LOWER(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(
-                    name, 'á', 'a'), 'é', 'e'), 'í', 'i'), 'ó', 'o'), 'ú', 'u')) 
-                LIKE LOWER(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(
-                    ?, 'á', 'a'), 'é', 'e'), 'í', 'i'), 'ó', 'o'), 'ú', 'u'))
-                ORDER BY name
-            """, (f"%{name}%",))
-            
-            flexible_matches = [dict(row) for row in cursor.fetchall()]
-        else:
-            flexible_matches = []
+                SELECT 1 FROM url_tags 
+                WHERE url_id = ? AND tag_id = ?
+            """, (url_id, tag_id))
         
-        conn.close()
+            if not cursor.fetchone():
+                return jsonify({"status": "error", "message": "La etiqueta no está asignada a esta URL"}), 404
         
-        # Combinar resultados (primero coincidencias exactas, luego flexibles)
-        tags = exact_matches + flexible_matches
+            # Eliminar la relación
+            cursor.execute("""
+                DELETE FROM url_tags 
+                WHERE url_id = ? AND tag_id = ?
+            """, (url_id, tag_id))
         
-        # Depuración adicional
-        debug_info = {
-            "received_name": name_encoded,
-            "decoded_name": name,
-            "all_tags_in_db": all_tags,
-            "exact_matches_count": len(exact_matches),
-            "flexible_matches_count": len(flexible_matches),
-            "exact_query": f"SELECT id, name FROM tags WHERE LOWER(name) = LOWER('{name}')",
-            "flexible_query": f"SELECT id, name FROM tags WHERE LOWER(REPLACE(...)) LIKE LOWER('%{name}%')"
-        }
+            # Obtener el nombre de la etiqueta para la respuesta
+            cursor.execute("SELECT name FROM tags WHERE id = ?", (tag_id,))
+            tag_name = cursor.fetchone()[0]
         
-        return jsonify({
-            "status": "success",
-            "tags": tags,
-            "debug": debug_info
-        }), 200
+            return jsonify({
+                "status": "success", 
+                "message": "Etiqueta eliminada correctamente",
+                "tag": {"id": tag_id, "name": tag_name}
+            }), 200
         
     except Exception as e:
-        print(f"Error al buscar etiquetas: {e}")
+        print(f"Error al eliminar etiqueta: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/urls/<int:url_id>/tags/<int:tag_id>', methods=['DELETE'])
-def remove_tag_from_url(url_id, tag_id):
-    """Elimina una etiqueta de una URL"""
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si la relación existe
-        cursor.execute("""
-            SELECT 1 FROM url_tags 
-            WHERE url_id = ? AND tag_id = ?
-        """, (url_id, tag_id))
-        
-        if not cursor.fetchone():
-            return jsonify({"status": "error", "message": "La etiqueta no está asignada a esta URL"}), 404
-        
-        # Eliminar la relación
-        cursor.execute("""
-            DELETE FROM url_tags 
-            WHERE url_id = ? AND tag_id = ?
-        """, (url_id, tag_id))
-        
-        # Obtener el nombre de la etiqueta para la respuesta
-        cursor.execute("SELECT name FROM tags WHERE id = ?", (tag_id,))
-        tag_name = cursor.fetchone()[0]
-        
-        conn.commit()
-        conn.close()
-        
+BATCH_OPERATIONS = {'mark_viewed', 'mark_unseen', 'delete', 'add_tag', 'remove_tag'}
+
+@app.route('/api/batch', methods=['POST'])
+def batch_operations():
+    """Aplica una lista de operaciones sobre el historial en una sola transacción
+
+    Recibe `{"operations": [{"op": ..., "url_id": ..., "tag_id": ...}, ...]}`
+    con `op` uno de mark_viewed, mark_unseen, delete, add_tag o remove_tag
+    (tag_id solo para las dos últimas). Las comprobaciones de existencia se
+    hacen con una consulta por tabla para todo el lote y las operaciones que
+    no se pueden aplicar se informan sin abortar las demás.
+
+    Devuelve un resultado por operación, en el mismo orden.
+    """
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"status": "error", "message": "Se requiere una lista de operaciones"}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
         return jsonify({
-            "status": "success", 
-            "message": "Etiqueta eliminada correctamente",
-            "tag": {"id": tag_id, "name": tag_name}
-        }), 200
-        
+            "status": "error",
+            "message": f"Como máximo se admiten {BATCH_MAX_OPERATIONS} operaciones por petición"
+        }), 400
+
+    results = [None] * len(operations)
+    parsed = []
+    for index, operation in enumerate(operations):
+        try:
+            op = operation['op']
+            if not isinstance(op, str):
+                raise TypeError(op)
+            url_id = int(operation['url_id'])
+            tag_id = int(operation['tag_id']) if op in ('add_tag', 'remove_tag') else None
+        except (TypeError, KeyError, ValueError):
+            results[index] = {"status": "error", "message": "Operación mal formada"}
+            continue
+        if op not in BATCH_OPERATIONS:
+            results[index] = {"status": "error", "message": f"Operación desconocida: {op}"}
+            continue
+        parsed.append((index, op, url_id, tag_id))
+
+    try:
+        with write_connection() as conn:
+            cursor = conn.cursor()
+
+            url_ids = sorted({url_id for _, _, url_id, _ in parsed})
+            tag_ids = sorted({tag_id for _, _, _, tag_id in parsed if tag_id is not None})
+
+            existing_urls = set()
+            assigned = set()
+            for start in range(0, len(url_ids), SQL_IN_CHUNK_SIZE):
+                chunk = url_ids[start:start + SQL_IN_CHUNK_SIZE]
+                placeholders = ','.join(['?'] * len(chunk))
+                cursor.execute(f"SELECT id FROM streaming_history WHERE id IN ({placeholders})", chunk)
+                existing_urls.update(row[0] for row in cursor.fetchall())
+                cursor.execute(f"SELECT url_id, tag_id FROM url_tags WHERE url_id IN ({placeholders})", chunk)
+                assigned.update((row[0], row[1]) for row in cursor.fetchall())
+            tag_names = {}
+            for start in range(0, len(tag_ids), SQL_IN_CHUNK_SIZE):
+                chunk = tag_ids[start:start + SQL_IN_CHUNK_SIZE]
+                placeholders = ','.join(['?'] * len(chunk))
+                cursor.execute(f"SELECT id, name FROM tags WHERE id IN ({placeholders})", chunk)
+                tag_names.update((row[0], row[1]) for row in cursor.fetchall())
+
+            for index, op, url_id, tag_id in parsed:
+                if url_id not in existing_urls:
+                    results[index] = {"status": "error", "message": "URL no encontrada"}
+                    continue
+
+                if op == 'mark_viewed':
+                    cursor.execute("UPDATE streaming_history SET visto = COALESCE(visto, 0) + 1 WHERE id = ?",
+                                   (url_id,))
+                elif op == 'mark_unseen':
+                    cursor.execute("UPDATE streaming_history SET visto = 0 WHERE id = ?", (url_id,))
+                elif op == 'delete':
+                    cursor.execute("DELETE FROM url_tags WHERE url_id = ?", (url_id,))
+                    cursor.execute("DELETE FROM streaming_history WHERE id = ?", (url_id,))
+                    existing_urls.discard(url_id)
+                elif tag_id not in tag_names:
+                    results[index] = {"status": "error", "message": "Etiqueta no encontrada"}
+                    continue
+                elif op == 'add_tag':
+                    if (url_id, tag_id) in assigned:
+                        results[index] = {"status": "error", "message": "La etiqueta ya está asignada a esta URL"}
+                        continue
+                    cursor.execute("INSERT INTO url_tags (url_id, tag_id) VALUES (?, ?)", (url_id, tag_id))
+                    assigned.add((url_id, tag_id))
+                else:
+                    if (url_id, tag_id) not in assigned:
+                        results[index] = {"status": "error", "message": "La etiqueta no está asignada a esta URL"}
+                        continue
+                    cursor.execute("DELETE FROM url_tags WHERE url_id = ? AND tag_id = ?", (url_id, tag_id))
+                    assigned.discard((url_id, tag_id))
+
+                result = {"status": "success"}
+                if tag_id is not None:
+                    result["tag"] = {"id": tag_id, "name": tag_names[tag_id]}
+                results[index] = result
+
     except Exception as e:
-        print(f"Error al eliminar etiqueta: {e}")
+        print(f"Error al aplicar el lote de operaciones: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+    applied = sum(1 for result in results if result["status"] == "success")
+    return jsonify({"status": "success", "applied": applied, "results": results}), 200
+
+def serve_production(host: str, port: int, threads: int) -> None:
+    """Sirve la aplicación con un servidor WSGI multihilo
+
+    Se usa waitress si está instalado; si no, el servidor de Werkzeug en
+    modo multihilo y sin recargador. Para varios procesos puede usarse
+    cualquier servidor WSGI externo, por ejemplo `gunicorn -w 4 app:app`.
+    """
+    try:
+        from waitress import serve
+    except ImportError:
+        print("Aviso: waitress no está instalado (pip install waitress); "
+              "se usará el servidor multihilo de Werkzeug", file=sys.stderr)
+        app.run(host=host, port=port, debug=False, threaded=True, use_reloader=False)
+        return
+
+    # channel_request_lookahead permite detectar que un cliente de /api/events
+    # se ha ido sin esperar a escribir en el socket
+    serve(app, host=host, port=port, threads=threads, channel_request_lookahead=5)
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    parser = argparse.ArgumentParser(description='Interfaz web de alterclip')
+    parser.add_argument('--host', default=os.getenv('ALTERCLIP_WEB_HOST', '0.0.0.0'),
+                        help='Dirección en la que escuchar (por defecto: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=int(os.getenv('ALTERCLIP_WEB_PORT', '5000')),
+                        help='Puerto en el que escuchar (por defecto: 5000)')
+    parser.add_argument('--threads', type=int, default=READ_POOL_SIZE,
+                        help='Hilos de trabajo del servidor de producción')
+    parser.add_argument('--debug', action='store_true',
+                        help='Usa el servidor de desarrollo de Flask con recargador')
+    parser.add_argument('--profile', action='store_true',
+                        help='Registra las consultas SQL y guarda un perfil de cProfile al salir (ver ALTERCLIP_PROFILE)')
+    args = parser.parse_args()
+    profiling.enable('web', args.profile)
+
+    if args.debug:
+        app.run(debug=True, host=args.host, port=args.port)
+    else:
+        serve_production(args.host, args.port, args.threads)
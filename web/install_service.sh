@@ -18,7 +18,7 @@ echo "=== Instalando servicio AlterClip Web ==="
 # Instalar dependencias del sistema
 echo "Instalando dependencias del sistema..."
 apt-get update
-apt-get install -y python3 python3-pip python3-flask
+apt-get install -y python3 python3-pip python3-flask python3-waitress
 
 # Configurar el servicio systemd
 echo "Configurando el servicio systemd..."
@@ -33,8 +33,8 @@ After=network.target
 User=www-data
 Group=www-data
 WorkingDirectory=$APP_DIR
-# Usar el intérprete de Python del sistema
-ExecStart=/usr/bin/python3 app.py
+# Usar el intérprete de Python del sistema con el servidor WSGI de producción
+ExecStart=/usr/bin/python3 app.py --host 0.0.0.0 --port 5000 --threads 8
 Restart=always
 RestartSec=10
 
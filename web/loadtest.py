@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+#
+# Prueba de carga sencilla para la interfaz web de alterclip.
+#
+# Lanza peticiones concurrentes contra las rutas indicadas y muestra las
+# peticiones por segundo y las latencias de cada una. Solo usa la
+# biblioteca estándar, así que puede ejecutarse desde cualquier máquina:
+#
+#   python3 loadtest.py --url http://localhost:5000 --requests 500 --concurrency 8
+#
+import argparse
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+DEFAULT_PATHS = ['/', '/api/history']
+
+def fetch(url: str) -> Tuple[float, int]:
+    """Realiza una petición GET y devuelve (segundos, código de estado)"""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return time.perf_counter() - start, status
+
+def run_path(base_url: str, path: str, total: int, concurrency: int) -> dict:
+    """Ejecuta `total` peticiones contra una ruta y devuelve las estadísticas"""
+    url = base_url.rstrip('/') + path
+
+    # Petición de calentamiento para no medir la apertura de conexiones
+    fetch(url)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: fetch(url), range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(r[0] for r in results)
+    errors = sum(1 for _, status in results if status != 200)
+    return {
+        'path': path,
+        'requests': total,
+        'errors': errors,
+        'rps': total / elapsed if elapsed else 0.0,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Prueba de carga de la interfaz web de alterclip')
+    parser.add_argument('--url', default='http://localhost:5000', help='URL base del servidor')
+    parser.add_argument('--requests', type=int, default=200, help='Peticiones por ruta')
+    parser.add_argument('--concurrency', type=int, default=8, help='Peticiones simultáneas')
+    parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS, help='Rutas a probar')
+    args = parser.parse_args()
+
+    print(f"{'Ruta':<30} {'Peticiones':>10} {'Errores':>8} {'Pet/s':>10} {'p50 ms':>9} {'p95 ms':>9}")
+    print('─' * 80)
+    failed = False
+    for path in args.paths:
+        stats = run_path(args.url, path, args.requests, args.concurrency)
+        failed = failed or stats['errors'] > 0
+        print(f"{stats['path']:<30} {stats['requests']:>10} {stats['errors']:>8} "
+              f"{stats['rps']:>10.1f} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f}")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -223,42 +223,42 @@ document.addEventListener('DOMContentLoaded', function() {
         return null;
     }
 
-    // Manejar el botón de eliminar
-    document.querySelectorAll('.delete-btn').forEach(button => {
-        button.addEventListener('click', function(e) {
-            e.stopPropagation();
-            
-            const urlId = this.getAttribute('data-id');
-            if (!urlId) return;
-            
-            if (confirm('¿Estás seguro de que quieres eliminar este elemento del historial?')) {
-                fetch(`/api/delete/${urlId}`, {
-                    method: 'DELETE',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                })
-                .then(response => response.json())
-                .then(data => {
-                    if (data.status === 'success') {
-                        // Eliminar la fila de la tabla
-                        const row = this.closest('tr');
-                        if (row) {
-                            row.style.transition = 'opacity 0.5s';
-                            row.style.opacity = '0';
-                            setTimeout(() => row.remove(), 500);
-                        }
-                        showToast('Elemento eliminado correctamente', 'success');
-                    } else {
-                        showToast('Error al eliminar el elemento', 'danger');
+    // Manejar el botón de eliminar (delegado para incluir las filas cargadas con scroll)
+    document.addEventListener('click', function(e) {
+        const button = e.target.closest('.delete-btn');
+        if (!button) return;
+        e.stopPropagation();
+        
+        const urlId = button.getAttribute('data-id');
+        if (!urlId) return;
+        
+        if (confirm('¿Estás seguro de que quieres eliminar este elemento del historial?')) {
+            fetch(`/api/delete/${urlId}`, {
+                method: 'DELETE',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+            })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'success') {
+                    // Eliminar la fila de la tabla
+                    const row = button.closest('tr');
+                    if (row) {
+                        row.style.transition = 'opacity 0.5s';
+                        row.style.opacity = '0';
+                        setTimeout(() => row.remove(), 500);
                     }
-                })
-                .catch(error => {
-                    console.error('Error:', error);
+                    showToast('Elemento eliminado correctamente', 'success');
+                } else {
                     showToast('Error al eliminar el elemento', 'danger');
-                });
-            }
-        });
+                }
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                showToast('Error al eliminar el elemento', 'danger');
+            });
+        }
     });
 
     // Manejar el botón de copiar al portapapeles usando método compatible con HTTP
@@ -321,10 +321,289 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
-    // Cargar dinámicamente el contenido de los tags
+    // Cargar dinámicamente el contenido de los tags y sus recuentos
     loadTagHierarchy();
+    loadFacets();
+    
+    // Activar el scroll infinito del historial, las actualizaciones en vivo
+    // y la selección múltiple
+    initLiveHistory(initInfiniteHistory());
+    initBulkSelection();
 });
 
+// Entradas seleccionadas para las acciones en lote (se conservan al redibujar filas)
+const selectedHistoryIds = new Set();
+
+// Número de filas que se piden en cada bloque y bloques que se mantienen en el DOM
+const HISTORY_CHUNK_SIZE = 50;
+const HISTORY_MAX_CHUNKS = 6;
+
+// Escapa texto para insertarlo en HTML
+function escapeHtml(text) {
+    return String(text ?? '')
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
+// Recorta un texto como el filtro truncate de Jinja
+function truncateText(text, length) {
+    text = String(text ?? '');
+    return text.length > length ? text.slice(0, length - 3) + '...' : text;
+}
+
+// Construye la fila de la tabla del historial (mismo marcado que index.html)
+function renderHistoryRow(item) {
+    const isNew = item.visto == 0;
+    const tagsHtml = item.tags && item.tags.length > 0
+        ? `<div class="d-flex flex-wrap gap-1">${item.tags.map(tag => `
+            <div class="tag-badge d-flex align-items-center bg-secondary rounded-pill" style="position: relative; padding-right: 1.5rem;">
+                <a href="/?tag=${encodeURIComponent(tag.name)}" class="text-decoration-none text-white px-2 py-1">${escapeHtml(tag.name)}</a>
+                <button class="btn btn-sm p-0 remove-tag" data-url-id="${item.id}" data-tag-id="${tag.id}"
+                        data-tag-name="${encodeURIComponent(tag.name)}"
+                        style="position: absolute; right: 0; top: 0; bottom: 0; width: 1.5rem; background: none; border: none; color: white; cursor: pointer; display: flex; align-items: center; justify-content: center;">
+                    <i class="bi bi-x" style="font-size: 0.9rem; line-height: 1;"></i>
+                </button>
+            </div>`).join('')}</div>`
+        : '<span class="text-muted">Sin etiquetas</span>';
+    
+    const row = document.createElement('tr');
+    row.dataset.id = item.id;
+    if (isNew) row.className = 'table-warning';
+    row.innerHTML = `
+        <td><input type="checkbox" class="form-check-input row-select" value="${item.id}"
+                   ${selectedHistoryIds.has(String(item.id)) ? 'checked' : ''}></td>
+        <td>${item.id}</td>
+        <td>
+            <a href="${escapeHtml(item.url)}" class="text-decoration-none" target="_blank"
+               data-url-id="${item.id}" onclick="event.preventDefault(); markAndOpen(this, event);">
+                ${escapeHtml(truncateText(item.title, 60))}
+            </a>
+            ${isNew ? '<span class="badge bg-warning text-dark ms-2">Nuevo</span>' : ''}
+        </td>
+        <td>${item.platform
+            ? `<span class="badge bg-info text-dark">${escapeHtml(item.platform)}</span>`
+            : '<span class="text-muted">-</span>'}</td>
+        <td>${tagsHtml}</td>
+        <td>${item.timestamp ? escapeHtml(item.timestamp.split('T')[0]) : '<span class="text-muted">-</span>'}</td>
+        <td>
+            <div class="btn-group btn-group-sm" role="group">
+                <a href="${escapeHtml(item.url)}" class="btn btn-outline-primary" title="Abrir enlace" target="_blank"
+                   onclick="markAsViewedAndOpen('${item.id}', this.href, event);">
+                    <i class="bi bi-box-arrow-up-right"></i>
+                </a>
+                <button class="btn btn-outline-secondary copy-btn" data-url="${escapeHtml(item.url)}" title="Copiar enlace">
+                    <i class="bi bi-clipboard"></i>
+                </button>
+                <button class="btn btn-outline-success add-tag-btn" data-id="${item.id}" title="Añadir etiqueta">
+                    <i class="bi bi-tag"></i>
+                </button>
+                <button class="btn btn-outline-warning mark-unseen-btn" data-id="${item.id}" title="Marcar como no visto">
+                    <i class="bi bi-eye-slash"></i>
+                </button>
+                <button class="btn btn-outline-danger delete-btn" data-id="${item.id}" title="Eliminar del historial">
+                    <i class="bi bi-trash"></i>
+                </button>
+            </div>
+        </td>
+    `;
+    return row;
+}
+
+// Altura que ocupan en pantalla un conjunto de filas consecutivas
+function rowsHeight(rows) {
+    const visible = rows.filter(row => row.isConnected);
+    if (visible.length === 0) return 0;
+    return visible[visible.length - 1].getBoundingClientRect().bottom - visible[0].getBoundingClientRect().top;
+}
+
+// Scroll infinito del historial
+//
+// Las filas se piden a /api/history en bloques usando el cursor de
+// continuación. Para que el DOM no crezca sin límite solo se mantienen
+// HISTORY_MAX_CHUNKS bloques: al bajar se retiran los de arriba (guardando
+// su cursor para volver a pedirlos si se vuelve a subir) y al subir se
+// retiran los de abajo.
+function initInfiniteHistory() {
+    const body = document.getElementById('historyBody');
+    const topSentinel = document.getElementById('historyTop');
+    const bottomSentinel = document.getElementById('historyBottom');
+    if (!body || !topSentinel || !bottomSentinel || !('IntersectionObserver' in window)) return null;
+    
+    const filters = {
+        search: body.dataset.search || '',
+        tag: body.dataset.tag || '',
+        platform: body.dataset.platform || ''
+    };
+    const state = {
+        body,
+        filters,
+        // Bloques presentes en el DOM: cursor con el que se pidieron y sus filas
+        chunks: [{ cursor: null, rows: Array.from(body.rows) }],
+        // Cursores de los bloques retirados por arriba (el último es el más cercano)
+        trimmedAbove: [],
+        nextCursor: body.dataset.nextCursor || null,
+        loading: false
+    };
+    
+    function updateBottomStatus() {
+        bottomSentinel.textContent = state.nextCursor ? '' : 'No hay más entradas en el historial';
+    }
+    
+    async function fetchChunk(cursor) {
+        const params = new URLSearchParams();
+        for (const [key, value] of Object.entries(filters)) {
+            if (value) params.set(key, value);
+        }
+        params.set('limit', HISTORY_CHUNK_SIZE);
+        if (cursor) params.set('cursor', cursor);
+        
+        const response = await fetch(`/api/history?${params.toString()}`);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.json();
+    }
+    
+    function buildRows(items) {
+        return items
+            .filter(item => !body.querySelector(`tr[data-id="${item.id}"]`))
+            .map(renderHistoryRow);
+    }
+    
+    async function loadBelow() {
+        if (state.loading || !state.nextCursor) return;
+        state.loading = true;
+        bottomSentinel.innerHTML = '<span class="spinner-border spinner-border-sm" role="status"></span> Cargando...';
+        try {
+            const cursor = state.nextCursor;
+            const data = await fetchChunk(cursor);
+            const rows = buildRows(data.items);
+            rows.forEach(row => body.appendChild(row));
+            state.chunks.push({ cursor, rows });
+            state.nextCursor = data.next_cursor;
+            
+            if (state.chunks.length > HISTORY_MAX_CHUNKS) {
+                const removed = state.chunks.shift();
+                const height = rowsHeight(removed.rows);
+                removed.rows.forEach(row => row.remove());
+                state.trimmedAbove.push(removed.cursor);
+                window.scrollBy(0, -height);
+            }
+        } catch (error) {
+            console.error('Error al cargar más historial:', error);
+            showToast('Error al cargar más entradas del historial', 'danger');
+        } finally {
+            state.loading = false;
+            updateBottomStatus();
+        }
+    }
+    
+    async function loadAbove() {
+        if (state.loading || state.trimmedAbove.length === 0) return;
+        state.loading = true;
+        try {
+            const cursor = state.trimmedAbove.pop();
+            const data = await fetchChunk(cursor);
+            const rows = buildRows(data.items);
+            const firstRow = body.firstElementChild;
+            rows.forEach(row => body.insertBefore(row, firstRow));
+            state.chunks.unshift({ cursor, rows });
+            window.scrollBy(0, rowsHeight(rows));
+            
+            if (state.chunks.length > HISTORY_MAX_CHUNKS) {
+                const removed = state.chunks.pop();
+                removed.rows.forEach(row => row.remove());
+                state.nextCursor = removed.cursor;
+            }
+        } catch (error) {
+            console.error('Error al recuperar entradas anteriores:', error);
+        } finally {
+            state.loading = false;
+            updateBottomStatus();
+        }
+    }
+    
+    const observer = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (!entry.isIntersecting) return;
+            if (entry.target === bottomSentinel) loadBelow();
+            else loadAbove();
+        });
+    }, { rootMargin: '600px 0px' });
+    
+    observer.observe(topSentinel);
+    observer.observe(bottomSentinel);
+    updateBottomStatus();
+    return state;
+}
+
+// Indica si una entrada nueva debe mostrarse con los filtros de la página
+function matchesHistoryFilters(item, filters) {
+    if (filters.platform && (item.platform || '').toLowerCase() !== filters.platform.toLowerCase()) {
+        return false;
+    }
+    if (filters.search) {
+        const term = filters.search.toLowerCase();
+        if (!(item.title || '').toLowerCase().includes(term) && !(item.url || '').toLowerCase().includes(term)) {
+            return false;
+        }
+    }
+    if (filters.tag && !(item.tags || []).some(tag => tag.name === filters.tag)) {
+        return false;
+    }
+    return true;
+}
+
+// Actualizaciones en vivo del historial
+//
+// Escucha /api/events y aplica cada cambio directamente sobre la tabla: las
+// entradas nuevas se añaden arriba (si se está viendo el principio del
+// historial), las modificadas se sustituyen y las eliminadas se retiran.
+function initLiveHistory(state) {
+    if (!state || !('EventSource' in window)) return;
+    
+    const source = new EventSource('/api/events');
+    source.addEventListener('history', function(e) {
+        const change = JSON.parse(e.data);
+        const id = change.op === 'delete' ? change.id : change.item.id;
+        const existing = state.body.querySelector(`tr[data-id="${id}"]`);
+        
+        if (change.op === 'delete') {
+            if (existing) existing.remove();
+            if (selectedHistoryIds.delete(String(id))) updateBulkToolbar();
+            return;
+        }
+        
+        if (existing) {
+            const row = renderHistoryRow(change.item);
+            existing.replaceWith(row);
+            state.chunks.forEach(chunk => {
+                const index = chunk.rows.indexOf(existing);
+                if (index !== -1) chunk.rows[index] = row;
+            });
+            return;
+        }
+        
+        // Solo se insertan entradas nuevas si se está viendo el principio del historial
+        if (change.op !== 'insert' || state.trimmedAbove.length > 0 ||
+            !matchesHistoryFilters(change.item, state.filters)) {
+            return;
+        }
+        const row = renderHistoryRow(change.item);
+        row.classList.add('history-live-new');
+        state.body.insertBefore(row, state.body.firstElementChild);
+        state.chunks[0].rows.unshift(row);
+    });
+    
+    source.onerror = function() {
+        // EventSource reintenta solo; si el servidor rechaza la conexión, se cierra
+        if (source.readyState === EventSource.CLOSED) {
+            console.warn('Actualizaciones en vivo desactivadas');
+        }
+    };
+}
+
 // Función para cargar la jerarquía de tags
 function loadTagHierarchy() {
     const tagTree = document.getElementById('tagTree');
@@ -334,6 +613,7 @@ function loadTagHierarchy() {
         .then(response => response.json())
         .then(tags => {
             tagTree.innerHTML = buildTagTree(tags);
+            applyFacetCounts();
             
             // Agregar manejadores de eventos a los enlaces de tags
             document.querySelectorAll('.tag-link').forEach(link => {
@@ -355,6 +635,75 @@ function loadTagHierarchy() {
         });
 }
 
+// Filtros de la página actual (los indica la tabla del historial, si la hay)
+function currentHistoryFilters() {
+    const body = document.getElementById('historyBody');
+    const params = new URLSearchParams(window.location.search);
+    return {
+        search: body ? body.dataset.search : (params.get('search') || ''),
+        tag: body ? body.dataset.tag : (params.get('tag') || ''),
+        platform: body ? body.dataset.platform : (params.get('platform') || '')
+    };
+}
+
+// Recuentos por facetas del filtro actual (ver /api/facets)
+let currentFacets = null;
+
+function facetsUrl(filters) {
+    const params = new URLSearchParams();
+    for (const [key, value] of Object.entries(filters)) {
+        if (value) params.set(key, value);
+    }
+    return `/api/facets?${params.toString()}`;
+}
+
+async function loadFacets() {
+    const filters = currentHistoryFilters();
+    try {
+        const response = await fetch(facetsUrl(filters));
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        currentFacets = await response.json();
+        applyFacetCounts();
+        
+        // Las plataformas se cuentan sin su propio filtro para poder cambiar de una a otra
+        const platformSelect = document.getElementById('platformFilter');
+        if (platformSelect) {
+            let platforms = currentFacets.platforms;
+            if (filters.platform) {
+                const unfiltered = await fetch(facetsUrl({ ...filters, platform: '' }));
+                if (unfiltered.ok) platforms = (await unfiltered.json()).platforms;
+            }
+            platformSelect.querySelectorAll('option[value]').forEach(option => {
+                if (!option.value) return;
+                if (!option.dataset.label) option.dataset.label = option.textContent.trim();
+                option.textContent = `${option.dataset.label} (${platforms[option.value] || 0})`;
+            });
+        }
+    } catch (error) {
+        console.error('Error al cargar los recuentos:', error);
+    }
+}
+
+// Pinta los recuentos en el árbol de tags y en el resumen del historial
+function applyFacetCounts() {
+    if (!currentFacets) return;
+    
+    document.querySelectorAll('.tag-count[data-tag-id]').forEach(badge => {
+        const count = currentFacets.tags[badge.dataset.tagId];
+        const direct = count ? count.direct : 0;
+        const total = count ? count.total : 0;
+        badge.textContent = total === direct ? `${direct}` : `${direct} · ${total}`;
+        badge.title = total === direct
+            ? `${direct} URLs`
+            : `${direct} URLs con esta etiqueta, ${total} incluyendo subetiquetas`;
+    });
+    
+    const summary = document.getElementById('facetSummary');
+    if (summary) {
+        summary.textContent = `${currentFacets.total} entradas · ${currentFacets.visto.unseen} sin ver`;
+    }
+}
+
 // Función para construir el árbol de tags
 function buildTagTree(tags, level = 0) {
     if (!tags || tags.length === 0) return '';
@@ -362,7 +711,7 @@ function buildTagTree(tags, level = 0) {
     let html = '<ul class="list-unstyled">';
     
     tags.forEach(tag => {
-        const isActive = window.location.search.includes(`tag=${encodeURIComponent(tag.name)}`);
+        const isActive = currentHistoryFilters().tag === tag.name;
         const paddingLeft = 15 + (tag.level * 15);
         const hasChildren = tag.children && tag.children.length > 0;
         
@@ -383,6 +732,7 @@ function buildTagTree(tags, level = 0) {
                         <i class="bi ${hasChildren ? 'bi-folder' : 'bi-tag'}"></i> 
                         ${tag.name}
                     </a>
+                    <span class="badge rounded-pill bg-light text-dark ms-auto tag-count" data-tag-id="${tag.id}"></span>
                 </div>
                 
                 ${hasChildren ? `
@@ -523,3 +873,118 @@ document.addEventListener('submit', function(e) {
         }
     });
 });
+
+// Envía varias operaciones a /api/batch y devuelve la respuesta
+//
+// Cada operación es {op, url_id, tag_id?}; se aplican todas en una sola
+// transacción y la respuesta trae un resultado por operación.
+async function runHistoryBatch(operations) {
+    const response = await fetch('/api/batch', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ operations })
+    });
+    const data = await response.json();
+    if (data.status !== 'success') {
+        throw new Error(data.message || 'Error al aplicar las operaciones');
+    }
+    return data;
+}
+
+// Muestra u oculta la barra de acciones en lote según la selección
+function updateBulkToolbar() {
+    const toolbar = document.getElementById('bulkActions');
+    if (!toolbar) return;
+    toolbar.classList.toggle('d-none', selectedHistoryIds.size === 0);
+    document.getElementById('bulkCount').textContent = selectedHistoryIds.size;
+    
+    const selectAll = document.getElementById('selectAllRows');
+    const boxes = document.querySelectorAll('#historyBody .row-select');
+    const checked = Array.from(boxes).filter(box => box.checked).length;
+    selectAll.checked = boxes.length > 0 && checked === boxes.length;
+    selectAll.indeterminate = checked > 0 && checked < boxes.length;
+}
+
+// Selección múltiple de entradas y acciones en lote
+function initBulkSelection() {
+    const body = document.getElementById('historyBody');
+    const toolbar = document.getElementById('bulkActions');
+    if (!body || !toolbar) return;
+    
+    body.addEventListener('change', function(e) {
+        if (!e.target.classList.contains('row-select')) return;
+        if (e.target.checked) {
+            selectedHistoryIds.add(e.target.value);
+        } else {
+            selectedHistoryIds.delete(e.target.value);
+        }
+        updateBulkToolbar();
+    });
+    
+    document.getElementById('selectAllRows').addEventListener('change', function() {
+        body.querySelectorAll('.row-select').forEach(box => {
+            box.checked = this.checked;
+            if (this.checked) {
+                selectedHistoryIds.add(box.value);
+            } else {
+                selectedHistoryIds.delete(box.value);
+            }
+        });
+        updateBulkToolbar();
+    });
+    
+    function clearSelection() {
+        selectedHistoryIds.clear();
+        body.querySelectorAll('.row-select:checked').forEach(box => { box.checked = false; });
+        updateBulkToolbar();
+    }
+    document.getElementById('bulkClear').addEventListener('click', clearSelection);
+    
+    toolbar.addEventListener('click', async function(e) {
+        const button = e.target.closest('[data-bulk-op]');
+        if (!button) return;
+        const op = button.dataset.bulkOp;
+        const ids = Array.from(selectedHistoryIds);
+        if (ids.length === 0) return;
+        
+        if (op === 'add_tag') {
+            // Se reutiliza el modal de etiquetas con la lista de ids
+            document.getElementById('currentUrlId').value = ids.join(',');
+            document.getElementById('tagSelect').value = '';
+            document.getElementById('tagSearch').value = '';
+            bootstrap.Modal.getOrCreateInstance(document.getElementById('addTagModal')).show();
+            return;
+        }
+        if (op === 'delete' &&
+            !confirm(`¿Estás seguro de que quieres eliminar ${ids.length} elementos del historial?`)) {
+            return;
+        }
+        
+        try {
+            const data = await runHistoryBatch(ids.map(id => ({ op, url_id: id })));
+            data.results.forEach((result, index) => {
+                if (result.status !== 'success') return;
+                const row = body.querySelector(`tr[data-id="${ids[index]}"]`);
+                if (!row) return;
+                if (op === 'delete') {
+                    row.remove();
+                } else if (op === 'mark_viewed') {
+                    row.classList.remove('table-warning');
+                    row.querySelectorAll('.badge.bg-warning').forEach(badge => badge.remove());
+                } else if (op === 'mark_unseen') {
+                    row.classList.add('table-warning');
+                }
+            });
+            const failed = data.results.length - data.applied;
+            showToast(failed > 0
+                ? `${data.applied} operaciones aplicadas, ${failed} con errores`
+                : `${data.applied} operaciones aplicadas`, failed > 0 ? 'warning' : 'success');
+            clearSelection();
+        } catch (error) {
+            console.error('Error en la operación en lote:', error);
+            showToast(error.message || 'Error al aplicar las operaciones', 'danger');
+        }
+    });
+}